@@ -1,22 +1,40 @@
 """Analysis functions for testing FOOOF on simulated data."""
 
-from collections import Counter
+from collections import Counter, namedtuple
 
 import numpy as np
-
-from fooof.analysis.periodic import get_band_peak, get_band_peak_fg
+from scipy.signal import fftconvolve
 
 from settings import F_RANGE
+from utils import sim_params_to_columns, fg_to_columns
+from profiling import profiled
 
 ###################################################################################################
 ###################################################################################################
 
 def cohens_d(d1, d2):
-    """Calculate cohens-D: (u1 - u2) / SDpooled."""
+    """Calculate cohens-D: (u1 - u2) / SDpooled.
+
+    Inputs can be arrays of data, or running `Moments` of each distribution.
+    Arrays with NaN values give NaN, whereas `Moments` are of the non-NaN values.
+    """
+
+    mean1, var1 = _get_mean_var(d1)
+    mean2, var2 = _get_mean_var(d2)
+
+    return (mean1 - mean2) / (np.sqrt((var1 + var2) / 2))
+
+
+def _get_mean_var(data):
+    """Get the mean & (population) variance of an array of data, or from running moments."""
+
+    if isinstance(data, Moments):
+        return data.mean, get_variance(data)
 
-    return (np.mean(d1) - np.mean(d2)) / (np.sqrt((np.std(d1) ** 2 + np.std(d2) ** 2) / 2))
+    return np.mean(data), np.std(data) ** 2
 
 
+@profiled()
 def calc_errors(truths, models, approach='abs'):
     """Calculate the error of model reconstructions with respect to ground truth.
 
@@ -33,69 +51,532 @@ def calc_errors(truths, models, approach='abs'):
     return errors
 
 
-def get_ground_truth(sim_params):
-    """Extract settings used to generated data (ground truth values)."""
+@profiled()
+def get_ground_truth(sim_params, squeeze_peaks=True):
+    """Extract settings used to generated data (ground truth values).
+
+    Parameters
+    ----------
+    sim_params : list of list of SimParams or dict of array
+        Simulation parameters, per condition and spectrum, or as columnar arrays.
+    squeeze_peaks : bool, optional, default: True
+        Whether to drop the peak axis of the peak parameters, if there is at most one peak.
+
+    Returns
+    -------
+    pe_truths : array
+        Peak parameters, with shape [n_conds, n_psds, max_n_peaks, n_peak_params].
+        Missing peaks are padded with NaN. If `squeeze_peaks` and `max_n_peaks` is 1,
+        the shape is [n_conds, n_psds, n_peak_params].
+    ap_truths : array
+        Aperiodic parameters, with shape [n_conds, n_psds, n_ap_params].
+    """
+
+    columns = sim_params if isinstance(sim_params, dict) else sim_params_to_columns(sim_params)
+
+    peaks, offsets = columns['peak_params'], columns['peak_offsets']
+    lead_shape = columns['nlvs'].shape
+
+    # Place each peak into its position in a padded array, across all spectra at once
+    counts = np.diff(offsets)
+    max_n_peaks = int(counts.max()) if len(counts) else 0
+    spec_inds = np.repeat(np.arange(len(counts)), counts)
+    peak_inds = np.arange(len(peaks)) - np.repeat(offsets[:-1], counts)
 
-    pe_truths = []
-    ap_truths = []
+    pe_truths = np.full([len(counts), max_n_peaks, peaks.shape[1]], np.nan)
+    pe_truths[spec_inds, peak_inds] = peaks
+    pe_truths = pe_truths.reshape(*lead_shape, max_n_peaks, peaks.shape[1])
 
-    for ind, params in enumerate(sim_params):
-        pe_truths.append([psd_params.periodic_params for psd_params in params])
-        ap_truths.append([psd_params.aperiodic_params for psd_params in params])
+    if squeeze_peaks and max_n_peaks == 1:
+        pe_truths = pe_truths[..., 0, :]
 
-    pe_truths = np.squeeze(np.array(pe_truths))
-    ap_truths = np.array(ap_truths)
+    ap_truths = np.asarray(columns['aperiodic_params'], dtype=float)
 
     return pe_truths, ap_truths
 
 
+@profiled()
 def get_fit_data(fgs, f_range=F_RANGE):
-    """Extract fit results fit to simulated data."""
+    """Extract fit results fit to simulated data.
+
+    Parameters
+    ----------
+    fgs : list of FOOOFGroup or list of dict of array
+        Model fit results, per condition, as FOOOFGroups or columnar results from `fg_to_columns`.
+    f_range : list of [float, float], optional
+        Frequency range to extract the highest power peak from, per model.
+
+    Returns
+    -------
+    peak_fits : 3d array
+        Gaussian parameters of the band peak, with shape [n_conds, n_fits, 3].
+        Models without a peak in the band are NaN.
+    ap_fits : 3d array
+        Aperiodic parameters, with shape [n_conds, n_fits, n_ap_params].
+    err_fits, r2_fits : 2d array
+        Error and R^2 of the model fits, with shape [n_conds, n_fits].
+    n_peaks : 2d array of int
+        Number of fit peaks, with shape [n_conds, n_fits].
+    """
+
+    results = [res if isinstance(res, dict) else fg_to_columns(res) for res in fgs]
 
-    # Extract data of interest from FOOOF fits
-    peak_fits = []; ap_fits = []; err_fits = []; r2_fits = []; n_peaks = []
+    n_conds = len(results)
+    n_fits, n_ap = results[0]['aperiodic_params'].shape
 
-    for fg in fgs:
-        peak_fits.append(get_band_peak_fg(fg, f_range, attribute='gaussian_params'))
-        ap_fits.append(fg.get_params('aperiodic_params'))
-        err_fits.append(fg.get_params('error'))
-        r2_fits.append(fg.get_params('r_squared'))
-        n_peaks.append(fg.n_peaks_)
+    ap_fits = np.empty([n_conds, n_fits, n_ap])
+    err_fits = np.empty([n_conds, n_fits])
+    r2_fits = np.empty([n_conds, n_fits])
+    n_peaks = np.empty([n_conds, n_fits], dtype=int)
+    peak_offsets = np.zeros(n_conds * n_fits + 1, dtype=np.int64)
 
-    peak_fits = np.array(peak_fits)
-    ap_fits = np.array(ap_fits)
-    err_fits = np.array(err_fits)
-    r2_fits = np.array(r2_fits)
-    n_peaks = np.array(n_peaks)
+    for ind, res in enumerate(results):
+        ap_fits[ind] = res['aperiodic_params']
+        err_fits[ind] = res['error']
+        r2_fits[ind] = res['r_squared']
+        n_peaks[ind] = res['n_peaks']
+    np.cumsum(n_peaks, out=peak_offsets[1:])
+
+    # Select band peaks across all models in all conditions at once
+    gauss = np.concatenate([res['gaussian_params'] for res in results])
+    peak_fits = get_band_peaks(gauss, peak_offsets, f_range).reshape(n_conds, n_fits, 3)
 
     return peak_fits, ap_fits, err_fits, r2_fits, n_peaks
 
 
+@profiled()
+def get_band_peaks(peak_params, peak_offsets, band):
+    """Get the highest power peak within a band, for each model, from ragged peak arrays.
+
+    Parameters
+    ----------
+    peak_params : 2d array
+        Peak parameters, for all models, with shape [n_total_peaks, 3].
+    peak_offsets : 1d array
+        Offsets of each model's peaks, with shape [n_models + 1].
+    band : tuple of (float, float)
+        Frequency range for the band of interest, inclusive.
+
+    Returns
+    -------
+    band_peaks : 2d array
+        Peak data, as [CF, PW, BW], with shape [n_models, 3], filled with NaN if no peak was found.
+
+    Notes
+    -----
+    This matches `get_band_peak_fg`, with `select_highest`, but selects across all models at once.
+    """
+
+    n_models = len(peak_offsets) - 1
+    model_inds = np.repeat(np.arange(n_models), np.diff(peak_offsets))
+
+    # Order peaks within the band by model, then by descending power, and take the first of each
+    in_band = np.flatnonzero((peak_params[:, 0] >= band[0]) & (peak_params[:, 0] <= band[1]))
+    in_band = in_band[np.lexsort((-peak_params[in_band, 1], model_inds[in_band]))]
+    models, firsts = np.unique(model_inds[in_band], return_index=True)
+
+    band_peaks = np.full([n_models, 3], np.nan)
+    band_peaks[models] = peak_params[in_band[firsts], 0:3]
+
+    return band_peaks
+
+
 def count_peak_conditions(n_fit_peaks, conditions):
     """Count the number of fit peaks, across simulated conditions."""
 
-    # Grab all flattened data for conditions
-    conds = np.array([[nn] * n_fit_peaks.shape[1] for nn in conditions]).flatten()
-
-    # Grab data for number of peaks fit
-    n_fit_peaks = n_fit_peaks.flatten()
+    # Count each combination of condition & number of peaks fit
+    cond_inds = np.repeat(np.arange(len(conditions)), n_fit_peaks.shape[1])
+    counts = count_peaks_2d(cond_inds, np.ravel(n_fit_peaks))
 
     # Collect together # simulated & # fit, for plotting
-    data = []
-    for aa, bb in zip(conds, n_fit_peaks):
-        data.append((aa, bb))
-    n_peak_counter = Counter(data)
+    n_peak_counter = Counter({(conditions[c_ind], n_fit) : count \
+        for (c_ind, n_fit), count in zip(np.argwhere(counts), counts[counts > 0])})
 
     return n_peak_counter
 
 
+@profiled()
 def harmonic_mapping(fg):
-    """Get all peaks from a FOOOFGroup and compute harmonic mapping on the CFs."""
+    """Get all peaks from a FOOOFGroup and compute harmonic mapping on the CFs.
+
+    Parameters
+    ----------
+    fg : FOOOFGroup or dict of array
+        Model fit results, as a FOOOFGroup or columnar results from `fg_to_columns`.
+
+    Returns
+    -------
+    ratios : 1d array
+        Ratio of each peak CF to the CF of the first peak of its model, for all peaks, in order.
+    peak_offsets : 1d array
+        Offsets of each model's peaks, with shape [n_models + 1], with ratios for model `ind`
+        in `ratios[peak_offsets[ind]:peak_offsets[ind+1]]`.
+    """
+
+    results = fg if isinstance(fg, dict) else fg_to_columns(fg)
+    peak_offsets = results['peak_offsets']
+
+    return normalize_first_peak(results['peak_params'][:, 0], peak_offsets), peak_offsets
+
+
+def normalize_first_peak(values, peak_offsets):
+    """Normalize peak values by the value of the first peak of each model, from ragged arrays.
+
+    Parameters
+    ----------
+    values : 1d array
+        Peak values, such as CFs, for all models, with shape [n_total_peaks].
+    peak_offsets : 1d array
+        Offsets of each model's peaks, with shape [n_models + 1].
+
+    Returns
+    -------
+    1d array
+        Normalized values, with shape [n_total_peaks].
+    """
+
+    counts = np.diff(peak_offsets)
+    has_peaks = counts > 0
+
+    return values / np.repeat(values[peak_offsets[:-1][has_peaks]], counts[has_peaks])
+
+
+def select_n_peaks(values, peak_offsets, n_peaks):
+    """Select peak values for models with a given number of peaks, from ragged arrays.
+
+    Parameters
+    ----------
+    values : 1d or 2d array
+        Peak values, for all models, with shape [n_total_peaks, ...].
+    peak_offsets : 1d array
+        Offsets of each model's peaks, with shape [n_models + 1].
+    n_peaks : int
+        Number of peaks of the models to select.
+
+    Returns
+    -------
+    array
+        Peak values of the selected models, with shape [n_selected_models, n_peaks, ...].
+    """
+
+    starts = peak_offsets[:-1][np.diff(peak_offsets) == n_peaks]
+
+    return values[starts[:, None] + np.arange(n_peaks)]
+
+
+#### ONLINE STATISTICS ####
+
+# Running moments of a distribution: count, mean & sum of squared deviations (per column)
+Moments = namedtuple('Moments', ['n', 'mean', 'm2'])
+
+# Quantile sketch, as counts of values in log-spaced bins, split by sign (per column)
+Sketch = namedtuple('Sketch', ['pos', 'neg', 'zeros'])
+
+# Relative accuracy, and range of absolute values, for quantile sketches
+SKETCH_ALPHA = 0.01
+SKETCH_RANGE = (1e-12, 1e6)
+
+
+def get_moments(data):
+    """Compute the moments of data, ignoring NaN values.
+
+    Parameters
+    ----------
+    data : 1d or 2d array
+        Data values, with shape [n_values] or [n_values, n_columns].
+
+    Returns
+    -------
+    Moments
+        Count, mean & sum of squared deviations from the mean, per column.
+    """
+
+    n_vals = np.sum(~np.isnan(data), 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n_vals > 0, np.nansum(data, 0) / n_vals, 0.)
+    m2 = np.nansum((data - mean) ** 2, 0)
+
+    return Moments(n_vals, mean, m2)
+
+
+def merge_moments(m1, m2):
+    """Combine the moments of two sets of data, as the moments of their union.
+
+    Parameters
+    ----------
+    m1, m2 : Moments
+        Moments of each set of data, for example from separate chunks or workers.
+
+    Returns
+    -------
+    Moments
+        Combined moments.
+
+    Notes
+    -----
+    This uses the pairwise update of Chan et al., which generalizes Welford's algorithm.
+    """
+
+    n_vals = m1.n + m2.n
+    delta = m2.mean - m1.mean
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frac = np.where(n_vals > 0, m2.n / n_vals, 0.)
+
+    mean = m1.mean + delta * frac
+    m2_sum = m1.m2 + m2.m2 + delta ** 2 * m1.n * frac
+
+    return Moments(n_vals, mean, m2_sum)
+
+
+def update_moments(moments, data):
+    """Update running moments with new data."""
+
+    return merge_moments(moments, get_moments(data)) if moments is not None else get_moments(data)
+
+
+def get_variance(moments):
+    """Get the (population) variance from running moments, to match `np.var`."""
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(moments.n > 0, moments.m2 / moments.n, np.nan)
+
+
+def _get_sketch_bins(vals):
+    """Get sketch bin indices for absolute data values."""
+
+    gamma = (1 + SKETCH_ALPHA) / (1 - SKETCH_ALPHA)
+    vals = np.clip(vals, *SKETCH_RANGE)
+
+    return np.ceil(np.log(vals / SKETCH_RANGE[0]) / np.log(gamma)).astype(int)
+
+
+def get_sketch(data):
+    """Compute a quantile sketch of data, ignoring NaN values.
+
+    Parameters
+    ----------
+    data : 1d or 2d array
+        Data values, with shape [n_values] or [n_values, n_columns].
+
+    Returns
+    -------
+    Sketch
+        Counts of values, in log-spaced bins, per column.
+
+    Notes
+    -----
+    Quantiles estimated from a sketch have a relative accuracy of `SKETCH_ALPHA`, for
+    absolute values within `SKETCH_RANGE`. As sketches have fixed bins, merging them is
+    exact: the merge of sketches of separate chunks equals the sketch of all the data.
+    """
+
+    data = np.asarray(data, dtype=float)
+    data_2d = data.reshape(len(data), -1)
+    n_cols = data_2d.shape[1]
+    n_bins = _get_sketch_bins(SKETCH_RANGE[1]) + 1
+
+    # Offset bin indices per column, so all columns can be counted in one call
+    col_offsets = np.arange(n_cols) * n_bins
+    counts = []
+    for select in [data_2d > 0, data_2d < 0]:
+        inds = _get_sketch_bins(np.abs(data_2d[select])) + np.broadcast_to(
+            col_offsets, data_2d.shape)[select]
+        counts.append(np.bincount(inds, minlength=n_cols * n_bins).reshape(n_cols, n_bins))
+    zeros = np.sum(data_2d == 0, 0)
+
+    if data.ndim == 1:
+        counts, zeros = [cur[0] for cur in counts], zeros[0]
+
+    return Sketch(counts[0], counts[1], zeros)
+
+
+def merge_sketches(s1, s2):
+    """Combine two quantile sketches, as the sketch of the union of their data."""
+
+    return Sketch(s1.pos + s2.pos, s1.neg + s2.neg, s1.zeros + s2.zeros)
+
+
+def update_sketch(sketch, data):
+    """Update a quantile sketch with new data."""
+
+    return merge_sketches(sketch, get_sketch(data)) if sketch is not None else get_sketch(data)
+
+
+def get_sketch_quantile(sketch, quantile=0.5):
+    """Estimate a quantile from a quantile sketch.
+
+    Parameters
+    ----------
+    sketch : Sketch
+        Quantile sketch, as from `get_sketch`.
+    quantile : float, optional, default: 0.5
+        Quantile to estimate, between 0 and 1.
+
+    Returns
+    -------
+    float or 1d array
+        Estimated quantile value(s), per column.
+    """
+
+    gamma = (1 + SKETCH_ALPHA) / (1 - SKETCH_ALPHA)
+    n_bins = sketch.pos.shape[-1]
+    centers = SKETCH_RANGE[0] * gamma ** np.arange(n_bins) * 2 / (gamma + 1)
+
+    # Order all bins from most negative to most positive value
+    counts = np.concatenate([sketch.neg[..., ::-1], np.asarray(sketch.zeros)[..., None],
+                             sketch.pos], axis=-1)
+    values = np.concatenate([-centers[::-1], [0.], centers])
+
+    cumulative = np.cumsum(counts, axis=-1)
+    totals = cumulative[..., -1:]
+    inds = np.argmax(cumulative > quantile * (totals - 1), axis=-1)
+
+    return np.where(totals[..., 0] > 0, values[inds], np.nan)
+
+
+@profiled()
+def count_peaks_2d(n_sim_peaks, n_fit_peaks, max_n_peaks=None):
+    """Count the number of fit peaks, per number of simulated peaks (or condition index).
+
+    Parameters
+    ----------
+    n_sim_peaks, n_fit_peaks : 1d array of int
+        Number of simulated (or condition indices) and fit peaks, per spectrum.
+    max_n_peaks : int, optional
+        Maximum number of peaks to count. If None, set from the data.
+
+    Returns
+    -------
+    counts : 2d array of int
+        Counts of each combination, with shape [max_n_peaks + 1, max_n_peaks + 1],
+        indexed as [n_sim, n_fit]. Counts from separate chunks can be summed.
+    """
+
+    n_sim_peaks = np.asarray(n_sim_peaks, dtype=int)
+    n_fit_peaks = np.asarray(n_fit_peaks, dtype=int)
+
+    data_max = int(max(n_sim_peaks.max(initial=0), n_fit_peaks.max(initial=0)))
+    if max_n_peaks is None:
+        max_n_peaks = data_max
+    elif data_max > max_n_peaks:
+        raise ValueError('Number of peaks exceeds the maximum number to count.')
+
+    counts = np.bincount(n_sim_peaks * (max_n_peaks + 1) + n_fit_peaks,
+                         minlength=(max_n_peaks + 1) ** 2)
+
+    return counts.reshape(max_n_peaks + 1, max_n_peaks + 1)
+
+
+#### DISTRIBUTION SUMMARIES ####
+
+# Quantiles stored in distribution summaries: the range, quartiles & median
+SUMMARY_QUANTILES = [0., 0.25, 0.5, 0.75, 1.]
+
+
+def get_violin_summary(data, n_points=256, log=False):
+    """Summarize distributions of data, per condition, as density curves & quantiles.
+
+    Parameters
+    ----------
+    data : 2d array
+        Data values, with shape [n_conds, n_values]. NaN values are ignored.
+    n_points : int, optional, default: 256
+        Number of points to evaluate the density curves at.
+    log : bool, optional, default: False
+        Whether to summarize the data in log10 space.
+        Zero values, which have no log, are excluded from the summary & counted separately.
+
+    Returns
+    -------
+    summary : dict of array
+        Summary of the data, with:
+
+        - 'grid', 'density' : density curve values & their positions, each [n_conds, n_points]
+        - 'quantiles' : quantiles per condition, at `SUMMARY_QUANTILES`, [n_conds, 5]
+        - 'n_values', 'n_zeros' : number of summarized values & of excluded zeros, [n_conds]
+        - 'log' : whether the summary is in log10 space
+
+    Notes
+    -----
+    Density curves are computed only across the range of the data, matching a violin plot
+    with `cut=0`. Summaries only need to be computed once, and can be plotted with
+    `plot_violin_summary`, which avoids recomputing densities across all values per plot.
+    """
+
+    n_conds = len(data)
+    summary = {'grid' : np.full([n_conds, n_points], np.nan),
+               'density' : np.zeros([n_conds, n_points]),
+               'quantiles' : np.full([n_conds, len(SUMMARY_QUANTILES)], np.nan),
+               'n_values' : np.zeros(n_conds, dtype=int),
+               'n_zeros' : np.zeros(n_conds, dtype=int),
+               'log' : np.array(log)}
+
+    for ind, vals in enumerate(data):
+
+        vals = np.asarray(vals, dtype=float)
+        vals = vals[~np.isnan(vals)]
+
+        if log:
+            summary['n_zeros'][ind] = np.sum(vals == 0)
+            vals = np.log10(vals[vals > 0])
+
+        summary['n_values'][ind] = len(vals)
+        if len(vals):
+            summary['quantiles'][ind] = np.quantile(vals, SUMMARY_QUANTILES)
+            summary['grid'][ind], summary['density'][ind] = compute_binned_kde(vals, n_points)
+
+    return summary
+
+
+def compute_binned_kde(vals, n_points=256, bandwidth=None):
+    """Compute a Gaussian kernel density estimate across the range of data, by binning.
+
+    Parameters
+    ----------
+    vals : 1d array
+        Data values.
+    n_points : int, optional, default: 256
+        Number of points to evaluate the density at, evenly spaced across the range of the data.
+    bandwidth : float, optional
+        Standard deviation of the Gaussian kernel. If not provided, uses Scott's rule.
+
+    Returns
+    -------
+    grid : 1d array
+        Positions of the density values.
+    density : 1d array
+        Estimated density values.
+
+    Notes
+    -----
+    Values are linearly binned onto the grid, and the bin counts are convolved with the
+    kernel using the FFT, which takes O(n_values + n_points log n_points), rather than the
+    O(n_values * n_points) of evaluating the kernel for each value at each point.
+    """
+
+    low, high = np.min(vals), np.max(vals)
+    grid = np.linspace(low, high, n_points)
+
+    if bandwidth is None:
+        bandwidth = np.std(vals, ddof=1) * len(vals) ** (-1 / 5) if len(vals) > 1 else 0.
+
+    # All values are the same, or there is no spread, so there is no density to estimate
+    if high == low or not bandwidth > 0:
+        return grid, np.zeros(n_points)
+
+    # Linearly bin values, splitting the weight of each value across its two nearest points
+    step = grid[1] - grid[0]
+    pos = (vals - low) / step
+    left = np.minimum(np.floor(pos).astype(int), n_points - 2)
+    frac = pos - left
+    counts = np.bincount(left, 1 - frac, n_points) + np.bincount(left + 1, frac, n_points)
+
+    # Convolve with the kernel, truncated past 4 bandwidths, or past the range of the grid
+    n_half = int(min(np.ceil(4 * bandwidth / step), n_points))
+    kernel = np.exp(-0.5 * (np.arange(-n_half, n_half + 1) * step / bandwidth) ** 2)
+    kernel /= np.sqrt(2 * np.pi) * bandwidth
 
-    f_mapping = []
-    for f_res in fg:
-        cfs = f_res.peak_params[:, 0]
-        if len(cfs) > 0:
-            f_mapping.append(list(cfs / cfs[0]))
+    density = np.clip(fftconvolve(counts, kernel, mode='same') / len(vals), 0, None)
 
-    return f_mapping
+    return grid, density
@@ -0,0 +1,339 @@
+"""Baseline methods, for comparison to FOOOF on simulated data."""
+
+import time
+import fractions
+from functools import lru_cache, partial
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+from scipy.signal import resample_poly, firwin
+
+from neurodsp.aperiodic import compute_irasa
+
+from settings import F_RANGE, N_SECONDS
+from sims import sim_combined_batch, compute_spectra_welch, get_rng
+
+###################################################################################################
+###################################################################################################
+
+#### IRASA ####
+
+def compute_irasa_batch(sigs, fs, f_range=None, hset=None, thresh=None, n_jobs=1, **welch_kwargs):
+    """Separate aperiodic and periodic components using IRASA, across a batch of signals.
+
+    Parameters
+    ----------
+    sigs : 2d array
+        Time series, with shape [n_sigs, n_samples].
+    fs : float
+        Sampling rate, in Hz.
+    f_range : list of [float, float], optional
+        Frequency range to restrict the power spectra to.
+    hset : 1d array, optional
+        Resampling factors. Defaults to the `neurodsp` default of np.arange(1.1, 1.95, 0.05).
+    thresh : float, optional
+        Relative threshold for labeling activity as periodic, as in `compute_irasa`.
+    n_jobs : int, optional, default: 1
+        Number of processes to run in parallel, across resampling factors.
+        -1 uses all available cores.
+    **welch_kwargs
+        Settings for computing power spectra, as 'nperseg' & 'noverlap'.
+        Defaults to a 'nperseg' of 4 seconds of data, as in `compute_irasa`.
+
+    Returns
+    -------
+    freqs : 1d array
+        Frequency values for the power spectra.
+    psds_aperiodic : 2d array
+        Aperiodic components of the power spectra, with shape [n_sigs, n_freqs].
+    psds_periodic : 2d array
+        Periodic components of the power spectra, with shape [n_sigs, n_freqs].
+
+    Notes
+    -----
+    This is a batch equivalent of `neurodsp.aperiodic.compute_irasa`, using Welch's method.
+    For each resampling factor, all signals are resampled & have spectra computed together,
+    with the resampling filter designed once, and shared between up & down sampling.
+    Resampling factors are split across a process pool.
+    """
+
+    sigs = np.atleast_2d(sigs)
+    hset = np.round(np.arange(1.1, 1.95, 0.05) if hset is None else hset, 4)
+    welch_kwargs.setdefault('nperseg', int(4 * fs))
+
+    freqs, psds = compute_spectra_welch(sigs, fs, **welch_kwargs)
+    f_mask = (freqs >= f_range[0]) & (freqs <= f_range[1]) if f_range \
+        else np.ones(len(freqs), dtype=bool)
+
+    n_jobs = cpu_count() if n_jobs == -1 else n_jobs
+    resample_func = partial(_resampled_spectra, sigs=sigs, fs=fs, f_mask=f_mask, **welch_kwargs)
+    h_chunks = np.array_split(hset, min(n_jobs, len(hset)))
+
+    if n_jobs == 1:
+        psds_resampled = [resample_func(h_chunk) for h_chunk in h_chunks]
+    else:
+        with Pool(processes=n_jobs) as pool:
+            psds_resampled = pool.map(resample_func, h_chunks)
+
+    # Take the median resampled spectra, as an estimate of the aperiodic component
+    psds_aperiodic = np.median(np.concatenate(psds_resampled), axis=0)
+    psds_periodic = psds[:, f_mask] - psds_aperiodic
+
+    # Apply a relative threshold for tuning which activity is labeled as periodic
+    if thresh is not None:
+        sub_thresh = psds_periodic - psds_aperiodic < \
+            thresh * np.std(psds, axis=-1, keepdims=True)
+        psds_periodic[sub_thresh] = 0
+        psds_aperiodic[sub_thresh] = psds[:, f_mask][sub_thresh]
+
+    return freqs[f_mask], psds_aperiodic, psds_periodic
+
+
+def _resampled_spectra(hset, sigs, fs, f_mask, **welch_kwargs):
+    """Compute the geometric mean of the up & down resampled spectra, for each resampling factor.
+
+    Returns an array with shape [n_h, n_sigs, n_freqs], restricted to `f_mask`.
+    """
+
+    psds = np.zeros([len(hset), len(sigs), np.sum(f_mask)])
+    for ind, h_val in enumerate(hset):
+
+        up, dn = get_resampling_factors(h_val)
+        window = get_resampling_filter(up, dn)
+
+        _, psd_up = compute_spectra_welch(resample_poly(sigs, up, dn, axis=-1, window=window),
+                                          h_val * fs, **welch_kwargs)
+        _, psd_dn = compute_spectra_welch(resample_poly(sigs, dn, up, axis=-1, window=window),
+                                          fs / h_val, **welch_kwargs)
+
+        psds[ind] = np.sqrt(psd_up[:, f_mask] * psd_dn[:, f_mask])
+
+    return psds
+
+
+def get_resampling_factors(h_val):
+    """Get the up & down sampling factors, as integers, for a resampling factor."""
+
+    rat = fractions.Fraction(str(h_val))
+
+    return rat.numerator, rat.denominator
+
+
+@lru_cache()
+def get_resampling_filter(up, dn):
+    """Get the low-pass filter used by `resample_poly`, which is the same for (up, dn) & (dn, up).
+
+    Parameters
+    ----------
+    up, dn : int
+        Up & down sampling factors.
+
+    Returns
+    -------
+    window : 1d array or None
+        FIR filter coefficients, as designed by default in `scipy.signal.resample_poly`.
+        None if no resampling is needed, in which case no filter is used.
+    """
+
+    max_rate = max(up, dn) // np.gcd(up, dn)
+    if max_rate == 1:
+        return None
+
+    window = firwin(2 * 10 * max_rate + 1, 1. / max_rate, window=('kaiser', 5.0))
+    window.setflags(write=False)
+
+    return window
+
+
+def compare_irasa(n_sigs=100, n_seconds=N_SECONDS, fs=1000, f_range=F_RANGE, hset=None,
+                  n_jobs=1, rng=None):
+    """Benchmark batched IRASA against `neurodsp.aperiodic.compute_irasa`, on simulated signals.
+
+    Parameters
+    ----------
+    n_sigs : int, optional, default: 100
+        Number of signals to simulate.
+    n_seconds : float, optional
+        Length of the signals to simulate, in seconds. Default is `N_SECONDS`.
+    fs : float, optional, default: 1000
+        Sampling rate, in Hz.
+    f_range : list of [float, float], optional
+        Frequency range to restrict the power spectra to.
+    hset : 1d array, optional
+        Resampling factors. Large factors, such as up to 2.9, need signals longer than
+        4 seconds times the largest factor, to compute the down sampled spectra.
+    n_jobs : int, optional, default: 1
+        Number of processes to run the batched IRASA with.
+    rng : int or np.random.Generator, optional
+        Seed or generator to simulate with.
+
+    Returns
+    -------
+    results : dict
+        Run times of the looped & batched approaches, in seconds, as 'time_loop' & 'time_batch',
+        and the maximum relative difference of the aperiodic spectra, as 'max_diff'.
+    """
+
+    rng = get_rng(rng)
+    exps = rng.choice([-0.5, -1., -1.5, -2.], n_sigs)
+    cfs = rng.choice(np.arange(3, 35), n_sigs)
+    sigs = sim_combined_batch(n_seconds, fs, exps, cfs, [1, 0.5], rng=rng)
+
+    start = time.perf_counter()
+    psds_loop = np.array([compute_irasa(sig, fs, f_range=f_range, hset=hset)[1] for sig in sigs])
+    time_loop = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, psds_batch, _ = compute_irasa_batch(sigs, fs, f_range=f_range, hset=hset, n_jobs=n_jobs)
+    time_batch = time.perf_counter() - start
+
+    results = {'time_loop' : time_loop, 'time_batch' : time_batch,
+               'max_diff' : np.max(np.abs(psds_batch / psds_loop - 1))}
+
+    return results
+
+
+#### APERIODIC FITS ####
+
+def fit_ap_linear_batch(freqs, powers):
+    """Fit aperiodic components with a linear function in log-log space, across spectra.
+
+    Parameters
+    ----------
+    freqs : 1d array
+        Frequency values for the power spectra, in linear space.
+    powers : 2d array
+        Power values, in linear space, with shape [n_spectra, n_freqs].
+
+    Returns
+    -------
+    params : 2d array
+        Fit parameters, as [offset, slope], with shape [n_spectra, 2].
+
+    Notes
+    -----
+    This fits the same model as `neurodsp.aperiodic.irasa.fit_func` with `curve_fit`,
+    as a single least squares solve against a design matrix shared by all spectra.
+    """
+
+    design = np.stack([np.ones(len(freqs)), np.log10(freqs)], axis=1)
+    params, *_ = np.linalg.lstsq(design, np.log10(np.atleast_2d(powers)).T, rcond=None)
+
+    return params.T
+
+
+def fit_ap_knee_batch(freqs, powers, p0=None, max_iter=200, tol=1e-10):
+    """Fit aperiodic components with a knee function, across spectra.
+
+    Parameters
+    ----------
+    freqs : 1d array
+        Frequency values for the power spectra, in linear space.
+    powers : 2d array
+        Power values, in linear space, with shape [n_spectra, n_freqs].
+    p0 : array, optional
+        Initial parameters, as [offset, knee, exponent], for all or each spectrum.
+        If not provided, initialized from a linear fit in log-log space, with a knee of 0.
+    max_iter : int, optional, default: 200
+        Maximum number of iterations.
+    tol : float, optional, default: 1e-10
+        Relative change in the sum of squared errors at which a fit is considered converged.
+
+    Returns
+    -------
+    params : 2d array
+        Fit parameters, as [offset, knee, exponent], with shape [n_spectra, 3].
+    n_iters : 1d array
+        Number of iterations run for each spectrum.
+
+    Notes
+    -----
+    This fits the same model as `fooof.core.funcs.expo_function` with `curve_fit`, using a
+    Levenberg-Marquardt solver that updates all spectra together, with per-spectrum damping.
+    The offset enters the model linearly, so is solved for directly at each step,
+    leaving the knee & exponent to be fit iteratively.
+    """
+
+    log_powers = np.log10(np.atleast_2d(powers))
+    n_specs = len(log_powers)
+
+    if p0 is None:
+        lin_params = fit_ap_linear_batch(freqs, np.power(10, log_powers))
+        params = np.stack([lin_params[:, 0], np.zeros(n_specs), -lin_params[:, 1]], axis=1)
+    else:
+        params = np.array(np.broadcast_to(p0, (n_specs, 3)), dtype=float)
+
+    nl_params = params[:, 1:]
+    cost = np.sum(_knee_resids(freqs, log_powers, nl_params)[0] ** 2, axis=-1)
+    damping = np.full(n_specs, 1e-3)
+    factor = np.full(n_specs, 2.)
+    active = np.ones(n_specs, dtype=bool)
+    n_iters = np.zeros(n_specs, dtype=int)
+
+    for _ in range(max_iter):
+
+        inds = np.flatnonzero(active)
+        if not len(inds):
+            break
+        n_iters[inds] += 1
+
+        # Solve the damped normal equations, for all active spectra together
+        #   Damping is scaled per parameter, with a floor for parameters with no current effect
+        resids, jac = _knee_resids(freqs, log_powers[inds], nl_params[inds], jacobian=True)
+        jtj = np.einsum('nfi,nfj->nij', jac, jac)
+        jtr = np.einsum('nfi,nf->ni', jac, resids)
+        diag = np.einsum('nii->ni', jtj)
+        diag = np.maximum(diag, 1e-6 * diag.max(axis=-1, keepdims=True))
+        step = np.linalg.solve(jtj + damping[inds, None, None] * diag[:, :, None] * np.eye(2),
+                               jtr[..., None])[..., 0]
+
+        # Compare the actual to the predicted reduction in error, to accept steps & set damping
+        new_params = nl_params[inds] + step
+        new_cost = np.sum(_knee_resids(freqs, log_powers[inds], new_params)[0] ** 2, axis=-1)
+        predicted = np.einsum('ni,ni->n', step, jtr + damping[inds, None] * diag * step)
+        ratio = (cost[inds] - new_cost) / predicted
+        improved = ratio > 0
+
+        converged = improved & (cost[inds] - new_cost <= tol * np.maximum(cost[inds], tol))
+        nl_params[inds[improved]] = new_params[improved]
+        cost[inds[improved]] = new_cost[improved]
+
+        scale = np.maximum(1 / 3, 1 - (2 * np.minimum(ratio, 1) - 1) ** 3)
+        damping[inds] *= np.where(improved, scale, factor[inds])
+        factor[inds] = np.where(improved, 2, factor[inds] * 2)
+
+        # Stop when the error no longer changes, or the damping is too large to make progress
+        active[inds[converged | (damping[inds] > 1e12)]] = False
+
+    params[:, 0] = _knee_resids(freqs, log_powers, nl_params)[1]
+
+    return params, n_iters
+
+
+def _knee_resids(freqs, log_powers, nl_params, jacobian=False):
+    """Compute residuals of the knee model, with the offset solved for, given knee & exponent.
+
+    Returns the residuals, with invalid parameters giving inf, and either the offsets, or
+    if `jacobian`, the Jacobian of the model with respect to the knee & exponent.
+    """
+
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+
+        f_exp = freqs ** nl_params[:, 1:2]
+        denom = nl_params[:, 0:1] + f_exp
+        log_denom = np.log10(denom)
+        log_denom[np.isnan(log_denom)] = np.inf
+
+        # The best offset is the mean difference between the data & the model without offset
+        offsets = np.mean(log_powers + log_denom, axis=-1)
+        resids = log_powers + log_denom - offsets[:, None]
+
+    if not jacobian:
+        return resids, offsets
+
+    d_knee = -1 / (denom * np.log(10))
+    d_exp = d_knee * f_exp * np.log(freqs)
+    jac = np.stack([d_knee - d_knee.mean(-1, keepdims=True),
+                    d_exp - d_exp.mean(-1, keepdims=True)], axis=-1)
+
+    return resids, jac
@@ -0,0 +1,378 @@
+"""Benchmarks for the simulation, fitting, I/O & analysis steps of testing FOOOF on simulated data.
+
+Run from the `code` folder, for example:
+
+    python bench.py --n-psds 100
+    python bench.py --cases imports
+    python bench.py --compare ../data/bench/<old>.json ../data/bench/<new>.json
+"""
+
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from os import makedirs
+from os.path import join as pjoin, dirname, abspath
+
+import numpy as np
+
+from fooof.sim.gen import gen_freqs, gen_periodic
+from neurodsp.sim import sim_combined
+from neurodsp.aperiodic import compute_irasa
+
+from settings import (FOOOF_SETTINGS, FOOOF_SETTINGS_KNEE, F_RANGE, F_RES, F_RANGE_LONG,
+                      F_RES_LONG, NLVS, N_PEAKS, KNEES, SKEWS, NLV, N_SECONDS)
+from paths import BENCH_PATH
+from sims import (gen_ap_def, gen_ap_knee_def, gen_peak_def, gen_skew_peaks, gen_power_vals_fn,
+                  sample_ap_defs, sample_ap_knee_defs, sample_peak_defs, to_sim_params,
+                  gen_power_vals_batch, sim_combined_batch, compute_spectra_welch)
+from fits import fit_models
+from baselines import compute_irasa_batch
+from utils import save_sim_data, load_sim_data, batch_to_columns, concat_columns
+from analysis import get_fit_data
+
+###################################################################################################
+###################################################################################################
+
+# Benchmark cases, mirroring the simulation sweeps, with the settings for each
+CASES = {
+    'one_peak' : {'conds' : NLVS, 'f_range' : F_RANGE, 'f_res' : F_RES,
+                  'settings' : FOOOF_SETTINGS},
+    'multi_peak' : {'conds' : N_PEAKS, 'f_range' : F_RANGE, 'f_res' : F_RES,
+                    'settings' : FOOOF_SETTINGS},
+    'knee' : {'conds' : KNEES, 'f_range' : F_RANGE_LONG, 'f_res' : F_RES_LONG,
+              'settings' : FOOOF_SETTINGS_KNEE},
+    'skew' : {'conds' : SKEWS, 'f_range' : F_RANGE, 'f_res' : F_RES,
+              'settings' : FOOOF_SETTINGS},
+    'irasa' : {'conds' : [1], 'fs' : 1000},
+    'imports' : {'modules' : ['settings', 'sims', 'fits', 'pipeline', 'plts']},
+}
+
+#### MEASUREMENT ####
+
+def measure(func, *args, n_repeats=1, **kwargs):
+    """Measure the run time & peak memory allocated by a function.
+
+    Parameters
+    ----------
+    func : callable
+        Function to measure.
+    *args, **kwargs
+        Arguments to call the function with.
+    n_repeats : int, optional, default: 1
+        Number of times to time the function, taking the fastest run.
+
+    Returns
+    -------
+    measures : dict
+        Run time, in seconds, as 'time', and peak memory allocated, in bytes, as 'peak_mem'.
+    output
+        Output of the function.
+    """
+
+    times = []
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        output = func(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+
+    # Measure memory in a separate run, as tracing allocations slows down the function
+    tracemalloc.start()
+    func(*args, **kwargs)
+    _, peak_mem = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'time' : min(times), 'peak_mem' : peak_mem}, output
+
+
+def get_commit():
+    """Get the hash of the current commit, or 'unknown' if not available."""
+
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+#### SWEEP STEPS ####
+
+def sample_loop(case, cond, n_psds, rng):
+    """Sample simulation parameters with the generator functions, as in the notebooks."""
+
+    aps = gen_ap_knee_def(cond, rng=rng) if case == 'knee' else gen_ap_def(rng=rng)
+    peaks = gen_peak_def(cond if case == 'multi_peak' else 1, rng=rng)
+    nlv = cond if case == 'one_peak' else NLV
+
+    defs = []
+    for _ in range(n_psds):
+        cur_peaks = next(peaks)
+        if case == 'skew':
+            cur_peaks = [cur_peaks + [cond]]
+        defs.append((next(aps), cur_peaks, nlv))
+
+    return defs
+
+
+def sample_batch(case, cond, n_psds, rng):
+    """Sample simulation parameters with the batch samplers."""
+
+    ap_params = sample_ap_knee_defs(n_psds, cond, rng=rng) if case == 'knee' \
+        else sample_ap_defs(n_psds, rng=rng)
+    peak_params, peak_mask = sample_peak_defs(
+        n_psds, cond if case == 'multi_peak' else 1, rng=rng)
+    nlv = cond if case == 'one_peak' else NLV
+
+    if case == 'skew':
+        peak_params = np.concatenate([peak_params, np.full(peak_mask.shape + (1, ), cond)], -1)
+
+    return ap_params, peak_params, peak_mask, nlv
+
+
+def synth_loop(freqs, defs, skewed=False, rng=None):
+    """Simulate power spectra one at a time, with `gen_power_vals_fn`."""
+
+    pe_func = gen_skew_peaks if skewed else gen_periodic
+    pe_label = 'params' if skewed else 'periodic_params'
+
+    return np.array([gen_power_vals_fn(freqs, {'aperiodic_params' : ap}, {pe_label : peaks},
+                                       {'nlv' : nlv}, pe_func=pe_func, rng=rng) \
+        for ap, peaks, nlv in defs])
+
+
+def save_load(freqs, psds, sim_params, folder, columnar=False):
+    """Save out & reload simulated data."""
+
+    save_sim_data('bench', folder, freqs, psds, sim_params, columnar=columnar)
+
+    return load_sim_data('bench', folder)
+
+#### BENCHMARKS ####
+
+def run_case(case, n_psds=100, n_fit=None, rng=None):
+    """Run the benchmarks for a case, across each step of a sweep.
+
+    Parameters
+    ----------
+    case : str
+        Name of the case, as a key of `CASES`.
+    n_psds : int, optional, default: 100
+        Number of power spectra to simulate per condition.
+    n_fit : int, optional
+        Number of power spectra to fit, from the first condition. Defaults to `n_psds`.
+    rng : int or np.random.Generator, optional
+        Seed or generator to simulate with.
+
+    Returns
+    -------
+    results : dict
+        Measures, as from `measure`, for each step.
+    """
+
+    rng = np.random.default_rng(rng)
+    n_fit = n_psds if n_fit is None else n_fit
+
+    if case == 'irasa':
+        return run_irasa_case(n_psds, CASES[case]['fs'], rng)
+    if case == 'imports':
+        return run_imports_case(CASES[case]['modules'])
+
+    settings, conds = CASES[case]['settings'], CASES[case]['conds']
+    freqs = gen_freqs(CASES[case]['f_range'], CASES[case]['f_res'])
+    skewed = case == 'skew'
+
+    results = {}
+    results['sample_loop'], defs = measure(
+        lambda: [sample_loop(case, cond, n_psds, rng) for cond in conds])
+    results['sample_batch'], params = measure(
+        lambda: [sample_batch(case, cond, n_psds, rng) for cond in conds])
+
+    results['synth_loop'], _ = measure(
+        lambda: [synth_loop(freqs, cur_defs, skewed, rng) for cur_defs in defs])
+    results['synth_batch'], psds = measure(
+        lambda: np.array([gen_power_vals_batch(freqs, *cur_params, skewed=skewed, rng=rng) \
+            for cur_params in params]))
+
+    sim_params = [to_sim_params(*cur_params) for cur_params in params]
+    columns = concat_columns([batch_to_columns(*cur_params) for cur_params in params])
+    columns['aperiodic_params'] = columns['aperiodic_params'].reshape(len(conds), n_psds, -1)
+    columns['nlvs'] = columns['nlvs'].reshape(len(conds), n_psds)
+    with tempfile.TemporaryDirectory() as folder:
+        results['save_load'], _ = measure(save_load, freqs, psds, sim_params, folder)
+        results['save_load_columnar'], _ = measure(save_load, freqs, psds, columns,
+                                                   folder, columnar=True)
+
+    results['fit'], fgs = measure(fit_models, freqs, psds[:1, :n_fit], settings)
+    results['get_fit_data'], _ = measure(get_fit_data, fgs * len(conds), n_repeats=3)
+
+    return results
+
+
+def run_irasa_case(n_psds, fs, rng):
+    """Run the benchmarks for the IRASA time series path."""
+
+    exps = rng.choice([-0.5, -1., -1.5, -2.], n_psds)
+    cfs = rng.choice(np.arange(3, 35), n_psds)
+    psd_kwargs = {'nperseg' : fs, 'noverlap' : fs // 2}
+
+    results = {}
+    results['synth_loop'], _ = measure(lambda: [sim_combined(\
+        N_SECONDS, fs, {'sim_powerlaw' : {'exponent' : exp, 'f_range' : (1, None)},
+                        'sim_oscillation' : {'freq' : cf}}, [1, 0.5]) \
+        for exp, cf in zip(exps, cfs)])
+    results['synth_batch'], sigs = measure(
+        sim_combined_batch, N_SECONDS, fs, exps, cfs, [1, 0.5], rng=rng)
+    results['spectra_batch'], _ = measure(compute_spectra_welch, sigs, fs, **psd_kwargs)
+    results['irasa_loop'], _ = measure(
+        lambda: [compute_irasa(sig, fs, f_range=F_RANGE) for sig in sigs])
+    results['irasa_batch'], _ = measure(compute_irasa_batch, sigs, fs, f_range=F_RANGE)
+
+    return results
+
+
+def run_imports_case(modules, n_repeats=3):
+    """Run the benchmarks for the time & memory of importing each module, as done per worker."""
+
+    return {'import_' + module : measure_import(module, n_repeats) for module in modules}
+
+
+def measure_import(module, n_repeats=3):
+    """Measure the time & peak memory of importing a module, in a new interpreter.
+
+    Parameters
+    ----------
+    module : str
+        Name of the module to import.
+    n_repeats : int, optional, default: 3
+        Number of times to import the module, each in a new interpreter, taking the fastest run.
+
+    Returns
+    -------
+    measures : dict
+        Import time, in seconds, as 'time', and peak resident memory of the interpreter,
+        in bytes, as 'peak_mem'.
+    """
+
+    code = ('import time, resource; start = time.perf_counter(); import {}; '
+            'print(time.perf_counter() - start, '
+            'resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)').format(module)
+
+    times, mems = [], []
+    for _ in range(n_repeats):
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         cwd=dirname(abspath(__file__)))
+        cur_time, cur_mem = output.split()
+        times.append(float(cur_time))
+        mems.append(int(cur_mem))
+
+    return {'time' : min(times), 'peak_mem' : min(mems)}
+
+
+def run_benchmarks(cases=None, n_psds=100, n_fit=None, save=True, rng=0):
+    """Run the benchmark suite, and save out the results for the current commit.
+
+    Parameters
+    ----------
+    cases : list of str, optional
+        Names of the cases to run. Defaults to all cases in `CASES`.
+    n_psds : int, optional, default: 100
+        Number of power spectra to simulate per condition.
+    n_fit : int, optional
+        Number of power spectra to fit per case. Defaults to `n_psds`.
+    save : bool, optional, default: True
+        Whether to save the results, to a file named by commit in `BENCH_PATH`.
+    rng : int, optional, default: 0
+        Seed to simulate with.
+
+    Returns
+    -------
+    report : dict
+        Benchmark results, with the 'commit', 'date', 'n_psds' and 'results' per case.
+    """
+
+    cases = list(CASES) if cases is None else cases
+
+    report = {'commit' : get_commit(), 'date' : time.strftime('%Y-%m-%d %H:%M:%S'),
+              'n_psds' : n_psds, 'results' : {}}
+    for case in cases:
+        report['results'][case] = run_case(case, n_psds, n_fit, rng)
+
+    if save:
+        makedirs(BENCH_PATH, exist_ok=True)
+        with open(pjoin(BENCH_PATH, report['commit'] + '.json'), 'w') as f_obj:
+            json.dump(report, f_obj, indent=1)
+
+    return report
+
+
+def compare_benchmarks(old_file, new_file, threshold=1.2):
+    """Compare benchmark results between two runs, flagging regressions.
+
+    Parameters
+    ----------
+    old_file, new_file : str
+        Paths to saved benchmark results.
+    threshold : float, optional, default: 1.2
+        Ratio of new to old time or memory, above which a step is flagged as a regression.
+
+    Returns
+    -------
+    regressions : list of tuple of (str, str, str, float)
+        Case, step, measure & ratio for each regression.
+    """
+
+    with open(old_file) as f_obj:
+        old = json.load(f_obj)
+    with open(new_file) as f_obj:
+        new = json.load(f_obj)
+
+    print('{:12s} {:20s} {:>10s} {:>10s} {:>8s}'.format('case', 'step', 'old (s)', 'new (s)',
+                                                         'ratio'))
+
+    regressions = []
+    for case, steps in new['results'].items():
+        for step, measures in steps.items():
+
+            if step not in old['results'].get(case, {}):
+                continue
+            old_measures = old['results'][case][step]
+
+            print('{:12s} {:20s} {:10.4f} {:10.4f} {:8.2f}'.format(
+                case, step, old_measures['time'], measures['time'],
+                measures['time'] / old_measures['time']))
+
+            for label in ['time', 'peak_mem']:
+                ratio = measures[label] / max(old_measures[label], 1e-12)
+                if ratio > threshold:
+                    regressions.append((case, step, label, ratio))
+
+    return regressions
+
+
+def print_report(report):
+    """Print out the results of a benchmark run."""
+
+    print('Commit: {}, n_psds: {}'.format(report['commit'], report['n_psds']))
+    for case, steps in report['results'].items():
+        for step, measures in steps.items():
+            print('{:12s} {:20s} {:10.4f} s {:10.2f} MB'.format(
+                case, step, measures['time'], measures['peak_mem'] / 2**20))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Run or compare benchmarks.')
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=None)
+    parser.add_argument('--n-psds', type=int, default=100)
+    parser.add_argument('--n-fit', type=int, default=None)
+    parser.add_argument('--no-save', action='store_true')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), default=None)
+    args = parser.parse_args()
+
+    if args.compare:
+        for regression in compare_benchmarks(*args.compare):
+            print('Regression: {} {} {}: x{:1.2f}'.format(*regression))
+    else:
+        print_report(run_benchmarks(args.cases, args.n_psds, args.n_fit, not args.no_save))
@@ -0,0 +1,315 @@
+"""Headless batch rendering of the figures for testing FOOOF on simulated data.
+
+Regenerates the figures of the simulation notebooks from saved simulations & model fits.
+Run from the `code` folder, for example:
+
+    python figures.py
+    python figures.py 01_one-peak/ 02_multi-peak/ --n-jobs 2
+"""
+
+import os
+import argparse
+from os.path import join as pjoin
+from collections import Counter
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+
+# Use a non-interactive backend, which must be set before pyplot is imported
+import matplotlib
+matplotlib.use('Agg')
+
+import seaborn as sns
+import matplotlib.pyplot as plt
+
+from settings import (NLVS, N_PEAKS, KNEES, SKEWS, RDSYMS, F_RANGE, YLIMS_AP, YLIMS_AP2, YLIMS_KN,
+                      YLIMS_CF, YLIMS_PW, YLIMS_BW, YTICKS_KN, YTICKS_CF, YTICKS_PW, YTICKS_BW)
+from paths import FIGS_PATH, SAVE_EXT
+from utils import load_sim_data, load_model_data, save_summaries, load_summaries
+from analysis import (get_ground_truth, get_fit_data, calc_errors, count_peak_conditions,
+                      get_violin_summary)
+from plts import plot_violin_summary, plot_n_peaks_bubbles
+
+###################################################################################################
+###################################################################################################
+
+# Plot functions, & their figure sizes, for each type of figure
+PLOTS = {'violin' : (plot_violin_summary, [8, 6]),
+         'bubbles' : (plot_n_peaks_bubbles, [6, 6])}
+
+# Shared figure definitions: the model error & goodness-of-fit, which are not plotted in log
+MODEL_FIGURES = [('violin', 'err', {'title' : 'Fit Error', 'plt_log' : False}, 'model_error'),
+                 ('violin', 'r2', {'title' : 'R2', 'y_label' : 'R^2', 'plt_log' : False},
+                  'model_r_squared')]
+
+# Figure sets, per notebook, defined by the folder the data & figures are saved in, with:
+#   'data_name' : name of the saved simulations & model fits
+#   'conds' : condition values, 'x_axis' & 'x_label' : x-axis setting of violin & bubble plots
+#   'peaks' : per label, the frequency range to extract fit peaks from & index of the
+#             simulated peak to compare to (None for a single peak)
+#   'exp_sign' : optional, sign to apply to simulated exponents, as -1 for NeuroDSP simulations
+#   'figures' : list of (plot type, data label, plot settings, save name)
+# Note: the periodic model violation notebooks save to folders that are numbered the other way
+#   around, with notebook 05 (skewed peaks) in '06_mv-peII/' & notebook 06 in '05_mv-peI/'.
+#   The comparison notebooks, 07 & 08, plot comparisons between methods, so are not included.
+FIGURE_SETS = {
+    '01_one-peak/' : {
+        'data_name' : 'single_peak_sims', 'conds' : NLVS, 'x_axis' : 'nlvs', 'x_label' : 'nlvs',
+        'peaks' : {'' : (F_RANGE, None)},
+        'figures' : [
+            ('violin', 'cf', {'title' : 'Center Frequency', 'ylim' : YLIMS_CF,
+                              'yticks' : YTICKS_CF}, 'cf_error'),
+            ('violin', 'pw', {'title' : 'Power', 'ylim' : YLIMS_PW,
+                              'yticks' : YTICKS_PW}, 'pw_error'),
+            ('violin', 'bw', {'title' : 'Bandwidth', 'ylim' : YLIMS_BW,
+                              'yticks' : YTICKS_BW}, 'bw_error'),
+            ('bubbles', 'n_peaks', {'ms_val' : 15}, 'n_peaks_fit'),
+            ('violin', 'off', {'title' : 'Offset', 'ylim' : YLIMS_AP}, 'off_error'),
+            ('violin', 'exp', {'title' : 'Exponent', 'ylim' : YLIMS_AP}, 'exp_error'),
+            *MODEL_FIGURES]},
+    '02_multi-peak/' : {
+        'data_name' : 'multi_peak_sims', 'conds' : N_PEAKS, 'x_axis' : 'n_peaks',
+        'x_label' : 'n_peaks', 'peaks' : {'' : (F_RANGE, None)},
+        'figures' : [
+            ('bubbles', 'n_peaks', {'ms_val' : 12}, 'n_peaks_fit'),
+            ('violin', 'off', {'title' : 'Offset', 'ylim' : YLIMS_AP}, 'off_error'),
+            ('violin', 'exp', {'title' : 'Exponent', 'ylim' : YLIMS_AP}, 'exp_error'),
+            ('violin', 'err', {'title' : 'Fit Error', 'ylim' : np.log10([0.00575, 0.061]),
+                               'yticks' : [0.006, 0.010, 0.016, 0.025, 0.04, 0.06]},
+             'model_error'),
+            MODEL_FIGURES[1]]},
+    '03_knee/' : {
+        'data_name' : 'knee_sims', 'conds' : NLVS, 'x_axis' : 'nlvs', 'x_label' : 'nlvs',
+        'peaks' : {'low_' : ([3, 35], 0), 'high_' : ([40, 100], 1)},
+        'figures' : [
+            *[('violin', band + 'cf', {'title' : 'Center Frequency', 'ylim' : YLIMS_CF,
+                                       'yticks' : YTICKS_CF}, band + 'cf_error') \
+                for band in ['low_', 'high_']],
+            *[('violin', band + 'pw', {'title' : 'Power', 'ylim' : YLIMS_PW,
+                                       'yticks' : YTICKS_PW}, band + 'pw_error') \
+                for band in ['low_', 'high_']],
+            *[('violin', band + 'bw', {'title' : 'Bandwidth', 'ylim' : YLIMS_BW,
+                                       'yticks' : YTICKS_BW}, band + 'bw_error') \
+                for band in ['low_', 'high_']],
+            ('bubbles', 'low_n_peaks', {'ms_val' : 15}, 'low_n_peaks_fit'),
+            ('bubbles', 'high_n_peaks', {'ms_val' : 15}, 'high_n_peaks_fit'),
+            ('violin', 'off', {'title' : 'Offset', 'ylim' : YLIMS_AP2}, 'off_error'),
+            ('violin', 'kne', {'title' : 'Knee', 'ylim' : YLIMS_KN,
+                               'yticks' : YTICKS_KN}, 'kne_error'),
+            ('violin', 'exp', {'title' : 'Exponent', 'ylim' : YLIMS_AP2}, 'exp_error'),
+            *MODEL_FIGURES]},
+    '04_mv-ap/' : {
+        'data_name' : 'mvap_kne_sims', 'conds' : KNEES, 'x_axis' : 'knees', 'x_label' : 'knee',
+        'peaks' : {'' : (F_RANGE, None)},
+        'figures' : [
+            ('violin', 'off', {'title' : 'Offset', 'ylim' : YLIMS_AP2}, 'off_error'),
+            ('violin', 'exp', {'title' : 'Exponent', 'ylim' : [-3.5, 0.25]}, 'exp_error'),
+            ('bubbles', 'n_peaks', {'ms_val' : 12}, 'number_of_peaks'),
+            *MODEL_FIGURES]},
+    '05_mv-peI/' : {
+        'data_name' : 'mvpe_aosc_sims', 'conds' : RDSYMS, 'x_axis' : 'rdsym',
+        'x_label' : 'rdsym', 'peaks' : {'' : (F_RANGE, None)}, 'exp_sign' : -1,
+        'figures' : [
+            ('violin', 'cf', {'title' : 'Center Frequency', 'ylim' : YLIMS_CF,
+                              'yticks' : YTICKS_CF}, 'cf_error'),
+            ('bubbles', 'n_peaks', {'ms_val' : 15}, 'n_peaks_fit'),
+            ('violin', 'exp', {'title' : 'Exponent', 'ylim' : YLIMS_AP}, 'exp_error')]},
+    '06_mv-peII/' : {
+        'data_name' : 'mvpe_apeak_sims', 'conds' : SKEWS, 'x_axis' : 'skew', 'x_label' : 'skew',
+        'peaks' : {'' : (F_RANGE, None)},
+        'figures' : [
+            ('violin', 'cf', {'title' : 'Center Frequency', 'ylim' : [-3.25, 0.6]}, 'cf_error'),
+            ('violin', 'pw', {'title' : 'Power', 'ylim' : YLIMS_PW,
+                              'yticks' : YTICKS_PW}, 'pw_error'),
+            ('bubbles', 'n_peaks', {'ms_val' : 10}, 'n_peaks'),
+            ('violin', 'off', {'title' : 'Offset', 'ylim' : YLIMS_AP}, 'off_error'),
+            ('violin', 'exp', {'title' : 'Exponent', 'ylim' : YLIMS_AP}, 'exp_error'),
+            *MODEL_FIGURES]},
+}
+
+
+def get_figure_data(folder):
+    """Load the saved data for a figure set, and compute the data to plot.
+
+    Parameters
+    ----------
+    folder : str
+        Folder of the figure set, as a key of `FIGURE_SETS`.
+
+    Returns
+    -------
+    data : dict
+        Data to plot, per data label, as used in the figure definitions.
+    """
+
+    fig_set = FIGURE_SETS[folder]
+    conds = fig_set['conds']
+
+    _, _, sim_params = load_sim_data(fig_set['data_name'], folder)
+    fgs = load_model_data(fig_set['data_name'], folder, len(conds))
+    peak_truths, ap_truths = get_ground_truth(sim_params)
+
+    data = {}
+    for label, (f_range, peak_ind) in fig_set['peaks'].items():
+
+        peak_fits, ap_fits, err_fits, r2_fits, n_fit_peaks = get_fit_data(fgs, f_range)
+        data[label + 'n_peaks'] = count_peak_conditions(n_fit_peaks, conds)
+
+        # Peak errors are only defined when comparing to a single simulated peak per spectrum
+        truths = peak_truths if peak_ind is None else peak_truths[:, :, peak_ind, :]
+        if truths.ndim == 3:
+            peak_errors = calc_errors(truths[:, :, 0:3], peak_fits)
+            for ind, param in enumerate(['cf', 'pw', 'bw']):
+                data[label + param] = peak_errors[:, :, ind]
+
+    # Aperiodic errors are compared for the offset & exponent, and knee, if simulated & fit
+    data['off'] = calc_errors(ap_truths[:, :, 0], ap_fits[:, :, 0])
+    data['exp'] = calc_errors(fig_set.get('exp_sign', 1) * ap_truths[:, :, -1], ap_fits[:, :, -1])
+    if ap_truths.shape[-1] == ap_fits.shape[-1] == 3:
+        data['kne'] = calc_errors(ap_truths[:, :, 1], ap_fits[:, :, 1])
+
+    data['err'], data['r2'] = err_fits, r2_fits
+
+    return data
+
+
+def get_figure_summaries(folder, recompute=False):
+    """Get the summaries of the data to plot for a figure set, loading them if cached.
+
+    Parameters
+    ----------
+    folder : str
+        Folder of the figure set, as a key of `FIGURE_SETS`.
+    recompute : bool, optional, default: False
+        Whether to recompute summaries, even if cached.
+
+    Returns
+    -------
+    summaries : dict
+        Summaries of the data to plot, per figure, as used by `render_figure_set`.
+
+    Notes
+    -----
+    Summaries are saved alongside the model fits, and are recomputed if missing
+    or older than the model fits. Violin plots are summarized with `get_violin_summary`,
+    and peak counts as arrays of the (condition, number of fit peaks) pairs & their counts.
+    """
+
+    fig_set = FIGURE_SETS[folder]
+    keys = [_get_summary_key(plot_type, label, plot_kwargs) \
+        for plot_type, label, plot_kwargs, _ in fig_set['figures']]
+
+    summaries = None if recompute else load_summaries(fig_set['data_name'], folder)
+    if summaries is not None and all(key in summaries for key in keys):
+        return summaries
+
+    data = get_figure_data(folder)
+
+    summaries = {}
+    for key, (plot_type, label, plot_kwargs, _) in zip(keys, fig_set['figures']):
+        if plot_type == 'violin':
+            summaries[key] = get_violin_summary(data[label], log=plot_kwargs.get('plt_log', True))
+        else:
+            summaries[key] = {'keys' : np.array(list(data[label].keys())),
+                              'counts' : np.array(list(data[label].values()))}
+
+    save_summaries(fig_set['data_name'], folder, summaries)
+
+    return summaries
+
+
+def _get_summary_key(plot_type, label, plot_kwargs):
+    """Get the key of the summary for a figure, from the data label & whether plotted in log."""
+
+    return label + '_log' if plot_type == 'violin' and plot_kwargs.get('plt_log', True) \
+        else label
+
+
+def render_figure_set(folder):
+    """Render and save all figures of a figure set, reusing a single figure.
+
+    Parameters
+    ----------
+    folder : str
+        Folder of the figure set, as a key of `FIGURE_SETS`.
+
+    Returns
+    -------
+    file_names : list of str
+        Files of the saved figures.
+    """
+
+    fig_set = FIGURE_SETS[folder]
+    summaries = get_figure_summaries(folder)
+
+    sns.set_style('white')
+    os.makedirs(pjoin(FIGS_PATH, folder), exist_ok=True)
+
+    file_names = []
+    fig = plt.figure()
+    try:
+        for plot_type, label, plot_kwargs, save_name in fig_set['figures']:
+
+            # Clear & resize the figure, rather than opening a new one per plot
+            plot_func, figsize = PLOTS[plot_type]
+            fig.clf()
+            fig.set_size_inches(figsize)
+            ax = fig.add_subplot()
+
+            summary = summaries[_get_summary_key(plot_type, label, plot_kwargs)]
+            if plot_type == 'violin':
+                plot_data, axis_kwargs = summary, {'x_axis' : fig_set['x_axis']}
+                plot_kwargs = {key : val for key, val in plot_kwargs.items() if key != 'plt_log'}
+            else:
+                plot_data = Counter({tuple(key) : count for key, count \
+                    in zip(summary['keys'].tolist(), summary['counts'].tolist())})
+                axis_kwargs = {'x_label' : fig_set['x_label']}
+
+            plot_func(plot_data, **axis_kwargs, **plot_kwargs, ax=ax,
+                      save_fig=True, save_name=pjoin(folder, save_name))
+            file_names.append(FIGS_PATH + pjoin(folder, save_name) + SAVE_EXT)
+
+    finally:
+        plt.close(fig)
+
+    return file_names
+
+
+def render_figures(folders=None, n_jobs=1):
+    """Render and save the figures of multiple figure sets, in parallel across figure sets.
+
+    Parameters
+    ----------
+    folders : list of str, optional
+        Folders of the figure sets to render. If not provided, renders all figure sets.
+    n_jobs : int, optional, default: 1
+        Number of processes to run in parallel. -1 uses all available cores.
+
+    Returns
+    -------
+    file_names : list of str
+        Files of the saved figures.
+    """
+
+    folders = list(FIGURE_SETS) if folders is None else folders
+    n_jobs = cpu_count() if n_jobs == -1 else n_jobs
+
+    if n_jobs == 1:
+        outputs = [render_figure_set(folder) for folder in folders]
+    else:
+        with Pool(processes=min(n_jobs, len(folders))) as pool:
+            outputs = pool.map(render_figure_set, folders)
+
+    return [file_name for output in outputs for file_name in output]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Regenerate the figures from saved data.')
+    parser.add_argument('folders', nargs='*', metavar='FOLDER',
+                        help='Figure sets to render, from: ' + ', '.join(FIGURE_SETS))
+    parser.add_argument('--n-jobs', type=int, default=1)
+    args = parser.parse_args()
+
+    for file_name in render_figures(args.folders or None, args.n_jobs):
+        print('Saved: ' + file_name)
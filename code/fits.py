@@ -0,0 +1,304 @@
+"""Model fitting functions for testing FOOOF on simulated data."""
+
+import time
+from functools import partial
+from contextlib import contextmanager
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+from scipy.optimize import curve_fit
+from scipy.stats import ttest_rel
+
+import fooof.objs.fit
+from fooof import FOOOF, FOOOFGroup
+from fooof.utils import trim_spectrum
+
+from settings import FOOOF_SETTINGS
+from baselines import fit_ap_linear_batch
+from analysis import calc_errors
+from profiling import profiled
+
+###################################################################################################
+###################################################################################################
+
+def get_chunks(n_items, chunk_size):
+    """Split a number of items into consecutive chunks.
+
+    Parameters
+    ----------
+    n_items : int
+        Number of items to split.
+    chunk_size : int
+        Maximum number of items per chunk.
+
+    Returns
+    -------
+    chunks : list of slice
+        Slices defining each chunk, in order.
+    """
+
+    return [slice(start, min(start + chunk_size, n_items)) \
+        for start in range(0, n_items, chunk_size)]
+
+
+@profiled(n_items=len)
+def fit_chunk(spectra, freqs, settings=FOOOF_SETTINGS, freq_range=None, warm_start=None):
+    """Fit a chunk of power spectra, returning the fit results.
+
+    Parameters
+    ----------
+    spectra : 2d array
+        Power values, in linear space, with shape as [n_power_spectra, n_freqs].
+    freqs : 1d array
+        Frequency values for the power spectra, in linear space.
+    settings : FOOOFSettings, optional
+        Settings to fit with. Default is `FOOOF_SETTINGS`.
+    freq_range : list of [float, float], optional
+        Desired frequency range to fit. If not provided, fits the entire given range.
+    warm_start : {None, 'linear', 'previous'}, optional
+        How to set the initial guess for the aperiodic fit of each spectrum:
+
+        - None : from the first & last points of each spectrum, as by default in FOOOF
+        - 'linear' : from a batched linear fit of all spectra in log-log space
+        - 'previous' : from the fit of the previous spectrum, with spectra fit in order of
+          their linear fit parameters, such that neighbouring spectra are similar
+
+    Returns
+    -------
+    results : list of FOOOFResults
+        Results of the model fits, in the order of the given spectra.
+    """
+
+    if warm_start is None:
+        fg = FOOOFGroup(*settings, verbose=False)
+        fg.fit(freqs, spectra, freq_range)
+        return fg.group_results
+
+    if warm_start not in ('linear', 'previous'):
+        raise ValueError('Warm start approach not understood.')
+
+    # Use a linear fit in log-log space as an initial estimate of the aperiodic parameters
+    fit_freqs, fit_spectra = trim_spectrum(freqs, spectra, freq_range) if freq_range \
+        else (freqs, spectra)
+    lin_params = fit_ap_linear_batch(fit_freqs, fit_spectra)
+    guesses = np.stack([lin_params[:, 0], np.zeros(len(spectra)), -lin_params[:, 1]], axis=1)
+
+    # For previous fits as guesses, fit in order of exponent & offset estimates
+    if warm_start == 'previous':
+        return _fit_each(spectra, freqs, settings, freq_range, guesses,
+                         order=np.lexsort((guesses[:, 0], guesses[:, 2])), carry_over=True)
+
+    return _fit_each(spectra, freqs, settings, freq_range, guesses)
+
+
+def _fit_each(spectra, freqs, settings=FOOOF_SETTINGS, freq_range=None, guesses=None,
+              order=None, carry_over=False):
+    """Fit power spectra one at a time, with a single FOOOF object.
+
+    If given, `guesses` are the initial aperiodic parameters for each spectrum, otherwise the
+    default initialization is used. Spectra are fit in `order`, if given, and if `carry_over`,
+    the guess for each spectrum after the first is the fit of the previous one.
+    Results are returned in the order of the given spectra.
+    """
+
+    order = np.arange(len(spectra)) if order is None else order
+
+    fm = FOOOF(*settings, verbose=False)
+    results = [None] * len(spectra)
+    guess = guesses[order[0]] if guesses is not None and len(order) else None
+    for ind in order:
+
+        if guesses is not None and not carry_over:
+            guess = guesses[ind]
+
+        if guess is not None:
+            fm._ap_guess = tuple(guess)
+        fm.fit(freqs, spectra[ind], freq_range)
+        results[ind] = fm.get_results()
+
+        # Carry over the fit as the next guess, if it was successful
+        if carry_over and fm.has_model:
+            ap_params = fm.aperiodic_params_
+            guess = [ap_params[0], ap_params[1] if len(ap_params) == 3 else 0, ap_params[-1]]
+
+    return results
+
+
+def fit_models(freqs, psds, settings=FOOOF_SETTINGS, freq_range=None,
+               n_jobs=1, chunk_size=None, warm_start=None):
+    """Fit FOOOF models across a 3d array of power spectra, in parallel across chunks.
+
+    Parameters
+    ----------
+    freqs : 1d array
+        Frequency values for the power spectra, in linear space.
+    psds : 3d array
+        Power values, in linear space, with shape as [n_conditions, n_power_spectra, n_freqs].
+    settings : FOOOFSettings, optional
+        Settings to fit with. Default is `FOOOF_SETTINGS`.
+    freq_range : list of [float, float], optional
+        Desired frequency range to fit. If not provided, fits the entire given range.
+    n_jobs : int, optional, default: 1
+        Number of processes to run in parallel. -1 uses all available cores.
+    chunk_size : int, optional
+        Number of power spectra per work unit. If None, set to give ~4 chunks per process.
+    warm_start : {None, 'linear', 'previous'}, optional
+        How to set the initial guess for the aperiodic fits. See `fit_chunk`.
+
+    Returns
+    -------
+    fgs : list of FOOOFGroup
+        Collected FOOOFGroups after fitting across power spectra, length of n_conditions.
+
+    Notes
+    -----
+    Power spectra are split into consecutive chunks across all conditions, which are fit
+    in a process pool and collected back in input order. Each spectrum is fit independently,
+    so results are the same as fitting serially, for example with `fit_fooof_3d`.
+    """
+
+    n_conds, n_psds, n_freqs = psds.shape
+    n_jobs = cpu_count() if n_jobs == -1 else n_jobs
+
+    if chunk_size is None:
+        chunk_size = max(1, int(np.ceil(n_conds * n_psds / (4 * n_jobs))))
+
+    all_psds = psds.reshape(n_conds * n_psds, n_freqs)
+    chunks = [all_psds[chunk] for chunk in get_chunks(len(all_psds), chunk_size)]
+    fit_func = partial(fit_chunk, freqs=freqs, settings=settings,
+                       freq_range=freq_range, warm_start=warm_start)
+
+    if n_jobs == 1:
+        results = [fit_func(chunk) for chunk in chunks]
+    else:
+        with Pool(processes=n_jobs) as pool:
+            results = pool.map(fit_func, chunks)
+
+    results = [res for chunk_results in results for res in chunk_results]
+
+    fgs = []
+    for ind, cond_psds in enumerate(psds):
+        fgs.append(collect_group(freqs, cond_psds, results[ind * n_psds:(ind + 1) * n_psds],
+                                 settings, freq_range))
+
+    return fgs
+
+
+def collect_group(freqs, psds, results, settings=FOOOF_SETTINGS, freq_range=None):
+    """Collect fit results into a FOOOFGroup object, as if fit with `FOOOFGroup.fit`.
+
+    Parameters
+    ----------
+    freqs : 1d array
+        Frequency values for the power spectra, in linear space.
+    psds : 2d array
+        Power values, in linear space, with shape as [n_power_spectra, n_freqs].
+    results : list of FOOOFResults
+        Results of the model fits for each power spectrum.
+    settings : FOOOFSettings, optional
+        Settings that were used for fitting. Default is `FOOOF_SETTINGS`.
+    freq_range : list of [float, float], optional
+        Frequency range that was fit.
+
+    Returns
+    -------
+    fg : FOOOFGroup
+        Object containing the data and fit results.
+    """
+
+    fg = FOOOFGroup(*settings, verbose=False)
+    fg.add_data(freqs, psds, freq_range)
+    fg.group_results = list(results)
+    fg._reset_data_results(clear_spectrum=True, clear_results=True)
+
+    return fg
+
+
+#### WARM STARTS ####
+
+@contextmanager
+def count_fit_evals():
+    """Count the model function evaluations of FOOOF fits, within the context.
+
+    Yields
+    ------
+    counts : dict
+        Counts of the number of calls to the curve fitting function, as 'n_calls',
+        and the total number of model function evaluations, as 'n_evals'.
+
+    Notes
+    -----
+    This temporarily wraps the curve fitting function used by FOOOF, so only counts
+    fits run in the current process.
+    """
+
+    counts = {'n_calls' : 0, 'n_evals' : 0}
+
+    def counted_curve_fit(*args, **kwargs):
+        popt, pcov, infodict, *_ = curve_fit(*args, full_output=True, **kwargs)
+        counts['n_calls'] += 1
+        counts['n_evals'] += infodict['nfev']
+        return popt, pcov
+
+    fooof.objs.fit.curve_fit = counted_curve_fit
+    try:
+        yield counts
+    finally:
+        fooof.objs.fit.curve_fit = curve_fit
+
+
+def compare_warm_start(freqs, psds, ap_truths, settings=FOOOF_SETTINGS, freq_range=None,
+                       warm_start='linear'):
+    """Compare fitting with & without warm starts, in terms of evaluations, time & errors.
+
+    Parameters
+    ----------
+    freqs : 1d array
+        Frequency values for the power spectra, in linear space.
+    psds : 2d array
+        Power values, in linear space, with shape as [n_power_spectra, n_freqs].
+    ap_truths : 2d array
+        Ground truth aperiodic parameters, with shape as [n_power_spectra, n_ap_params].
+    settings : FOOOFSettings, optional
+        Settings to fit with. Default is `FOOOF_SETTINGS`.
+    freq_range : list of [float, float], optional
+        Desired frequency range to fit. If not provided, fits the entire given range.
+    warm_start : {'linear', 'previous'}
+        Warm start approach to compare to the default initialization.
+
+    Returns
+    -------
+    comparison : dict
+        Comparison of the default ('cold') & warm started fits, with:
+
+        - 'evals_cold', 'evals_warm' : total number of model function evaluations
+        - 'time_cold', 'time_warm' : run time, in seconds
+        - 'errors_cold', 'errors_warm' : mean absolute error of each aperiodic parameter
+        - 'p_values' : p-value of a paired t-test between the errors, for each parameter
+    """
+
+    # Cold fits use the same loop across spectra as warm fits, so only the initial guess differs
+    fit_funcs = [('cold', _fit_each),
+                 ('warm', partial(fit_chunk, warm_start=warm_start))]
+
+    comparison = {}
+    for label, fit_func in fit_funcs:
+
+        with count_fit_evals() as counts:
+            start = time.perf_counter()
+            results = fit_func(psds, freqs, settings, freq_range)
+            comparison['time_' + label] = time.perf_counter() - start
+
+        ap_fits = np.array([res.aperiodic_params for res in results])
+        if ap_fits.shape[1] != ap_truths.shape[1]:
+            ap_fits = ap_fits[:, [0, -1]]
+
+        comparison['evals_' + label] = counts['n_evals']
+        comparison['errors_' + label] = calc_errors(ap_truths, ap_fits)
+
+    comparison['p_values'] = ttest_rel(comparison['errors_cold'], comparison['errors_warm'],
+                                       nan_policy='omit').pvalue
+    for label in ['cold', 'warm']:
+        comparison['errors_' + label] = np.nanmean(comparison['errors_' + label], axis=0)
+
+    return comparison
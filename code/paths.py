@@ -6,6 +6,11 @@
 # Project paths
 DATA_PATH = '../data/'
 FIGS_PATH = '../figures/'
+CACHE_PATH = '../data/cache/'
+BENCH_PATH = '../data/bench/'
+
+# Maximum total size of cached data, in bytes
+CACHE_MAX_SIZE = 10 * 2**30
 
 # Plot file settings
 SAVE_EXT = '.pdf'
@@ -0,0 +1,794 @@
+"""Streaming simulate, fit & score pipeline for testing FOOOF on simulated data."""
+
+import asyncio
+from os.path import join as pjoin
+from itertools import product
+from contextlib import nullcontext
+from functools import partial
+from multiprocessing import Pool, cpu_count
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from settings import FOOOF_SETTINGS, F_RANGE, SWEEP_GRIDS, GRID_DEFAULTS
+from paths import DATA_PATH
+from profiling import profiled, timer, condition
+from sims import (get_rng, spawn_rngs, get_unit_rng, gen_power_vals_batch, sample_ap_defs,
+                  sample_ap_knee_defs, sample_peak_defs, sample_skew_peak_defs)
+from fits import get_chunks, fit_chunk
+from utils import (save_sim_data, load_sim_data, save_model_data, load_model_data,
+                   batch_to_columns, results_to_columns, concat_columns,
+                   load_manifest, save_manifest, get_sim_settings, hash_spec, load_cached,
+                   save_dataset)
+from analysis import (calc_errors, get_band_peaks, get_moments, merge_moments, get_variance,
+                      get_sketch, merge_sketches, get_sketch_quantile, count_peaks_2d)
+
+###################################################################################################
+###################################################################################################
+
+def sim_chunks(n_psds, freqs, ap_func, pe_func, nlv, chunk_size=1000, rng=None):
+    """Generate simulated power spectra for a condition, in chunks.
+
+    Parameters
+    ----------
+    n_psds : int
+        Number of power spectra to simulate.
+    freqs : 1d array
+        Frequency vector to simulate power spectra across.
+    ap_func, pe_func : callable
+        Batch samplers for the aperiodic & peak parameters, called as `func(n_defs, rng=rng)`.
+        For example, `sample_ap_defs` and `partial(sample_peak_defs, n_peaks_to_gen=1)`.
+    nlv : float
+        Noise level to simulate.
+    chunk_size : int, optional, default: 1000
+        Maximum number of power spectra per chunk.
+    rng : int, np.random.SeedSequence or np.random.Generator, optional
+        Seed or generator to simulate with.
+
+    Yields
+    ------
+    chunk : dict
+        Simulated chunk, with 'aperiodic_params', 'peak_params', 'peak_mask', 'nlv' & 'psds'.
+
+    Notes
+    -----
+    Each chunk is simulated with its own generator, spawned from `rng`, such that chunk `k_ind`
+    for an integer seed can be simulated on its own with `get_unit_rng(seed, k_ind)`.
+    """
+
+    chunks = get_chunks(n_psds, chunk_size)
+
+    for cur_chunk, cur_rng in zip(chunks, spawn_rngs(rng, len(chunks))):
+        yield sim_chunk(cur_chunk.stop - cur_chunk.start, freqs, ap_func, pe_func, nlv, cur_rng)
+
+
+def sim_chunk(n_defs, freqs, ap_func, pe_func, nlv, rng=None):
+    """Simulate a single chunk of power spectra for a condition.
+
+    Parameters
+    ----------
+    n_defs : int
+        Number of power spectra to simulate.
+    freqs, ap_func, pe_func, nlv
+        Simulation definition, as in `sim_chunks`.
+    rng : int or np.random.Generator, optional
+        Seed or generator to simulate with.
+
+    Returns
+    -------
+    chunk : dict
+        Simulated chunk, with 'aperiodic_params', 'peak_params', 'peak_mask', 'nlv' & 'psds'.
+    """
+
+    rng = get_rng(rng)
+
+    ap_params = ap_func(n_defs, rng=rng)
+    peak_params, peak_mask = pe_func(n_defs, rng=rng)
+
+    psds = gen_power_vals_batch(freqs, ap_params, peak_params, peak_mask, nlv,
+                                skewed=peak_params.shape[-1] == 4, rng=rng)
+
+    return {'aperiodic_params' : ap_params, 'peak_params' : peak_params,
+            'peak_mask' : peak_mask, 'nlv' : nlv, 'psds' : psds}
+
+
+def fit_chunks(chunks, freqs, settings=FOOOF_SETTINGS, freq_range=None, n_jobs=1):
+    """Fit FOOOF models to chunks of power spectra, adding the results to each chunk.
+
+    Parameters
+    ----------
+    chunks : iterable of dict
+        Chunks of simulated power spectra, as from `sim_chunks`.
+    freqs : 1d array
+        Frequency values for the power spectra, in linear space.
+    settings : FOOOFSettings, optional
+        Settings to fit with. Default is `FOOOF_SETTINGS`.
+    freq_range : list of [float, float], optional
+        Desired frequency range to fit. If not provided, fits the entire given range.
+    n_jobs : int, optional, default: 1
+        Number of processes to fit each chunk with. -1 uses all available cores.
+
+    Yields
+    ------
+    chunk : dict
+        Input chunk, with 'fits' added, as columnar fit results.
+    """
+
+    n_jobs = cpu_count() if n_jobs == -1 else n_jobs
+    fit_func = partial(fit_chunk, freqs=freqs, settings=settings, freq_range=freq_range)
+
+    with Pool(processes=n_jobs) if n_jobs > 1 else nullcontext() as pool:
+
+        for chunk in chunks:
+
+            with timer('fit', n_items=len(chunk['psds'])):
+                if pool:
+                    # Split into at most one part per spectrum, so no process gets an empty part
+                    n_parts = min(n_jobs, len(chunk['psds']))
+                    parts = pool.map(fit_func, np.array_split(chunk['psds'], n_parts))
+                    results = [res for part in parts for res in part]
+                else:
+                    results = fit_func(chunk['psds'])
+
+            chunk['fits'] = results_to_columns(results)
+
+            yield chunk
+
+
+@profiled()
+def score_chunk(chunk, f_range=F_RANGE, approach='abs'):
+    """Calculate errors of the model fits with respect to the ground truth, for a chunk.
+
+    Parameters
+    ----------
+    chunk : dict
+        Chunk of simulated power spectra, with fit results, as from `fit_chunks`.
+    f_range : list of [float, float], optional
+        Frequency range to extract fit peaks from, to compare to single peak simulations.
+    approach : {'abs', 'sqrd'}
+        Error metric to use.
+
+    Returns
+    -------
+    errors : dict of 2d array
+        Errors per spectrum, each with shape [n_psds, n_measures], with keys:
+
+        - 'ap' : aperiodic parameter errors, for each parameter
+        - 'peak' : [CF, PW, BW] errors, only if simulated with a single peak
+        - 'error', 'r_squared' : the model fit error & R^2
+    """
+
+    fits = chunk['fits']
+
+    # If fit with a different aperiodic mode, compare the offset & exponent only
+    ap_truths, ap_fits = chunk['aperiodic_params'], fits['aperiodic_params']
+    if ap_truths.shape[1] != ap_fits.shape[1]:
+        ap_truths, ap_fits = ap_truths[:, [0, -1]], ap_fits[:, [0, -1]]
+
+    errors = {'ap' : calc_errors(ap_truths, ap_fits, approach)}
+
+    if chunk['peak_params'].shape[1] == 1:
+        peak_fits = get_band_peaks(fits['gaussian_params'], fits['peak_offsets'], f_range)
+        errors['peak'] = calc_errors(chunk['peak_params'][:, 0, 0:3], peak_fits, approach)
+
+    errors['error'] = fits['error'][:, None]
+    errors['r_squared'] = fits['r_squared'][:, None]
+
+    return errors
+
+
+def get_chunk_stats(chunk, errors, max_n_peaks):
+    """Compute mergeable summary statistics for a chunk.
+
+    Parameters
+    ----------
+    chunk : dict
+        Chunk of simulated power spectra, with fit results, as from `fit_chunks`.
+    errors : dict of 2d array
+        Errors for the chunk, as from `score_chunk`.
+    max_n_peaks : int
+        Maximum number of peaks, to count simulated & fit peaks up to.
+
+    Returns
+    -------
+    stats : dict
+        Running moments & quantile sketches per error measure,
+        and counts of simulated vs. fit peaks, as 'n_peaks'.
+    """
+
+    stats = {label : {'moments' : get_moments(vals), 'sketch' : get_sketch(vals)} \
+        for label, vals in errors.items()}
+    stats['n_peaks'] = count_peaks_2d(chunk['peak_mask'].sum(1), chunk['fits']['n_peaks'],
+                                      max_n_peaks)
+
+    return stats
+
+
+def merge_stats(stats1, stats2):
+    """Combine the summary statistics from two chunks, or from two sets of chunks."""
+
+    if stats1 is None:
+        return stats2
+
+    merged = {label : {'moments' : merge_moments(stats1[label]['moments'], cur['moments']),
+                       'sketch' : merge_sketches(stats1[label]['sketch'], cur['sketch'])} \
+        for label, cur in stats2.items() if label != 'n_peaks'}
+    merged['n_peaks'] = stats1['n_peaks'] + stats2['n_peaks']
+
+    return merged
+
+
+def summarize_stats(stats):
+    """Summarize statistics, as the number of values, mean, standard deviation & median.
+
+    Parameters
+    ----------
+    stats : dict
+        Summary statistics, as from `get_chunk_stats` and `merge_stats`.
+
+    Returns
+    -------
+    summary : dict
+        Summary per error measure, with 'n', 'mean', 'std' & 'median' per measured parameter,
+        and counts of simulated vs. fit peaks, as 'n_peaks'.
+    """
+
+    summary = {label : {'n' : cur['moments'].n,
+                        'mean' : cur['moments'].mean,
+                        'std' : np.sqrt(get_variance(cur['moments'])),
+                        'median' : get_sketch_quantile(cur['sketch'], 0.5)} \
+        for label, cur in stats.items() if label != 'n_peaks'}
+    summary['n_peaks'] = stats['n_peaks']
+
+    return summary
+
+
+def run_stream(conds, n_psds, freqs, settings=FOOOF_SETTINGS, freq_range=None, f_range=F_RANGE,
+               chunk_size=1000, n_jobs=1, save_name=None, folder=None, rng=None):
+    """Simulate, fit & score power spectra across conditions, in bounded-size chunks.
+
+    Parameters
+    ----------
+    conds : list of dict
+        Condition definitions, each with 'ap_func', 'pe_func' and 'nlv', as used in `sim_chunks`.
+    n_psds : int
+        Number of power spectra to simulate per condition.
+    freqs : 1d array
+        Frequency vector to simulate power spectra across.
+    settings : FOOOFSettings, optional
+        Settings to fit with. Default is `FOOOF_SETTINGS`.
+    freq_range : list of [float, float], optional
+        Desired frequency range to fit. If not provided, fits the entire given range.
+    f_range : list of [float, float], optional
+        Frequency range to extract fit peaks from, for scoring.
+    chunk_size : int, optional, default: 1000
+        Maximum number of power spectra per chunk.
+    n_jobs : int, optional, default: 1
+        Number of processes to fit each chunk with. -1 uses all available cores.
+    save_name, folder : str, optional
+        If provided, each chunk of simulations & fits is saved out, in columnar form.
+    rng : int or np.random.Generator, optional
+        Seed or generator to simulate with.
+
+    Returns
+    -------
+    summaries : list of dict
+        Summary of the errors for each condition, as from `summarize_stats`.
+
+    Notes
+    -----
+    Only one chunk of simulated power spectra & fits is held in memory at a time,
+    such that peak memory is set by `chunk_size`, rather than by `n_psds`.
+    Per-condition statistics are kept as mergeable accumulators, updated per chunk.
+    Each (condition, chunk) is simulated with its own generator, spawned from `rng`.
+    """
+
+    max_n_peaks = settings.max_n_peaks
+
+    summaries = []
+    for c_ind, (cond, cond_rng) in enumerate(zip(conds, spawn_rngs(rng, len(conds)))):
+
+        chunks = sim_chunks(n_psds, freqs, cond['ap_func'], cond['pe_func'], cond['nlv'],
+                            chunk_size, cond_rng)
+
+        # Profiling statistics, if enabled, are collected per condition
+        with condition('cond{}'.format(c_ind)):
+
+            stats = None
+            for k_ind, chunk in enumerate(fit_chunks(chunks, freqs, settings, freq_range, n_jobs)):
+
+                chunk_stats = get_chunk_stats(chunk, score_chunk(chunk, f_range), max_n_peaks)
+                stats = merge_stats(stats, chunk_stats)
+
+                if save_name:
+                    cur_name = '{}_cond{}_chunk{}'.format(save_name, c_ind, k_ind)
+                    sim_params = batch_to_columns(chunk['aperiodic_params'],
+                                                  chunk['peak_params'],
+                                                  chunk['peak_mask'], chunk['nlv'])
+                    save_sim_data(cur_name, folder, freqs, chunk['psds'], sim_params,
+                                  columnar=True)
+                    save_model_data(cur_name, folder, [chunk['fits']], columnar=True)
+
+        summaries.append(summarize_stats(stats))
+
+    return summaries
+
+
+def run_cached(conds, n_psds, freqs, settings=FOOOF_SETTINGS, freq_range=None,
+               n_jobs=1, seed=0):
+    """Simulate & fit power spectra across conditions, reusing cached data where available.
+
+    Parameters
+    ----------
+    conds : list of dict
+        Condition definitions, each with 'ap_func', 'pe_func' and 'nlv', as used in `sim_chunks`.
+    n_psds : int
+        Number of power spectra to simulate per condition.
+    freqs : 1d array
+        Frequency vector to simulate power spectra across.
+    settings : FOOOFSettings, optional
+        Settings to fit with. Default is `FOOOF_SETTINGS`.
+    freq_range : list of [float, float], optional
+        Desired frequency range to fit. If not provided, fits the entire given range.
+    n_jobs : int, optional, default: 1
+        Number of processes to fit with. -1 uses all available cores.
+    seed : int, optional, default: 0
+        Base seed for the simulations.
+
+    Returns
+    -------
+    sims : list of dict
+        Simulated data for each condition, with 'psds' and columnar simulation parameters.
+    fits : list of dict
+        Columnar fit results for each condition.
+
+    Notes
+    -----
+    Simulations are cached per condition, keyed on the condition definition, number of spectra,
+    frequencies, seed and simulation settings. Each condition is simulated with a generator
+    seeded from its key, so is independent of which other conditions are run. Fits are
+    cached keyed on the simulations and fit settings. Changing one condition, such as one
+    noise level, only recomputes that condition, and changing fit settings only refits.
+    """
+
+    sims, fits = [], []
+    for cond in conds:
+
+        sim_spec = {'cond' : cond, 'n_psds' : n_psds, 'freqs' : freqs,
+                    'seed' : seed, 'settings' : get_sim_settings()}
+        sim_key = hash_spec(sim_spec)
+        cur_sims = load_cached(sim_spec, partial(_sim_condition, cond, n_psds, freqs,
+                                                 rng=int(sim_key, 16)))
+
+        fit_spec = {'sims' : sim_key, 'settings' : settings, 'freq_range' : freq_range}
+        cur_fits = load_cached(fit_spec, partial(_fit_condition, cur_sims, freqs, settings,
+                                                 freq_range, n_jobs))
+
+        sims.append(cur_sims)
+        fits.append(cur_fits)
+
+    return sims, fits
+
+
+def _sim_condition(cond, n_psds, freqs, rng):
+    """Simulate all power spectra for a condition, returning them with columnar parameters."""
+
+    chunk = sim_chunk(n_psds, freqs, cond['ap_func'], cond['pe_func'], cond['nlv'], rng)
+
+    sim_data = batch_to_columns(chunk['aperiodic_params'], chunk['peak_params'],
+                                chunk['peak_mask'], chunk['nlv'])
+    sim_data['psds'] = chunk['psds']
+
+    return sim_data
+
+
+def _fit_condition(sim_data, freqs, settings, freq_range, n_jobs):
+    """Fit all power spectra for a condition, returning columnar fit results."""
+
+    chunk = next(fit_chunks([{'psds' : sim_data['psds']}], freqs, settings, freq_range, n_jobs))
+
+    return chunk['fits']
+
+
+#### CHECKPOINTED SWEEPS ####
+
+def run_sweep(conds, n_psds, freqs, save_name, folder, settings=FOOOF_SETTINGS,
+              freq_range=None, chunk_size=1000, n_jobs=1, seed=0):
+    """Simulate & fit a sweep across conditions, checkpointing each (condition, chunk) unit.
+
+    Parameters
+    ----------
+    conds : list of dict
+        Condition definitions, each with 'ap_func', 'pe_func' and 'nlv', as used in `sim_chunks`.
+    n_psds : int
+        Number of power spectra to simulate per condition.
+    freqs : 1d array
+        Frequency vector to simulate power spectra across.
+    save_name, folder : str
+        Name of the sweep, and the folder to save it to, within `DATA_PATH`.
+    settings : FOOOFSettings, optional
+        Settings to fit with. Default is `FOOOF_SETTINGS`.
+    freq_range : list of [float, float], optional
+        Desired frequency range to fit. If not provided, fits the entire given range.
+    chunk_size : int, optional, default: 1000
+        Number of power spectra per checkpointed unit.
+    n_jobs : int, optional, default: 1
+        Number of processes to fit each unit with. -1 uses all available cores.
+    seed : int, optional, default: 0
+        Base seed for the simulations.
+
+    Returns
+    -------
+    keys : list of str
+        Keys of the conditions, in order, which can be used with `load_sweep`.
+
+    Notes
+    -----
+    Each unit is saved, and recorded in the sweep manifest, as soon as it is fit. Re-running
+    with the same arguments, for example after the process is stopped, skips completed units.
+    Conditions are identified by their definition & settings, so new conditions can be
+    appended to an existing sweep, and only the new conditions are simulated & fit.
+    Each unit is simulated with a generator spawned for its condition & chunk index, with the
+    condition seeded from its key, so resumed sweeps give the same results as uninterrupted ones,
+    and the same results as `sim_chunks`, with the integer value of the key as the seed.
+    """
+
+    sweep_path, manifest, units, keys = _plan_sweep(conds, n_psds, freqs, save_name, folder,
+                                                   settings, freq_range, chunk_size, seed)
+
+    chunks = (_sim_unit(freqs, *unit) for unit in units)
+    for chunk in fit_chunks(chunks, freqs, settings, freq_range, n_jobs):
+        _save_unit(chunk, freqs, save_name, folder, sweep_path, manifest)
+
+    return keys
+
+
+def _plan_sweep(conds, n_psds, freqs, save_name, folder, settings, freq_range, chunk_size, seed):
+    """Get the units of a sweep that remain to be run, adding any new conditions to its manifest."""
+
+    sweep_path = pjoin(DATA_PATH, folder, save_name)
+    manifest = load_manifest(sweep_path)
+
+    units, keys = [], []
+    for cond in conds:
+
+        sim_spec = {'cond' : cond, 'n_psds' : n_psds, 'freqs' : freqs, 'seed' : seed,
+                    'chunk_size' : chunk_size, 'settings' : get_sim_settings()}
+        sim_key = hash_spec(sim_spec)
+        key = hash_spec({'sims' : sim_key, 'settings' : settings, 'freq_range' : freq_range})
+        keys.append(key)
+
+        if key not in manifest['conds']:
+            manifest['order'].append(key)
+            manifest['conds'][key] = sim_spec
+            manifest['units'][key] = []
+
+        done = set(manifest['units'][key])
+        units.extend((cond, sim_key, key, k_ind, cur_chunk) for k_ind, cur_chunk \
+            in enumerate(get_chunks(n_psds, chunk_size)) if k_ind not in done)
+
+    save_manifest(sweep_path, manifest)
+
+    return sweep_path, manifest, units, keys
+
+
+def _sim_unit(freqs, cond, sim_key, key, k_ind, cur_chunk):
+    """Simulate a (condition, chunk) unit of a sweep."""
+
+    chunk = sim_chunk(cur_chunk.stop - cur_chunk.start, freqs, cond['ap_func'], cond['pe_func'],
+                      cond['nlv'], get_unit_rng(int(sim_key, 16), k_ind))
+    chunk['unit'] = (key, k_ind)
+
+    return chunk
+
+
+def _save_unit(chunk, freqs, save_name, folder, sweep_path, manifest):
+    """Save a fit (condition, chunk) unit of a sweep, and record it as done in the manifest."""
+
+    key, k_ind = chunk['unit']
+    cur_name = '{}_chunk{}'.format(key, k_ind)
+    sim_params = batch_to_columns(chunk['aperiodic_params'], chunk['peak_params'],
+                                  chunk['peak_mask'], chunk['nlv'])
+    save_sim_data(cur_name, pjoin(folder, save_name), freqs, chunk['psds'], sim_params,
+                  columnar=True)
+    save_model_data(cur_name, pjoin(folder, save_name), [chunk['fits']], columnar=True)
+
+    # Record the unit as done only once all of its data is saved
+    manifest['units'][key].append(k_ind)
+    save_manifest(sweep_path, manifest)
+
+
+def load_sweep(save_name, folder, keys=None, mmap_mode=None):
+    """Load the completed data of a checkpointed sweep.
+
+    Parameters
+    ----------
+    save_name, folder : str
+        Name of the sweep, and the folder it is saved in, within `DATA_PATH`.
+    keys : list of str, optional
+        Keys of the conditions to load, as returned by `run_sweep`.
+        If not provided, loads all conditions, in the order they were added to the sweep.
+    mmap_mode : {None, 'r', 'r+', 'c'}, optional
+        Memory-map mode to load the simulated power spectra with.
+
+    Returns
+    -------
+    freqs : 1d array
+        Frequency vector of the simulated power spectra.
+    psds : list of 2d array
+        Simulated power spectra for each condition.
+    sims : list of dict
+        Columnar simulation parameters for each condition.
+    fits : list of dict
+        Columnar fit results for each condition.
+
+    Notes
+    -----
+    Only completed units are loaded, such that partially completed conditions have fewer spectra.
+    """
+
+    manifest = load_manifest(pjoin(DATA_PATH, folder, save_name))
+    keys = manifest['order'] if keys is None else keys
+
+    freqs, psds, sims, fits = None, [], [], []
+    for key in keys:
+
+        cur_psds, cur_sims, cur_fits = [], [], []
+        for k_ind in sorted(manifest['units'][key]):
+            cur_name = '{}_chunk{}'.format(key, k_ind)
+            freqs, chunk_psds, chunk_sims = load_sim_data(cur_name, pjoin(folder, save_name),
+                                                          mmap_mode)
+            cur_psds.append(chunk_psds)
+            cur_sims.append(chunk_sims)
+            cur_fits.extend(load_model_data(cur_name, pjoin(folder, save_name), 1))
+
+        psds.append(np.concatenate(cur_psds) if cur_psds else np.empty([0, 0]))
+        sims.append(concat_columns(cur_sims) if cur_sims else None)
+        fits.append(concat_columns(cur_fits) if cur_fits else None)
+
+    return freqs, psds, sims, fits
+
+
+#### CONDITION GRIDS ####
+
+def expand_grid(grid):
+    """Expand a condition grid into all combinations of its axis values.
+
+    Parameters
+    ----------
+    grid : dict or str
+        Values per axis, as {axis : values}, or the name of a grid in `SWEEP_GRIDS`.
+        Axes are any of 'nlv', 'n_peaks', 'knee' & 'skew'.
+
+    Returns
+    -------
+    points : list of dict
+        Grid points, each with a value per axis, in order with the last axis varying fastest.
+    """
+
+    grid = SWEEP_GRIDS[grid] if isinstance(grid, str) else grid
+
+    unknown = set(grid) - set(GRID_DEFAULTS)
+    if unknown:
+        raise ValueError('Grid axes not understood: {}.'.format(sorted(unknown)))
+
+    return [dict(zip(grid, values)) for values in product(*grid.values())]
+
+
+def grid_to_cond(point):
+    """Convert a grid point into a condition definition, as used in `sim_chunks`.
+
+    Parameters
+    ----------
+    point : dict
+        Value per axis. Axes that are not given are set from `GRID_DEFAULTS`.
+
+    Returns
+    -------
+    cond : dict
+        Condition definition, with 'ap_func', 'pe_func' and 'nlv'.
+    """
+
+    point = {**GRID_DEFAULTS, **point}
+
+    ap_func = sample_ap_defs if point['knee'] is None \
+        else partial(sample_ap_knee_defs, knee=point['knee'])
+    pe_func = partial(sample_peak_defs, n_peaks_to_gen=point['n_peaks']) \
+        if point['skew'] is None else \
+        partial(sample_skew_peak_defs, skew=point['skew'], n_peaks_to_gen=point['n_peaks'])
+
+    return {'ap_func' : ap_func, 'pe_func' : pe_func, 'nlv' : point['nlv']}
+
+
+def run_grid(grid, n_psds, freqs, settings=FOOOF_SETTINGS, freq_range=None, chunk_size=1000,
+             n_jobs=1, seed=0, save_name=None, folder=None):
+    """Simulate & fit power spectra across all conditions of a grid, as one indexed dataset.
+
+    Parameters
+    ----------
+    grid : dict or str
+        Values per axis, as {axis : values}, or the name of a grid in `SWEEP_GRIDS`.
+    n_psds : int
+        Number of power spectra to simulate per condition.
+    freqs : 1d array
+        Frequency vector to simulate power spectra across.
+    settings : FOOOFSettings, optional
+        Settings to fit with. Default is `FOOOF_SETTINGS`.
+    freq_range : list of [float, float], optional
+        Desired frequency range to fit. If not provided, fits the entire given range.
+    chunk_size : int, optional, default: 1000
+        Number of power spectra per work unit.
+    n_jobs : int, optional, default: 1
+        Number of processes to run work units across. -1 uses all available cores.
+    seed : int, optional, default: 0
+        Base seed for the simulations.
+    save_name, folder : str, optional
+        If provided, the dataset is saved out, as with `save_dataset`.
+
+    Returns
+    -------
+    dataset : dict of array
+        Results across all conditions, with spectra in order of condition, with:
+
+        - 'axes' : names of the grid axes, [n_axes]
+        - 'grid' : value of each axis per condition, with None as NaN, [n_conds, n_axes]
+        - 'cond_index' : index of the condition of each spectrum, [n_spectra]
+        - 'freqs', 'psds' : frequencies & simulated power spectra, [n_spectra, n_freqs]
+        - 'sim_*' : columnar simulation parameters, as from `batch_to_columns`
+        - 'fit_*' : columnar fit results, as from `results_to_columns`
+
+    Notes
+    -----
+    Each (condition, chunk) unit is simulated & fit in a worker, with units dispatched one at
+    a time to free workers, starting with the most costly. Each unit is simulated with a
+    generator spawned for its condition & chunk index, as in `run_sweep`, so results are the
+    same for any number of workers. Knee & skew axes need numeric values for all conditions,
+    such that all conditions have the same number of parameters.
+    """
+
+    points = expand_grid(grid)
+    axes = list(points[0])
+
+    units = []
+    for c_ind, point in enumerate(points):
+
+        cond = grid_to_cond(point)
+        sim_key = hash_spec({'cond' : cond, 'n_psds' : n_psds, 'freqs' : freqs, 'seed' : seed,
+                             'chunk_size' : chunk_size, 'settings' : get_sim_settings()})
+        units.extend((cond, sim_key, c_ind, k_ind, cur_chunk) \
+            for k_ind, cur_chunk in enumerate(get_chunks(n_psds, chunk_size)))
+
+    # Order units by estimated cost, as fitting time grows with the number of peaks
+    cost = lambda unit: (unit[4].stop - unit[4].start) * \
+        (1 + {**GRID_DEFAULTS, **points[unit[2]]}['n_peaks'])
+    units = sorted(units, key=cost, reverse=True)
+
+    run_func = partial(_run_grid_unit, freqs=freqs, settings=settings, freq_range=freq_range)
+    n_jobs = cpu_count() if n_jobs == -1 else n_jobs
+
+    if n_jobs == 1:
+        chunks = [run_func(unit) for unit in units]
+    else:
+        with Pool(processes=n_jobs) as pool:
+            chunks = list(pool.imap_unordered(run_func, units, chunksize=1))
+
+    chunks = sorted(chunks, key=lambda chunk: chunk['unit'])
+
+    sims = concat_columns([batch_to_columns(chunk['aperiodic_params'], chunk['peak_params'],
+                                            chunk['peak_mask'], chunk['nlv']) \
+        for chunk in chunks])
+    fits = concat_columns([chunk['fits'] for chunk in chunks])
+
+    dataset = {
+        'axes' : np.array(axes),
+        'grid' : np.array([[np.nan if point[axis] is None else point[axis] for axis in axes] \
+            for point in points], dtype=float),
+        'cond_index' : np.concatenate([np.full(len(chunk['psds']), chunk['unit'][0]) \
+            for chunk in chunks]),
+        'freqs' : freqs,
+        'psds' : np.concatenate([chunk['psds'] for chunk in chunks]),
+        **{'sim_' + label : data for label, data in sims.items()},
+        **{'fit_' + label : data for label, data in fits.items()},
+    }
+
+    if save_name:
+        save_dataset(save_name, folder, dataset)
+
+    return dataset
+
+
+def _run_grid_unit(unit, freqs, settings, freq_range):
+    """Simulate & fit a (condition, chunk) unit of a grid sweep."""
+
+    cond, sim_key, c_ind, k_ind, cur_chunk = unit
+
+    chunk = _sim_unit(freqs, cond, sim_key, c_ind, k_ind, cur_chunk)
+    chunk['fits'] = _fit_unit(chunk['psds'], freqs, settings, freq_range)
+
+    return chunk
+
+
+#### PIPELINED SWEEPS ####
+
+def run_pipelined(conds, n_psds, freqs, save_name, folder, settings=FOOOF_SETTINGS,
+                  freq_range=None, chunk_size=1000, n_jobs=1, seed=0, max_queued=2):
+    """Simulate, fit & save a checkpointed sweep, with each stage running concurrently.
+
+    Parameters
+    ----------
+    conds, n_psds, freqs, save_name, folder, settings, freq_range, chunk_size, seed
+        Definition of the sweep, as in `run_sweep`.
+    n_jobs : int, optional, default: 1
+        Number of processes to fit units with, each fitting one unit at a time.
+        -1 uses all available cores.
+    max_queued : int, optional, default: 2
+        Maximum number of units waiting between stages, from simulation to fitting,
+        and from fitting to saving.
+
+    Returns
+    -------
+    keys : list of str
+        Keys of the conditions, in order, which can be used with `load_sweep`.
+
+    Notes
+    -----
+    Units are simulated on a thread, fit in a process pool and saved on a writer thread,
+    coordinated with asyncio, such that simulating & saving overlap with fitting, and the total
+    time approaches that of the slowest stage. Stages are connected by bounded queues, so a
+    stage waits when the next one falls behind, and at most `2 * max_queued + n_jobs + 2`
+    units are held in memory. Results, and how they are saved, are the same as `run_sweep`.
+    """
+
+    return asyncio.run(_run_pipelined(conds, n_psds, freqs, save_name, folder, settings,
+                                      freq_range, chunk_size, n_jobs, seed, max_queued))
+
+
+async def _run_pipelined(conds, n_psds, freqs, save_name, folder, settings, freq_range,
+                         chunk_size, n_jobs, seed, max_queued):
+    """Run the stages of a pipelined sweep, as concurrent tasks connected by bounded queues."""
+
+    sweep_path, manifest, units, keys = _plan_sweep(conds, n_psds, freqs, save_name, folder,
+                                                   settings, freq_range, chunk_size, seed)
+
+    loop = asyncio.get_running_loop()
+    n_jobs = cpu_count() if n_jobs == -1 else n_jobs
+    fit_queue, save_queue = asyncio.Queue(max_queued), asyncio.Queue(max_queued)
+
+    with ThreadPoolExecutor(1) as sim_pool, ProcessPoolExecutor(n_jobs) as fit_pool, \
+         ThreadPoolExecutor(1) as save_pool:
+
+        async def simulate():
+            for unit in units:
+                await fit_queue.put(await loop.run_in_executor(sim_pool, _sim_unit, freqs, *unit))
+            for _ in range(n_jobs):
+                await fit_queue.put(None)
+
+        async def fit():
+            chunk = await fit_queue.get()
+            while chunk is not None:
+                chunk['fits'] = await loop.run_in_executor(
+                    fit_pool, _fit_unit, chunk['psds'], freqs, settings, freq_range)
+                await save_queue.put(chunk)
+                chunk = await fit_queue.get()
+
+        async def save():
+            for _ in units:
+                await loop.run_in_executor(save_pool, _save_unit, await save_queue.get(), freqs,
+                                           save_name, folder, sweep_path, manifest)
+
+        # If any stage fails, stop the others, rather than leaving them waiting on the queues
+        tasks = [asyncio.ensure_future(stage) \
+            for stage in [simulate(), save(), *[fit() for _ in range(n_jobs)]]]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return keys
+
+
+def _fit_unit(psds, freqs, settings, freq_range):
+    """Fit the power spectra of a unit of a sweep, returning columnar fit results."""
+
+    return results_to_columns(fit_chunk(psds, freqs, settings, freq_range))
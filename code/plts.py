@@ -1,12 +1,10 @@
-"""Plotting functions for testing FOOOF on simulated data."""
+"""Plotting functions for testing FOOOF on simulated data.
 
-import numpy as np
-from scipy.stats import sem
-
-import seaborn as sns
-import matplotlib.pyplot as plt
+Plotting dependencies are imported when a plotting function is first called, rather than on
+import, so that this module can be imported without loading matplotlib & seaborn.
+"""
 
-from fooof.plts.utils import check_ax
+import numpy as np
 
 from paths import FIGS_PATH, SAVE_EXT
 from settings import NLVS, N_PEAKS, KNEES, SKEWS, RDSYMS
@@ -17,12 +15,16 @@ from settings import NLVS, N_PEAKS, KNEES, SKEWS, RDSYMS
 def get_ax():
     """Helper function for sizing plots"""
 
+    from fooof.plts.utils import check_ax
+
     return check_ax(None, figsize=(6, 5))
 
 
 def plot_single_data(data, title=None, ylabel='Error', ax=None, save_fig=False, save_name=None):
     """Plot a single vector of data in 1-dimensional scatter plot."""
 
+    import matplotlib.pyplot as plt
+
     if not ax:
         _, ax = plt.subplots(figsize=[2, 4])
 
@@ -42,16 +44,20 @@ def plot_single_data(data, title=None, ylabel='Error', ax=None, save_fig=False,
     if save_fig:
 
         save_name = FIGS_PATH + save_name + SAVE_EXT
-        plt.savefig(save_name, bbox_inches='tight')
+        ax.figure.savefig(save_name, bbox_inches='tight')
 
 
-def plot_errors(data, title='Data', avg='mean', err='sem', save_fig=False, save_name=None):
+def plot_errors(data, title='Data', avg='mean', err='sem', ax=None,
+                save_fig=False, save_name=None):
     """Plots errors across distributions of fit data, as central tendency & an error bar."""
 
+    import matplotlib.pyplot as plt
+    from scipy.stats import sem
+
     n_groups = len(data)
 
-    fig = plt.figure(figsize=[4, 5])
-    ax = plt.gca()
+    if not ax:
+        _, ax = plt.subplots(figsize=[4, 5])
 
     if avg == 'mean':
         avg_func = np.nanmean
@@ -60,9 +66,9 @@ def plot_errors(data, title='Data', avg='mean', err='sem', save_fig=False, save_
 
     if err == 'sem': err_func = sem
 
-    plt.errorbar(np.arange(1, n_groups+1), avg_func(data, 1),
-                 xerr=None, yerr=err_func(data, 1), markersize=22,
-                 fmt='.', capsize=10, elinewidth=2, capthick=2)
+    ax.errorbar(np.arange(1, n_groups+1), avg_func(data, 1),
+                xerr=None, yerr=err_func(data, 1), markersize=22,
+                fmt='.', capsize=10, elinewidth=2, capthick=2)
 
     ax.set_xlim([0.5, n_groups+0.5])
 
@@ -77,15 +83,18 @@ def plot_errors(data, title='Data', avg='mean', err='sem', save_fig=False, save_
     if save_fig:
 
         save_name = FIGS_PATH + save_name + SAVE_EXT
-        plt.savefig(save_name, bbox_inches='tight')
+        ax.figure.savefig(save_name, bbox_inches='tight')
 
 
 def plot_errors_violin(data, title=None, x_axis='nlvs', x_ticks=[], y_label=None, yticks=None,
                        plt_log=False, ylim=None, ax=None, save_fig=False, save_name=None):
     """Plots errors across distributions of fit data, as full distributions (as violin plot)."""
 
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+
     if not ax:
-        fig = plt.figure(figsize=[8, 6])
+        _, ax = plt.subplots(figsize=[8, 6])
 
     if plt_log:
 
@@ -101,8 +110,77 @@ def plot_errors_violin(data, title=None, x_axis='nlvs', x_ticks=[], y_label=None
     ax.plot(np.arange(0, data.shape[0]), np.nanmedian(data, 1),
             '.', c='white', ms=20, alpha=1)
 
+    set_violin_labels(ax, data.shape[0], x_axis, x_ticks, plt_log, yticks, ylim,
+                      title, y_label)
+
+    plot_style(ax)
+
+    if save_fig:
+
+        save_name = FIGS_PATH + save_name + SAVE_EXT
+        ax.figure.savefig(save_name, bbox_inches='tight')
+
+
+def plot_violin_summary(summary, title=None, x_axis='nlvs', x_ticks=[], y_label=None,
+                        yticks=None, ylim=None, ax=None, save_fig=False, save_name=None):
+    """Plots distributions of fit data as violin plots, from precomputed distribution summaries.
+
+    Parameters
+    ----------
+    summary : dict of array
+        Summary of the data, per condition, as from `get_violin_summary`.
+        If the summary is in log space, y-tick labels are set in linear values.
+
+    Notes
+    -----
+    This matches the appearance of `plot_errors_violin`, without recomputing densities.
+    """
+
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+
+    if not ax:
+        _, ax = plt.subplots(figsize=[8, 6])
+
+    n_conds = len(summary['density'])
+    color = sns.desaturate('#0c69ff', 0.75)
+
+    # Scale densities so that all violins have the same area, with a maximum half-width of 0.4
+    max_density = np.max(summary['density'], initial=0)
+    widths = 0.4 * summary['density'] / max_density if max_density > 0 \
+        else np.zeros_like(summary['density'])
+
+    for ind in range(n_conds):
+
+        if not summary['n_values'][ind]:
+            continue
+
+        # Draw the density curve, and the inner box: range, interquartile range & median
+        ax.fill_betweenx(summary['grid'][ind], ind - widths[ind], ind + widths[ind],
+                         facecolor=color, edgecolor='0.26', linewidth=2.5)
+        q_min, q_25, q_50, q_75, q_max = summary['quantiles'][ind]
+        ax.vlines(ind, q_min, q_max, color='0.26', linewidth=2.5)
+        ax.vlines(ind, q_25, q_75, color='0.26', linewidth=7.5)
+        ax.plot(ind, q_50, '.', c='white', ms=20, alpha=1)
+
+    ax.set_xlim([-0.5, n_conds - 0.5])
+    set_violin_labels(ax, n_conds, x_axis, x_ticks, bool(summary['log']), yticks, ylim,
+                      title, y_label)
+
+    plot_style(ax)
+
+    if save_fig:
+
+        save_name = FIGS_PATH + save_name + SAVE_EXT
+        ax.figure.savefig(save_name, bbox_inches='tight')
+
+
+def set_violin_labels(ax, n_conds, x_axis='nlvs', x_ticks=[], plt_log=False, yticks=None,
+                      ylim=None, title=None, y_label=None):
+    """Set the ticks & labels of a violin plot of errors across conditions."""
+
     # X-ticks & label for noise levels or # of peaks
-    ax.set_xticks(np.arange(0, data.shape[0]))
+    ax.set_xticks(np.arange(0, n_conds))
     if x_axis == 'nlvs':
         ax.set_xticklabels(NLVS)
         ax.set_xlabel('Noise Levels')
@@ -143,33 +221,33 @@ def plot_errors_violin(data, title=None, x_axis='nlvs', x_ticks=[], y_label=None
         y_label = 'Error'
     ax.set_ylabel(y_label)
 
-    plot_style(ax)
-
-    if save_fig:
-
-        save_name = FIGS_PATH + save_name + SAVE_EXT
-        plt.savefig(save_name, bbox_inches='tight')
-
 
-def plot_n_peaks_bubbles(data, ms_val=10, x_label='n_peaks', save_fig=False, save_name=None):
+def plot_n_peaks_bubbles(data, ms_val=10, x_label='n_peaks', ax=None,
+                         save_fig=False, save_name=None):
     """Plot a comparison plot of # of peaks generated, vs. # of peaks fit.
 
     data : Counter object
     """
 
-    fig = plt.figure(figsize=[6, 6])
-    ax = plt.gca()
+    import matplotlib.pyplot as plt
+
+    if not ax:
+        _, ax = plt.subplots(figsize=[6, 6])
 
     # Create a mapping between condition label and ordinal label for the plt
     conds = {val : ind for ind, val in \
              enumerate(sorted(set([val[0] for val in data.keys()])))}
 
-    # Add data to the plot, plotting as the size of the plotted circle
-    for ke, va in data.items():
-        plt.plot(conds[ke[0]], ke[1], '.', markersize=va/ms_val, color='blue')
+    # Add data to the plot, as a single scatter, with counts as the size of the plotted circles
+    #   Note: scatter sizes are in points^2, so are squared to match a marker size in points
+    keys = list(data.keys())
+    sizes = np.array([data[ke] for ke in keys]) / ms_val
+    ax.scatter([conds[ke[0]] for ke in keys], [ke[1] for ke in keys],
+               s=sizes**2, marker='.', color='blue')
 
     # Label with x-axis with labels using condition labels at ordinal locations
-    plt.xticks(list(conds.values()), list(conds.keys()))
+    ax.set_xticks(list(conds.values()))
+    ax.set_xticklabels(list(conds.keys()))
 
     # Titles & Labels
     ax.set_title('Multiple Peak Fits')
@@ -197,17 +275,24 @@ def plot_n_peaks_bubbles(data, ms_val=10, x_label='n_peaks', save_fig=False, sav
     if save_fig:
 
         save_name = FIGS_PATH + save_name + SAVE_EXT
-        plt.savefig(save_name, bbox_inches='tight')
+        ax.figure.savefig(save_name, bbox_inches='tight')
 
 
-def plot_harmonics(data, title=None, ax=None):
-    """Create a scatter of harmonic frequency mapping."""
+def plot_harmonics(data, title=None, ax=None, rng=None):
+    """Create a scatter of harmonic frequency mapping.
+
+    If provided, `rng` is the seed or generator for the jitter of the x-axis positions,
+    otherwise the global random state is used.
+    """
+
+    import matplotlib.pyplot as plt
 
     if not ax:
         _, ax = plt.subplots(figsize=[2, 4])
 
     # Create x-axis data, with small jitter for visualization purposes
-    x_data = np.ones_like(data) + np.random.normal(0, 0.025, data.shape)
+    rng = np.random if rng is None else np.random.default_rng(rng)
+    x_data = np.ones_like(data) + rng.normal(0, 0.025, data.shape)
 
     # Plot the data
     ax.scatter(x_data, data, s=36, alpha=0.5)
@@ -0,0 +1,314 @@
+"""Lightweight profiling instrumentation for testing FOOOF on simulated data.
+
+Instrumentation is disabled by default, in which case timers & counters do nothing.
+Enable it with `enable()`, then run any code & collect results with `get_report()`.
+"""
+
+import json
+import time
+import resource
+from functools import wraps
+from contextlib import contextmanager, nullcontext
+
+###################################################################################################
+###################################################################################################
+
+# Private instrumentation state: whether enabled, the stack of active timers & current condition
+_STATE = {'enabled' : False, 'stack' : [], 'condition' : 'all'}
+
+# Collected statistics, as {condition : {'stages' : {path : stats}, 'counters' : {name : value}}}
+_STATS = {}
+
+# Methods of the FOOOF object that make up the stages of fitting a model
+FOOOF_STAGES = ['_robust_ap_fit', '_fit_peaks', '_fit_peak_guess', '_drop_peak_cf',
+                '_drop_peak_overlap', '_calc_r_squared', '_calc_error']
+
+_NULL_CONTEXT = nullcontext()
+
+#### STATE ####
+
+def enable(fooof_stages=False):
+    """Enable instrumentation.
+
+    Parameters
+    ----------
+    fooof_stages : bool, optional, default: False
+        Whether to also time the internal stages of FOOOF model fitting.
+    """
+
+    _STATE['enabled'] = True
+    if fooof_stages:
+        instrument_fooof()
+
+
+def disable():
+    """Disable instrumentation, and remove any instrumentation of FOOOF."""
+
+    _STATE['enabled'] = False
+    uninstrument_fooof()
+
+
+def reset():
+    """Clear all collected statistics."""
+
+    _STATS.clear()
+    _STATE['stack'].clear()
+    _STATE['condition'] = 'all'
+
+
+def is_enabled():
+    """Check whether instrumentation is enabled."""
+
+    return _STATE['enabled']
+
+#### TIMERS & COUNTERS ####
+
+def timer(name, n_items=None):
+    """Time a block of code, as a context manager.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage being timed.
+    n_items : int, optional
+        Number of items processed, such as power spectra, to compute a processing rate.
+
+    Returns
+    -------
+    context manager
+        Timing context, or a shared no-op context if instrumentation is disabled.
+
+    Notes
+    -----
+    Timers can be nested, in which case stages are recorded by their full path,
+    as 'outer;inner', which can be used to build a flame-style summary.
+    """
+
+    return _timed(name, n_items) if _STATE['enabled'] else _NULL_CONTEXT
+
+
+@contextmanager
+def _timed(name, n_items=None):
+    """Time a block of code, recording the result for the current path of stages."""
+
+    _STATE['stack'].append(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        path = ';'.join(_STATE['stack'])
+        _STATE['stack'].pop()
+        _record(path, elapsed, n_items)
+
+
+def _record(path, elapsed, n_items=None):
+    """Record the time & number of items for a stage."""
+
+    stages = _get_stats()['stages']
+    stats = stages.setdefault(path, {'calls' : 0, 'time' : 0., 'n_items' : 0})
+    stats['calls'] += 1
+    stats['time'] += elapsed
+    stats['n_items'] += n_items or 0
+
+
+def count(name, value=1):
+    """Increment a counter, such as for the number of bytes written.
+
+    Parameters
+    ----------
+    name : str
+        Name of the counter.
+    value : int or float, optional, default: 1
+        Value to add to the counter.
+    """
+
+    if _STATE['enabled']:
+        counters = _get_stats()['counters']
+        counters[name] = counters.get(name, 0) + value
+
+
+def profiled(name=None, n_items=None):
+    """Decorator to time a function, when instrumentation is enabled.
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the stage. Defaults to the name of the function.
+    n_items : callable, optional
+        Function of the output of the decorated function that returns the number of items
+        processed, such as `len`, to compute a processing rate.
+
+    Returns
+    -------
+    callable
+        Decorator, which when disabled only adds a check of the instrumentation state.
+    """
+
+    def decorator(func):
+
+        label = func.__name__ if name is None else name
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+
+            if not _STATE['enabled']:
+                return func(*args, **kwargs)
+
+            _STATE['stack'].append(label)
+            start = time.perf_counter()
+            try:
+                output = func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                path = ';'.join(_STATE['stack'])
+                _STATE['stack'].pop()
+
+            _record(path, elapsed, n_items(output) if n_items else None)
+
+            return output
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def condition(label):
+    """Attribute statistics collected within the context to a condition, such as a noise level.
+
+    Parameters
+    ----------
+    label : str or float
+        Label of the condition.
+    """
+
+    previous = _STATE['condition']
+    _STATE['condition'] = str(label)
+    try:
+        yield
+    finally:
+        _STATE['condition'] = previous
+
+
+def _get_stats():
+    """Get the statistics for the current condition, updating its peak RSS."""
+
+    stats = _STATS.setdefault(_STATE['condition'], {'stages' : {}, 'counters' : {}})
+
+    # Note: `ru_maxrss` is the peak resident set size of the process so far, in kilobytes
+    stats['peak_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    return stats
+
+#### FOOOF STAGES ####
+
+def instrument_fooof():
+    """Time the internal stages of FOOOF model fitting, by wrapping methods of the FOOOF object."""
+
+    from fooof import FOOOF
+
+    for method in FOOOF_STAGES + ['fit']:
+        if not hasattr(getattr(FOOOF, method), '__wrapped__'):
+            setattr(FOOOF, method, profiled('FOOOF.' + method)(getattr(FOOOF, method)))
+
+
+def uninstrument_fooof():
+    """Remove the timing of the internal stages of FOOOF model fitting."""
+
+    from fooof import FOOOF
+
+    for method in FOOOF_STAGES + ['fit']:
+        if hasattr(getattr(FOOOF, method), '__wrapped__'):
+            setattr(FOOOF, method, getattr(FOOOF, method).__wrapped__)
+
+#### REPORTS ####
+
+def get_report():
+    """Get a report of the collected statistics.
+
+    Returns
+    -------
+    report : dict
+        Statistics per condition, each with:
+
+        - 'stages' : per stage path, the number of 'calls', total 'time' in seconds,
+          'n_items' processed and 'items_per_sec', if items were counted
+        - 'counters' : values of each counter, such as 'bytes_read' & 'bytes_written'
+        - 'peak_rss' : peak resident memory of the process, in bytes
+    """
+
+    report = {}
+    for label, stats in _STATS.items():
+
+        stages = {}
+        for path, cur in stats['stages'].items():
+            stages[path] = dict(cur)
+            if cur['n_items']:
+                stages[path]['items_per_sec'] = cur['n_items'] / max(cur['time'], 1e-12)
+
+        report[label] = {'stages' : stages, 'counters' : dict(stats['counters']),
+                         'peak_rss' : stats['peak_rss']}
+
+    return report
+
+
+def save_report(file_name, report=None):
+    """Save a report of the collected statistics, as a JSON file."""
+
+    with open(file_name, 'w') as f_obj:
+        json.dump(get_report() if report is None else report, f_obj, indent=1)
+
+
+def get_folded(report=None):
+    """Get the stage times in folded stack format, as used by flame graph tools.
+
+    Returns
+    -------
+    list of str
+        Lines of 'condition;outer;inner <microseconds>', with self time per stage.
+    """
+
+    report = get_report() if report is None else report
+
+    lines = []
+    for label, stats in report.items():
+        for path, cur in stats['stages'].items():
+
+            # Subtract time spent in direct child stages, to get self time
+            children = [child for child in stats['stages'] \
+                if child.startswith(path + ';') and child.count(';') == path.count(';') + 1]
+            self_time = cur['time'] - sum(stats['stages'][child]['time'] for child in children)
+
+            lines.append('{};{} {}'.format(label, path, int(max(self_time, 0) * 1e6)))
+
+    return lines
+
+
+def print_summary(report=None, width=40):
+    """Print a flame-style summary of the stage times, as an indented tree with bars.
+
+    Parameters
+    ----------
+    report : dict, optional
+        Report, as from `get_report`. Defaults to the currently collected statistics.
+    width : int, optional, default: 40
+        Width of the bar for the longest stage, in characters.
+    """
+
+    report = get_report() if report is None else report
+
+    for label, stats in report.items():
+
+        print('Condition: {} (peak RSS: {:1.1f} MB)'.format(label, stats['peak_rss'] / 2**20))
+        max_time = max([cur['time'] for cur in stats['stages'].values()] + [1e-12])
+
+        for path in sorted(stats['stages']):
+            cur = stats['stages'][path]
+            name = '  ' * path.count(';') + path.split(';')[-1]
+            rate = ' {:8.1f}/s'.format(cur['items_per_sec']) if 'items_per_sec' in cur else ''
+            print('  {:40s} {:9.4f} s {:6d}x {}{}'.format(
+                name, cur['time'], cur['calls'], '#' * int(width * cur['time'] / max_time), rate))
+
+        for name, value in stats['counters'].items():
+            print('  {:40s} {}'.format(name, value))
@@ -1,6 +1,10 @@
-"""Settings for testing FOOOF on simulated data."""
+"""Settings for testing FOOOF on simulated data.
 
-import pkg_resources
+Data-backed settings, such as `CF_OPTS` & `CF_PROBS`, are loaded lazily, on first access.
+"""
+
+from pathlib import Path
+from functools import lru_cache
 
 import numpy as np
 
@@ -56,9 +60,8 @@ NLV = 0.01
 N_PEAK_OPTS = [0, 1, 2]
 N_PEAK_PROBS = [1/3, 1/3, 1/3]
 
-# Load the distribution of center frequencies to use
-CF_OPTS = np.load(pkg_resources.resource_filename(__name__, 'data/freqs.npy'))
-CF_PROBS = np.load(pkg_resources.resource_filename(__name__, 'data/probs.npy'))
+# The distribution of center frequencies to use, as `CF_OPTS` & `CF_PROBS`, is loaded lazily
+#   from data files: see `get_cf_dist`
 
 # Define the power and bandwidth options and probabilities
 PW_OPTS = [0.15, 0.20, 0.25, 0.4]
@@ -94,3 +97,56 @@ YTICKS_KN = [0.0001, 0.01, 1, 100, 10000]
 YTICKS_CF = [0.0001, 0.001, 0.01, 0.1, 1, 10]
 YTICKS_PW = [0.00001, 0.0001, 0.001, 0.01, 0.1, 1, 10]
 YTICKS_BW = [0.00001, 0.0001, 0.001, 0.01, 0.1, 1, 10]
+
+## SWEEP GRIDS
+
+# Condition grids for sweeps, as values per axis, which are run across all combinations of values
+#   Axes are: 'nlv' (noise level), 'n_peaks' (number of peaks), 'knee' & 'skew' (peak skew)
+SWEEP_GRIDS = {
+    'one_peak' : {'nlv' : NLVS},
+    'multi_peak' : {'n_peaks' : N_PEAKS},
+    'knee' : {'knee' : KNEES},
+    'skew' : {'skew' : SKEWS},
+    'nlv_knee_peaks' : {'nlv' : NLVS, 'knee' : KNEES, 'n_peaks' : N_PEAKS},
+}
+
+# Values for axes that are not part of a grid, where None is no knee, or no skew
+GRID_DEFAULTS = {'nlv' : NLV, 'n_peaks' : 1, 'knee' : None, 'skew' : None}
+
+## LAZY SETTINGS
+
+# Settings which are loaded on first access, from the accessor that loads them & their index
+LAZY_SETTINGS = {'CF_OPTS' : ('get_cf_dist', 0), 'CF_PROBS' : ('get_cf_dist', 1)}
+
+# Public settings, including lazy settings, so that `from settings import *` includes them
+__all__ = [name for name in dir() if name.isupper()] + list(LAZY_SETTINGS)
+
+
+@lru_cache(maxsize=None)
+def get_cf_dist():
+    """Get the distribution of center frequencies to simulate, loading it on first use.
+
+    Returns
+    -------
+    cf_opts, cf_probs : 1d array
+        Center frequency options, and their probabilities, as read-only arrays.
+    """
+
+    data_path = Path(__file__).parent / 'data'
+
+    cf_opts = np.load(data_path / 'freqs.npy')
+    cf_probs = np.load(data_path / 'probs.npy')
+    for arr in (cf_opts, cf_probs):
+        arr.setflags(write=False)
+
+    return cf_opts, cf_probs
+
+
+def __getattr__(name):
+    """Load lazy settings on first access, as module attributes."""
+
+    if name in LAZY_SETTINGS:
+        accessor, ind = LAZY_SETTINGS[name]
+        return globals()[accessor]()[ind]
+
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -1,52 +1,75 @@
 """Simulation functions for testing FOOOF on simulated data."""
 
+from functools import lru_cache
+
 import numpy as np
-from scipy import stats
+from scipy.special import ndtr
+from scipy.signal import welch, oaconvolve
+
+from fooof.data import SimParams
+from fooof.sim.gen import gen_aperiodic, gen_periodic
 
-from fooof.sim.gen import gen_aperiodic, gen_periodic, gen_noise
+from neurodsp.sim import sim_oscillation
+from neurodsp.filt.fir import design_fir_filter
+from neurodsp.filt.utils import infer_passtype
+from neurodsp.utils.data import compute_nsamples
 
-from settings import *
+from settings import (N_PEAK_OPTS, N_PEAK_PROBS, PW_OPTS, PW_PROBS, BW_OPTS, BW_PROBS,
+                      OFF_OPTS, OFF_PROBS, KNE_OPTS, KNE_PROBS, EXP_OPTS, EXP_PROBS, get_cf_dist)
+from profiling import profiled
 
 ###################################################################################################
 ###################################################################################################
 
-def gen_ap_def():
-    """Generator for plausible aperiodic parameters for simulated power spectra."""
+def gen_ap_def(rng=None):
+    """Generator for plausible aperiodic parameters for simulated power spectra.
+
+    If provided, `rng` is the seed or generator to sample with, otherwise the global random
+    state is used.
+    """
+
+    rng = check_rng(rng)
 
     while True:
 
         ap_params = [None, None]
 
-        ap_params[0] = np.random.choice(OFF_OPTS, p=OFF_PROBS)
-        ap_params[1] = np.random.choice(EXP_OPTS, p=EXP_PROBS)
+        ap_params[0] = rng.choice(OFF_OPTS, p=OFF_PROBS)
+        ap_params[1] = rng.choice(EXP_OPTS, p=EXP_PROBS)
 
         yield ap_params
 
 
-def gen_ap_knee_def(knee=None):
+def gen_ap_knee_def(knee=None, rng=None):
     """Generator for plausible aperiodic parameters, with knees, for simulated power spectra.
 
     If provided, `knee` is set at a consistent knee value, otherwise knee is sampled.
+    If provided, `rng` is the seed or generator to sample with, otherwise the global random
+    state is used.
     """
 
+    rng = check_rng(rng)
+
     while True:
 
         ap_params = [None, None, None]
 
-        ap_params[0] = np.random.choice(OFF_OPTS, p=OFF_PROBS)
-        ap_params[1] = knee if knee is not None else np.random.choice(KNE_OPTS, p=KNE_PROBS)
-        ap_params[2] = np.random.choice(EXP_OPTS, p=EXP_PROBS)
+        ap_params[0] = rng.choice(OFF_OPTS, p=OFF_PROBS)
+        ap_params[1] = knee if knee is not None else rng.choice(KNE_OPTS, p=KNE_PROBS)
+        ap_params[2] = rng.choice(EXP_OPTS, p=EXP_PROBS)
 
         yield ap_params
 
 
-def gen_peak_def(n_peaks_to_gen=None):
+def gen_peak_def(n_peaks_to_gen=None, rng=None):
     """Generator for plausible peak parameters for simulated power spectra.
 
     Parameters
     ----------
     n_peaks_to_gen : int, optional
         Number of peaks to generate. If None, picked at random from {0, 1, 2}.
+    rng : int or np.random.Generator, optional
+        Seed or generator to sample with. If None, uses the global random state.
 
     Yields
     ------
@@ -54,25 +77,24 @@ def gen_peak_def(n_peaks_to_gen=None):
         Peak definitions.
     """
 
+    rng = check_rng(rng)
+
     # Generate peak definitions
     while True:
 
         peaks = []
 
         if n_peaks_to_gen is None:
-            n_peaks = np.random.choice(N_PEAK_OPTS, p=N_PEAK_PROBS)
+            n_peaks = rng.choice(N_PEAK_OPTS, p=N_PEAK_PROBS)
         else:
             n_peaks = n_peaks_to_gen
 
         for peak in range(n_peaks):
 
-            cur_cen = np.random.choice(CF_OPTS, p=CF_PROBS)
+            cur_cen = rng.choice(get_cf_dist()[0], p=mask_cf_probs([it[0] for it in peaks]))
 
-            while check_duplicate(cur_cen, [it[0] for it in peaks]):
-                cur_cen = np.random.choice(CF_OPTS, p=CF_PROBS)
-
-            cur_pw = np.random.choice(PW_OPTS, p=PW_PROBS)
-            cur_bw = np.random.choice(BW_OPTS, p=BW_PROBS)
+            cur_pw = rng.choice(PW_OPTS, p=PW_PROBS)
+            cur_bw = rng.choice(BW_OPTS, p=BW_PROBS)
 
             peaks.append([cur_cen, cur_pw, cur_bw])
 
@@ -81,28 +103,34 @@ def gen_peak_def(n_peaks_to_gen=None):
         yield peaks
 
 
-def gen_peak_def_high():
-    """Generator for high frequency peaks."""
+def gen_peak_def_high(rng=None):
+    """Generator for high frequency peaks, sampled with `rng` or the global random state."""
 
+    rng = check_rng(rng)
     high_cf_opts = np.arange(50, 90, 1)
 
     # Generate peak definitions
     while True:
 
-        cur_cen = np.random.choice(high_cf_opts)
-        cur_pw = np.random.choice(PW_OPTS, p=PW_PROBS)
-        cur_bw = np.random.choice(BW_OPTS, p=BW_PROBS)
+        cur_cen = rng.choice(high_cf_opts)
+        cur_pw = rng.choice(PW_OPTS, p=PW_PROBS)
+        cur_bw = rng.choice(BW_OPTS, p=BW_PROBS)
 
         peak = [cur_cen, cur_pw, cur_bw]
 
         yield peak
 
 
-def gen_peaks_both():
-    """Generator for combined peak definition of a low and high peak."""
+def gen_peaks_both(rng=None):
+    """Generator for combined peak definition of a low and high peak.
+
+    If provided, `rng` is the seed or generator to sample with, otherwise the global random
+    state is used. A seed is used to create one generator, shared by both peaks.
+    """
 
-    low_peaks = gen_peak_def(1)
-    high_peaks = gen_peak_def_high()
+    rng = rng if rng is None else get_rng(rng)
+    low_peaks = gen_peak_def(1, rng=rng)
+    high_peaks = gen_peak_def_high(rng=rng)
 
     while True:
 
@@ -131,11 +159,51 @@ def check_duplicate(cur_cen, all_cens, window=2):
 
     if len(all_cens) == 0:
         return False
-    for cen in all_cens:
-        if cur_cen >= cen-window and cur_cen <= cen+window:
-            return True
 
-    return False
+    return bool(np.any(np.abs(np.asarray(all_cens) - cur_cen) <= window))
+
+
+def mask_cf_probs(all_cens, window=2, opts=None, probs=None):
+    """Get center frequency probabilities, excluding options too close to existing peaks.
+
+    Parameters
+    ----------
+    all_cens : list of float
+        List of all existing center frequencies.
+    window : int, optional, default: 2
+        Window, in Hz, around existing peak around which new peaks cannot be added.
+    opts, probs : 1d array, optional
+        Center frequency options and probabilities. If None, uses `CF_OPTS` & `CF_PROBS`.
+
+    Returns
+    -------
+    probs : 1d array
+        Renormalized probabilities, with excluded options set to zero.
+
+    Raises
+    ------
+    ValueError
+        If no center frequency options remain outside of the exclusion window.
+
+    Notes
+    -----
+    Sampling from the masked probabilities is equivalent to redrawing candidates until
+    they pass `check_duplicate`, but without any retries.
+    """
+
+    opts = np.asarray(get_cf_dist()[0] if opts is None else opts, dtype=float)
+    probs = np.asarray(get_cf_dist()[1] if probs is None else probs, dtype=float)
+
+    if len(all_cens) > 0:
+        clash = np.abs(opts[:, None] - np.asarray(all_cens, dtype=float)) <= window
+        probs = np.where(clash.any(1), 0., probs)
+
+    total = probs.sum()
+    if total <= 0:
+        raise ValueError('No center frequency options remain outside a window of '
+                         '{} Hz of the existing peaks: {}.'.format(window, list(all_cens)))
+
+    return probs / total
 
 
 def gen_skew_peak(freqs, cen, height, scale, skew):
@@ -165,10 +233,7 @@ def gen_skew_peak(freqs, cen, height, scale, skew):
     This is done to match the layout of (symmetric) peak parameters.
     """
 
-    ys = stats.skewnorm.pdf(freqs, skew, cen, scale)
-
-    # Scale to (0, 1), then apply power transform
-    ys = (ys / np.abs(ys).max()) * height
+    ys = skew_peak_vals(freqs, [[cen, height, scale, skew]])[0]
 
     return ys
 
@@ -196,18 +261,92 @@ def gen_skew_peaks(freqs, params):
     This is done to match the layout of (symmetric) peak parameters.
     """
 
-    ys = np.zeros_like(freqs)
+    ys = np.zeros(len(freqs))
 
-    for cur_params in params:
-        ys = ys + gen_skew_peak(freqs, *cur_params)
+    if len(params) > 0:
+        np.sum(skew_peak_vals(freqs, params), axis=0, out=ys)
 
     return ys
 
 
+def skew_peak_vals(freqs, params, out=None):
+    """Compute skewed peaks for a batch of peak definitions.
+
+    Parameters
+    ----------
+    freqs : 1d array
+        Frequency vector to create peak values from.
+    params : 2d array
+        Parameter definitions for the skewed peaks, with shape [n_peaks, 4],
+        with each row as [cen, height, scale, skew].
+    out : 2d array, optional
+        Output array, with shape [n_peaks, n_freqs], to write peak values into.
+
+    Returns
+    -------
+    ys : 2d array
+        Values that define each skewed peak, with shape [n_peaks, n_freqs].
+
+    Notes
+    -----
+    This computes the skew normal density directly, as phi(z) * Phi(skew * z),
+    with z = (freqs - cen) / scale. Constant factors are dropped, as each peak is
+    scaled to (0, 1) by its maximum, before being multiplied by its height.
+    """
+
+    cens, hgts, scales, skews = np.asarray(params, dtype=float).T
+    freqs = np.asarray(freqs, dtype=float if out is None else out.dtype)
+
+    ys = np.empty([len(cens), len(freqs)], dtype=freqs.dtype) if out is None else out
+
+    # Compute the skewed CDF term, then the gaussian term, in place
+    np.subtract(freqs, cens[:, None], out=ys)
+    ys /= scales[:, None]
+    cdf = ndtr(ys * skews[:, None])
+    np.square(ys, out=ys)
+    ys *= -0.5
+    np.exp(ys, out=ys)
+    ys *= cdf
+
+    # Scale to (0, 1), then apply power transform
+    maxs = np.abs(ys).max(1)
+    ys *= (hgts / np.where(maxs > 0, maxs, 1.))[:, None]
+
+    return ys
+
+
+def gen_noise_vals(freqs, nlv, rng=None):
+    """Generate noise values for a simulated power spectrum.
+
+    Parameters
+    ----------
+    freqs : 1d array
+        Frequency vector to create noise values for.
+    nlv : float
+        Noise level, as the standard deviation of the noise.
+    rng : int or np.random.Generator, optional
+        Seed or generator to sample with. If None, uses the global random state.
+
+    Returns
+    -------
+    noise : 1d array
+        Noise values.
+
+    Notes
+    -----
+    This matches `fooof.sim.gen.gen_noise`, with an optional explicit random generator.
+    When simulating many spectra, pass the same generator for all of them.
+    """
+
+    return check_rng(rng).normal(0, nlv, len(freqs))
+
+
+@profiled()
 def gen_power_vals_fn(freqs, ap_kwargs, pe_kwargs, noise_kwargs,
                       ap_func=gen_aperiodic,
                       pe_func=gen_periodic,
-                      noise_func=gen_noise):
+                      noise_func=gen_noise_vals,
+                      rng=None):
     """Generate a simulated power spectrum, using the specified functions & parameters.
 
     Parameters
@@ -218,6 +357,8 @@ def gen_power_vals_fn(freqs, ap_kwargs, pe_kwargs, noise_kwargs,
         Dictionaries of parameters for the aperiodic, periodic, and noise components.
     ap_func, pe_func, noise_func : callable
         Functions that define the aperiodic, periodic and noise components.
+    rng : int or np.random.Generator, optional
+        Seed or generator for the noise. If provided, passed to `noise_func` as `rng`.
 
     Returns
     -------
@@ -227,8 +368,915 @@ def gen_power_vals_fn(freqs, ap_kwargs, pe_kwargs, noise_kwargs,
 
     aperiodic = ap_func(freqs, **ap_kwargs)
     peaks = pe_func(freqs, **pe_kwargs)
-    noise = noise_func(freqs, **noise_kwargs)
+    noise = noise_func(freqs, **noise_kwargs) if rng is None \
+        else noise_func(freqs, **noise_kwargs, rng=rng)
 
     powers = np.power(10, aperiodic + peaks + noise)
 
     return powers
+
+
+#### BATCH SAMPLERS ####
+
+def get_rng(rng=None):
+    """Get a random generator to sample parameters with.
+
+    Parameters
+    ----------
+    rng : int or np.random.Generator, optional
+        Seed or generator to use. If None, a generator is seeded from the global random state,
+        such that sampling stays reproducible under `set_random_seed`.
+
+    Returns
+    -------
+    np.random.Generator
+        Random generator object.
+    """
+
+    if rng is None:
+        rng = np.random.randint(np.iinfo(np.int32).max)
+
+    return np.random.default_rng(rng)
+
+
+def check_rng(rng=None):
+    """Get a random generator, or the global random state, to sample single values with.
+
+    Parameters
+    ----------
+    rng : int or np.random.Generator, optional
+        Seed or generator to use. If None, uses the global random state.
+
+    Returns
+    -------
+    np.random.Generator or module
+        Random generator object, or the `np.random` module, which samples from the global
+        random state, such that sampling is set by `set_random_seed`, as in the notebooks.
+    """
+
+    return np.random if rng is None else get_rng(rng)
+
+
+def spawn_rngs(rng, n_rngs):
+    """Spawn independent random generators, such as one per condition or per chunk.
+
+    Parameters
+    ----------
+    rng : int, np.random.SeedSequence or np.random.Generator, optional
+        Seed or generator to spawn from.
+    n_rngs : int
+        Number of generators to spawn.
+
+    Returns
+    -------
+    list of np.random.Generator
+        Random generators, with independent streams.
+
+    Notes
+    -----
+    Generators are spawned with `SeedSequence.spawn`, such that generator `ind` spawned
+    from an integer seed is the same as `get_unit_rng(seed, ind)`.
+    """
+
+    return get_rng(rng).spawn(n_rngs)
+
+
+def get_unit_rng(seed, *unit):
+    """Get the random generator for a unit of work, such as a (condition, chunk).
+
+    Parameters
+    ----------
+    seed : int
+        Base seed.
+    *unit : int
+        Index of the unit, at each level of spawning, such as condition & chunk index.
+
+    Returns
+    -------
+    np.random.Generator
+        Random generator, equal to the one at the given indices of nested calls to
+        `spawn_rngs`, without having to spawn any of the other generators.
+    """
+
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=unit))
+
+
+def make_table(opts, probs=None):
+    """Make a lookup table for sampling from a discrete distribution.
+
+    Parameters
+    ----------
+    opts : list of float
+        Values to sample from.
+    probs : list of float, optional
+        Probabilities of each value. If None, values are equiprobable.
+
+    Returns
+    -------
+    opts, cdf : 1d array
+        Option values and their cumulative probabilities.
+    """
+
+    opts = np.asarray(opts, dtype=float)
+    probs = np.ones(len(opts)) if probs is None else np.asarray(probs, dtype=float)
+
+    cdf = np.cumsum(probs)
+    cdf /= cdf[-1]
+
+    return opts, cdf
+
+
+@lru_cache(maxsize=None)
+def get_tables():
+    """Get the (cached) lookup tables for all the simulation parameter distributions."""
+
+    tables = {
+        'n_peaks' : make_table(N_PEAK_OPTS, N_PEAK_PROBS),
+        'cf' : make_table(*get_cf_dist()),
+        'cf_high' : make_table(np.arange(50, 90, 1)),
+        'pw' : make_table(PW_OPTS, PW_PROBS),
+        'bw' : make_table(BW_OPTS, BW_PROBS),
+        'off' : make_table(OFF_OPTS, OFF_PROBS),
+        'kne' : make_table(KNE_OPTS, KNE_PROBS),
+        'exp' : make_table(EXP_OPTS, EXP_PROBS),
+    }
+
+    return tables
+
+
+def sample_table(table, size, rng):
+    """Sample values from a lookup table, as created by `make_table`.
+
+    Notes
+    -----
+    This follows the same approach as `np.random.choice`, without rebuilding the CDF per call.
+    """
+
+    opts, cdf = table
+    inds = np.searchsorted(cdf, rng.random(size), side='right')
+
+    return opts[np.minimum(inds, len(opts) - 1)]
+
+
+@profiled()
+def sample_ap_defs(n_defs, rng=None):
+    """Sample a batch of aperiodic parameters for simulated power spectra.
+
+    Parameters
+    ----------
+    n_defs : int
+        Number of parameter definitions to sample.
+    rng : int or np.random.Generator, optional
+        Seed or generator to sample with.
+
+    Returns
+    -------
+    ap_params : 2d array
+        Aperiodic parameters, with shape [n_defs, 2], as [offset, exponent].
+
+    Notes
+    -----
+    This is a batch equivalent of `gen_ap_def`, and samples from the same distributions.
+    """
+
+    rng = get_rng(rng)
+    tables = get_tables()
+
+    ap_params = np.empty([n_defs, 2])
+    ap_params[:, 0] = sample_table(tables['off'], n_defs, rng)
+    ap_params[:, 1] = sample_table(tables['exp'], n_defs, rng)
+
+    return ap_params
+
+
+@profiled()
+def sample_ap_knee_defs(n_defs, knee=None, rng=None):
+    """Sample a batch of aperiodic parameters, with knees, for simulated power spectra.
+
+    Parameters
+    ----------
+    n_defs : int
+        Number of parameter definitions to sample.
+    knee : float, optional
+        If provided, the knee is set at this value, otherwise knee is sampled.
+    rng : int or np.random.Generator, optional
+        Seed or generator to sample with.
+
+    Returns
+    -------
+    ap_params : 2d array
+        Aperiodic parameters, with shape [n_defs, 3], as [offset, knee, exponent].
+
+    Notes
+    -----
+    This is a batch equivalent of `gen_ap_knee_def`, and samples from the same distributions.
+    """
+
+    rng = get_rng(rng)
+    tables = get_tables()
+
+    ap_params = np.empty([n_defs, 3])
+    ap_params[:, 0] = sample_table(tables['off'], n_defs, rng)
+    ap_params[:, 1] = knee if knee is not None else sample_table(tables['kne'], n_defs, rng)
+    ap_params[:, 2] = sample_table(tables['exp'], n_defs, rng)
+
+    return ap_params
+
+
+@profiled()
+def sample_cfs(n_defs, n_peaks, window=2, table=None, n_tries=10, rng=None):
+    """Sample a batch of non-overlapping center frequencies.
+
+    Parameters
+    ----------
+    n_defs : int
+        Number of sets of center frequencies to sample.
+    n_peaks : int or 1d array of int
+        Number of center frequencies to sample, in total or per set.
+    window : int, optional, default: 2
+        Window, in Hz, around existing peak around which new peaks cannot be added.
+    table : tuple of (1d array, 1d array), optional
+        Lookup table to sample from, as created by `make_table`.
+        If None, samples from `CF_OPTS` & `CF_PROBS`.
+    n_tries : int, optional, default: 10
+        Maximum number of times to sample any set of center frequencies.
+    rng : int or np.random.Generator, optional
+        Seed or generator to sample with.
+
+    Returns
+    -------
+    cens : 2d array
+        Center frequencies, in order of sampling, with shape [n_defs, max(n_peaks)].
+        Sets with fewer than the max number of peaks are padded with NaN.
+
+    Raises
+    ------
+    ValueError
+        If the requested number of peaks can not be placed with the given window,
+        or if any set can not be placed within `n_tries`.
+
+    Notes
+    -----
+    Each successive peak is sampled from the probabilities masked & renormalized
+    to exclude existing peaks, which is equivalent to the rejection sampling in
+    `gen_peak_def`, without any retries. The cost scales with n_defs * max(n_peaks).
+    For tight packings, earlier peaks can leave no room for later ones, in which case
+    only the sets that ran out of options are sampled again.
+    """
+
+    rng = get_rng(rng)
+    opts, cdf = get_tables()['cf'] if table is None else table
+
+    n_peaks = np.broadcast_to(np.asarray(n_peaks, dtype=int), (n_defs,))
+    max_n_peaks = int(n_peaks.max()) if n_defs else 0
+
+    # Check that the requested number of peaks can be placed at all
+    #   Note: placing the lowest possible option each time gives the maximum number of peaks
+    probs = np.diff(cdf, prepend=0)
+    n_placeable, last = 0, -np.inf
+    for opt in np.sort(opts[probs > 0]):
+        if opt - last > window:
+            n_placeable, last = n_placeable + 1, opt
+    if max_n_peaks > n_placeable:
+        raise ValueError('Can not place {} peaks with a window of {} Hz: at most {} peaks '
+                         'fit within the center frequency options.'.format(
+                             max_n_peaks, window, n_placeable))
+
+    cens = np.full([n_defs, max_n_peaks], np.nan)
+
+    sets = np.arange(n_defs)
+    for _ in range(n_tries):
+        sets = _place_cfs(cens, sets, n_peaks, opts, probs, window, rng)
+        if not len(sets):
+            return cens
+
+    raise ValueError('Could not place {} sets of center frequencies, with a window of {} Hz, '
+                     'within {} tries.'.format(len(sets), window, n_tries))
+
+
+def _place_cfs(cens, sets, n_peaks, opts, probs, window, rng):
+    """Sample center frequencies for the given sets, returning the sets that ran out of options."""
+
+    weights = np.tile(probs, (len(sets), 1))
+    failed = np.zeros(len(sets), dtype=bool)
+
+    for p_ind in range(cens.shape[1]):
+
+        rows = np.flatnonzero((n_peaks[sets] > p_ind) & ~failed)
+        row_cdf = np.cumsum(weights[rows], axis=1)
+
+        # Drop any sets with no options left, to be sampled again from scratch
+        empty = row_cdf[:, -1] <= 0
+        failed[rows[empty]] = True
+        rows, row_cdf = rows[~empty], row_cdf[~empty]
+
+        draws = rng.random(len(rows)) * row_cdf[:, -1]
+        inds = np.minimum((row_cdf <= draws[:, None]).sum(1), len(opts) - 1)
+        cens[sets[rows], p_ind] = opts[inds]
+
+        # Mask out options within the window of the new peaks
+        weights[rows] *= np.abs(opts - cens[sets[rows], p_ind, None]) > window
+
+    cens[sets[failed]] = np.nan
+
+    return sets[failed]
+
+
+@profiled()
+def sample_peak_defs(n_defs, n_peaks_to_gen=None, window=2, rng=None):
+    """Sample a batch of peak parameters for simulated power spectra.
+
+    Parameters
+    ----------
+    n_defs : int
+        Number of parameter definitions to sample.
+    n_peaks_to_gen : int, optional
+        Number of peaks to generate. If None, picked at random from {0, 1, 2}.
+    window : int, optional, default: 2
+        Window, in Hz, around existing peak around which new peaks cannot be added.
+    rng : int or np.random.Generator, optional
+        Seed or generator to sample with.
+
+    Returns
+    -------
+    peak_params : 3d array
+        Peak parameters, with shape [n_defs, max_n_peaks, 3], as [cf, pw, bw].
+        Peaks are sorted by center frequency, with missing peaks padded as NaN.
+    peak_mask : 2d array of bool
+        Mask of which peaks are defined, with shape [n_defs, max_n_peaks].
+
+    Notes
+    -----
+    This is a batch equivalent of `gen_peak_def`, and samples from the same distributions.
+    """
+
+    rng = get_rng(rng)
+    tables = get_tables()
+
+    if n_peaks_to_gen is None:
+        n_peaks = sample_table(tables['n_peaks'], n_defs, rng).astype(int)
+        max_n_peaks = int(max(N_PEAK_OPTS))
+    else:
+        n_peaks = np.full(n_defs, n_peaks_to_gen, dtype=int)
+        max_n_peaks = n_peaks_to_gen
+
+    peak_mask = np.arange(max_n_peaks) < n_peaks[:, None]
+    peak_params = np.full([n_defs, max_n_peaks, 3], np.nan)
+
+    cens = sample_cfs(n_defs, n_peaks, window, rng=rng)
+    peak_params[:, :cens.shape[1], 0] = cens
+
+    for p_ind in range(max_n_peaks):
+
+        rows = np.flatnonzero(peak_mask[:, p_ind])
+        peak_params[rows, p_ind, 1] = sample_table(tables['pw'], len(rows), rng)
+        peak_params[rows, p_ind, 2] = sample_table(tables['bw'], len(rows), rng)
+
+    # Sort peaks by center frequency, matching how simulation parameters are collected
+    order = np.argsort(peak_params[:, :, 0], axis=1)
+    peak_params = np.take_along_axis(peak_params, order[:, :, None], axis=1)
+    peak_mask = np.take_along_axis(peak_mask, order, axis=1)
+
+    return peak_params, peak_mask
+
+
+@profiled()
+def sample_peaks_both(n_defs, rng=None):
+    """Sample a batch of combined peak definitions, of a low and high peak.
+
+    Parameters
+    ----------
+    n_defs : int
+        Number of parameter definitions to sample.
+    rng : int or np.random.Generator, optional
+        Seed or generator to sample with.
+
+    Returns
+    -------
+    peak_params : 3d array
+        Peak parameters, with shape [n_defs, 2, 3], as [cf, pw, bw] for the low & high peak.
+    peak_mask : 2d array of bool
+        Mask of which peaks are defined, with shape [n_defs, 2].
+
+    Notes
+    -----
+    This is a batch equivalent of `gen_peaks_both`, and samples from the same distributions.
+    """
+
+    rng = get_rng(rng)
+    tables = get_tables()
+
+    peak_params = np.empty([n_defs, 2, 3])
+    peak_params[:, 0, :] = sample_peak_defs(n_defs, 1, rng=rng)[0][:, 0, :]
+    peak_params[:, 1, 0] = sample_table(tables['cf_high'], n_defs, rng)
+    peak_params[:, 1, 1] = sample_table(tables['pw'], n_defs, rng)
+    peak_params[:, 1, 2] = sample_table(tables['bw'], n_defs, rng)
+
+    return peak_params, np.ones([n_defs, 2], dtype=bool)
+
+
+@profiled()
+def sample_skew_peak_defs(n_defs, skew, n_peaks_to_gen=1, rng=None):
+    """Sample a batch of peak definitions, for skewed peaks with a given skew.
+
+    Parameters
+    ----------
+    n_defs : int
+        Number of parameter definitions to sample.
+    skew : float
+        Skewness value to set for all peaks.
+    n_peaks_to_gen : int, optional, default: 1
+        Number of peaks to generate, per definition.
+    rng : int or np.random.Generator, optional
+        Seed or generator to sample with.
+
+    Returns
+    -------
+    peak_params : 3d array
+        Peak parameters, with shape [n_defs, n_peaks_to_gen, 4], as [cf, pw, bw, skew].
+    peak_mask : 2d array of bool
+        Mask of which peaks are defined, with shape [n_defs, n_peaks_to_gen].
+    """
+
+    peak_params, peak_mask = sample_peak_defs(n_defs, n_peaks_to_gen, rng=rng)
+    peak_params = np.concatenate([peak_params, np.full(peak_mask.shape + (1, ), skew)], -1)
+
+    return peak_params, peak_mask
+
+
+def to_sim_params(ap_params, peak_params, peak_mask, nlv):
+    """Convert batch parameter definitions to a list of SimParams objects.
+
+    Parameters
+    ----------
+    ap_params : 2d array
+        Aperiodic parameters, with shape [n_defs, n_ap_params].
+    peak_params : 3d array
+        Peak parameters, with shape [n_defs, max_n_peaks, n_peak_params].
+    peak_mask : 2d array of bool
+        Mask of which peaks are defined, with shape [n_defs, max_n_peaks].
+    nlv : float
+        Noise level of the power spectra.
+
+    Returns
+    -------
+    sim_params : list of SimParams
+        Definitions of parameters used for each spectrum, with length of n_defs.
+    """
+
+    return [SimParams(ap.tolist(), peaks[mask].tolist(), nlv) \
+        for ap, peaks, mask in zip(ap_params, peak_params, peak_mask)]
+
+
+#### BATCH SYNTHESIS ####
+
+def count_batch(output):
+    """Count the number of spectra or signals in a batch, as all but the last axis."""
+
+    return int(np.prod(np.shape(output)[:-1]))
+
+
+@profiled(n_items=count_batch)
+def gen_power_vals_batch(freqs, ap_params, peak_params=None, peak_mask=None, nlvs=0.,
+                         skewed=False, dtype=float, out=None, block_size=1024, rng=None):
+    """Generate a batch of simulated power spectra, from stacked parameter arrays.
+
+    Parameters
+    ----------
+    freqs : 1d array
+        Frequency vector to create power values for.
+    ap_params : array
+        Aperiodic parameters, with shape [..., 2] for 'fixed' or [..., 3] for 'knee' spectra.
+    peak_params : array, optional
+        Peak parameters, with shape [..., max_n_peaks, 3] as [cf, pw, bw] for gaussian peaks,
+        or [..., max_n_peaks, 4] as [cen, height, scale, skew] for skewed peaks.
+    peak_mask : array of bool, optional
+        Mask of which peaks are defined, with shape [..., max_n_peaks].
+        If None, peaks with any NaN parameters are treated as undefined.
+    nlvs : float or array, optional, default: 0.
+        Noise level(s), as a single value or with the same leading shape as `ap_params`.
+    skewed : bool, optional, default: False
+        Whether the peak parameters define skewed peaks, as in `gen_skew_peaks`.
+    dtype : dtype, optional, default: float
+        Data type to compute & return power values in. Ignored if `out` is given.
+    out : array, optional
+        Preallocated output array, with shape [..., n_freqs], to write power values into.
+    block_size : int, optional, default: 1024
+        Number of spectra to compute at a time, which bounds the size of temporary arrays.
+    rng : int or np.random.Generator, optional
+        Seed or generator to sample noise with.
+
+    Returns
+    -------
+    powers : array
+        Power values, in linear spacing, with shape [..., n_freqs].
+
+    Notes
+    -----
+    This is a batch equivalent of `gen_power_vals_fn` with the default (or skewed) components:
+    the aperiodic, periodic & noise components are computed across blocks of spectra as
+    2d broadcasts, accumulated in place into the output array.
+    """
+
+    rng = get_rng(rng)
+
+    ap_params = np.asarray(ap_params, dtype=float)
+    lead_shape = ap_params.shape[:-1]
+    n_specs = int(np.prod(lead_shape))
+
+    if out is None:
+        out = np.empty(lead_shape + (len(freqs), ), dtype=dtype)
+    if out.shape != lead_shape + (len(freqs), ) or not out.flags.c_contiguous:
+        raise ValueError('Output array must be contiguous, with a shape matching the parameters.')
+
+    # Collapse all leading dimensions, to work across a 2d array of spectra
+    #   Trailing dimensions are given explicitly, so that empty batches can be reshaped
+    out_2d = out.reshape(n_specs, len(freqs))
+    ap_params = ap_params.reshape(n_specs, ap_params.shape[-1])
+    nlvs = np.broadcast_to(np.asarray(nlvs, dtype=float), lead_shape).reshape(n_specs)
+
+    if peak_params is not None:
+        peak_params = np.asarray(peak_params, dtype=float)
+        peak_params = peak_params.reshape(n_specs, *peak_params.shape[-2:])
+        if peak_mask is None:
+            peak_mask = ~np.isnan(peak_params).any(-1)
+        peak_mask = np.asarray(peak_mask, dtype=bool).reshape(n_specs, peak_params.shape[1])
+
+    freqs = np.asarray(freqs, dtype=out.dtype)
+    scratch = np.empty([min(block_size, n_specs), len(freqs)], dtype=out.dtype)
+
+    for start in range(0, n_specs, block_size):
+
+        block = slice(start, min(start + block_size, n_specs))
+        cur_out = out_2d[block]
+        cur_scratch = scratch[:cur_out.shape[0]]
+
+        gen_aperiodic_batch(freqs, ap_params[block], out=cur_out)
+
+        if peak_params is not None:
+            pe_func = gen_skew_peaks_batch if skewed else gen_periodic_batch
+            pe_func(freqs, peak_params[block], peak_mask[block], out=cur_out, scratch=cur_scratch)
+
+        if np.any(nlvs[block]):
+            rng.standard_normal(dtype=cur_scratch.dtype, out=cur_scratch)
+            cur_scratch *= nlvs[block, None]
+            cur_out += cur_scratch
+
+        np.power(10, cur_out, out=cur_out)
+
+    return out
+
+
+def gen_aperiodic_batch(freqs, ap_params, out):
+    """Generate aperiodic values for a batch of spectra, writing into `out`.
+
+    Parameters
+    ----------
+    freqs : 1d array
+        Frequency vector to create aperiodic values for.
+    ap_params : 2d array
+        Aperiodic parameters, with shape [n_spectra, 2] or [n_spectra, 3].
+    out : 2d array
+        Output array, with shape [n_spectra, n_freqs], which is overwritten.
+
+    Returns
+    -------
+    out : 2d array
+        Aperiodic values, in log10 spacing.
+    """
+
+    offs = ap_params[:, 0, None].astype(out.dtype)
+    exps = ap_params[:, -1, None].astype(out.dtype)
+
+    if ap_params.shape[1] == 2:
+        np.multiply(exps, np.log10(freqs), out=out)
+    else:
+        np.power(freqs, exps, out=out)
+        out += ap_params[:, 1, None].astype(out.dtype)
+        np.log10(out, out=out)
+
+    np.subtract(offs, out, out=out)
+
+    return out
+
+
+def gen_periodic_batch(freqs, peak_params, peak_mask, out, scratch):
+    """Add gaussian peaks for a batch of spectra into `out`.
+
+    Parameters
+    ----------
+    freqs : 1d array
+        Frequency vector to create peak values for.
+    peak_params : 3d array
+        Peak parameters, with shape [n_spectra, max_n_peaks, 3], as [cf, pw, bw].
+    peak_mask : 2d array of bool
+        Mask of which peaks are defined, with shape [n_spectra, max_n_peaks].
+    out : 2d array
+        Output array, with shape [n_spectra, n_freqs], which peak values are added to.
+    scratch : 2d array
+        Temporary array, with the same shape as `out`.
+
+    Returns
+    -------
+    out : 2d array
+        Input values, with peaks added, in log10 spacing.
+    """
+
+    for p_ind in range(peak_params.shape[1]):
+
+        rows = peak_mask[:, p_ind]
+        if not rows.any():
+            continue
+
+        # Use dummy values for undefined peaks, which are then zeroed by their height
+        ctrs, hgts, wids = np.where(rows[:, None], peak_params[:, p_ind, :], 1.).T
+        hgts = np.where(rows, hgts, 0.)
+
+        np.subtract(freqs, ctrs[:, None], out=scratch)
+        np.square(scratch, out=scratch)
+        scratch /= (-2 * wids ** 2)[:, None]
+        np.exp(scratch, out=scratch)
+        scratch *= hgts[:, None]
+        out += scratch
+
+    return out
+
+
+def gen_skew_peaks_batch(freqs, peak_params, peak_mask, out, scratch):
+    """Add skewed peaks for a batch of spectra into `out`.
+
+    Parameters
+    ----------
+    freqs : 1d array
+        Frequency vector to create peak values for.
+    peak_params : 3d array
+        Peak parameters, with shape [n_spectra, max_n_peaks, 4], as [cen, height, scale, skew].
+    peak_mask : 2d array of bool
+        Mask of which peaks are defined, with shape [n_spectra, max_n_peaks].
+    out : 2d array
+        Output array, with shape [n_spectra, n_freqs], which peak values are added to.
+    scratch : 2d array
+        Temporary array, with the same shape as `out`.
+
+    Returns
+    -------
+    out : 2d array
+        Input values, with peaks added.
+    """
+
+    for p_ind in range(peak_params.shape[1]):
+
+        rows = peak_mask[:, p_ind]
+        if not rows.any():
+            continue
+
+        cens, hgts, scales, skews = np.where(rows[:, None], peak_params[:, p_ind, :], 1.).T
+        hgts = np.where(rows, hgts, 0.)
+
+        skew_peak_vals(freqs, np.stack([cens, hgts, scales, skews], 1), out=scratch)
+        out += scratch
+
+    return out
+
+
+#### BATCH TIME SERIES ####
+
+@profiled(n_items=count_batch)
+def sim_combined_batch(n_seconds, fs, exponents, osc_freqs, comp_vars=1, f_range=(1, None),
+                       cycle='sine', rng=None, **cycle_params):
+    """Simulate a batch of combined power law & oscillation time series.
+
+    Parameters
+    ----------
+    n_seconds : float
+        Simulation time, in seconds.
+    fs : float
+        Sampling rate of the simulated signals, in Hz.
+    exponents : 1d array
+        Power law exponent for each signal, of the form P(f)=f^exponent (negative for 1/f).
+    osc_freqs : 1d or 2d array
+        Oscillation frequency for each signal, with shape [n_sims] or [n_sims, n_oscs].
+    comp_vars : float or list of float, optional, default: 1
+        Variance of each component, as [powerlaw, osc1, osc2, ...], or one value for all.
+    f_range : list of [float, float] or None, optional, default: (1, None)
+        Frequency range to filter the power law components, as [f_lo, f_hi], in Hz.
+    cycle : str, optional, default: 'sine'
+        Cycle type for the oscillations, as in `neurodsp.sim.sim_oscillation`.
+    rng : int or np.random.Generator, optional
+        Seed or generator to simulate with.
+    **cycle_params
+        Additional cycle parameters for the oscillations, such as `rdsym` for 'asine'.
+
+    Returns
+    -------
+    sigs : 2d array
+        Simulated time series, with shape [n_sims, n_samples], each with unit variance.
+
+    Notes
+    -----
+    This is a batch equivalent of `neurodsp.sim.sim_combined` with a `sim_powerlaw` and
+    one or more `sim_oscillation` components. Oscillations only depend on their frequency,
+    so are simulated once per unique frequency, and reused across signals.
+    """
+
+    exponents = np.asarray(exponents, dtype=float)
+    osc_freqs = np.asarray(osc_freqs, dtype=float).reshape(len(exponents), -1)
+    comp_vars = np.broadcast_to(comp_vars, 1 + osc_freqs.shape[1])
+
+    sigs = sim_powerlaw_batch(n_seconds, fs, exponents, f_range, comp_vars[0], rng)
+
+    cycle_params = tuple(sorted(cycle_params.items()))
+    for o_ind, cur_var in enumerate(comp_vars[1:]):
+        for freq in np.unique(osc_freqs[:, o_ind]):
+            osc = get_oscillation(n_seconds, fs, freq, cycle, cycle_params)
+            sigs[osc_freqs[:, o_ind] == freq] += np.sqrt(cur_var) * osc
+
+    # Normalize the combined signals, as in `sim_combined`
+    _zscore(sigs)
+
+    return sigs
+
+
+@profiled()
+def sim_powerlaw_batch(n_seconds, fs, exponents, f_range=None, variance=1., rng=None):
+    """Simulate a batch of power law time series, by spectrally rotating white noise.
+
+    Parameters
+    ----------
+    n_seconds : float
+        Simulation time, in seconds.
+    fs : float
+        Sampling rate of the simulated signals, in Hz.
+    exponents : 1d array
+        Power law exponent for each signal, of the form P(f)=f^exponent.
+    f_range : list of [float, float] or None, optional
+        Frequency range to FIR filter the simulated signals, as [f_lo, f_hi], in Hz.
+    variance : float, optional, default: 1.
+        Variance of the simulated signals.
+    rng : int or np.random.Generator, optional
+        Seed or generator to simulate with.
+
+    Returns
+    -------
+    sigs : 2d array
+        Simulated power law time series, with shape [n_sims, n_samples].
+
+    Notes
+    -----
+    This is a batch equivalent of `neurodsp.sim.sim_powerlaw`. Rotation masks & filter kernels
+    are cached, and applied to all signals with one FFT & one convolution call.
+    """
+
+    rng = get_rng(rng)
+    exponents = np.asarray(exponents, dtype=float)
+    n_samples = compute_nsamples(n_seconds, fs)
+
+    # Extend the signals to compensate for the filter edges, which are then dropped
+    kernel = get_filter_kernel(fs, tuple(f_range)) if f_range is not None else None
+    n_total = n_samples + len(kernel) + 1 if kernel is not None else n_samples
+
+    sigs = rng.standard_normal([len(exponents), n_total])
+
+    # Rotate the white noise spectra, using one mask per unique exponent
+    fft_vals = np.fft.rfft(sigs, axis=-1)
+    for exponent in np.unique(exponents):
+        fft_vals[exponents == exponent] *= get_powerlaw_mask(n_total, fs, exponent)
+    sigs = np.fft.irfft(fft_vals, n=n_total, axis=-1)
+    _zscore(sigs)
+
+    if kernel is not None:
+        n_rmv = int(np.ceil(len(kernel) / 2))
+        sigs = oaconvolve(sigs, kernel[None, :], mode='same', axes=-1)[:, n_rmv:-n_rmv]
+
+    _zscore(sigs)
+    sigs *= np.sqrt(variance)
+
+    return sigs
+
+
+@lru_cache(maxsize=64)
+def get_powerlaw_mask(n_samples, fs, exponent):
+    """Get the spectral mask that rotates white noise to a power law, for a real FFT.
+
+    Parameters
+    ----------
+    n_samples : int
+        Number of samples of the signal.
+    fs : float
+        Sampling rate of the signal, in Hz.
+    exponent : float
+        Desired power law exponent, of the form P(f)=f^exponent.
+
+    Returns
+    -------
+    mask : 1d array
+        Mask to apply to the real FFT values, with the DC component left unchanged.
+    """
+
+    freqs = np.fft.rfftfreq(n_samples, 1. / fs)
+
+    mask = np.ones_like(freqs)
+    mask[1:] = freqs[1:] ** (exponent / 2)
+
+    return mask
+
+
+@lru_cache()
+def get_filter_kernel(fs, f_range, n_cycles=3):
+    """Get the FIR filter kernel for a frequency range, as used in `neurodsp.filt.filter_signal`.
+
+    Parameters
+    ----------
+    fs : float
+        Sampling rate, in Hz.
+    f_range : tuple of (float, float)
+        Frequency range to filter, as (f_lo, f_hi), with None for an open side.
+    n_cycles : float, optional, default: 3
+        Length of the filter, as the number of cycles of the lowest frequency.
+
+    Returns
+    -------
+    kernel : 1d array
+        Filter coefficients.
+    """
+
+    return design_fir_filter(fs, infer_passtype(f_range), f_range, n_cycles=n_cycles)
+
+
+@lru_cache(maxsize=256)
+def get_oscillation(n_seconds, fs, freq, cycle='sine', cycle_params=()):
+    """Get a unit variance oscillation, as simulated by `neurodsp.sim.sim_oscillation`.
+
+    Parameters
+    ----------
+    n_seconds : float
+        Simulation time, in seconds.
+    fs : float
+        Sampling rate of the simulated signal, in Hz.
+    freq : float
+        Oscillation frequency, in Hz.
+    cycle : str, optional, default: 'sine'
+        Cycle type.
+    cycle_params : tuple of (str, value), optional
+        Additional cycle parameters, as key-value pairs.
+
+    Returns
+    -------
+    osc : 1d array
+        Simulated oscillation. This is shared across calls, so should not be modified.
+    """
+
+    osc = sim_oscillation(n_seconds, fs, freq, cycle=cycle, **dict(cycle_params))
+    osc.setflags(write=False)
+
+    return osc
+
+
+@profiled(n_items=lambda output: count_batch(output[1]))
+def compute_spectra_welch(sigs, fs, nperseg=None, noverlap=None, f_range=None):
+    """Compute power spectra for a batch of time series, using Welch's method.
+
+    Parameters
+    ----------
+    sigs : 2d array
+        Time series, with shape [n_sims, n_samples].
+    fs : float
+        Sampling rate, in Hz.
+    nperseg : int, optional
+        Length of each segment, in samples. Defaults to 1 second of data.
+    noverlap : int, optional
+        Number of samples to overlap between segments. Defaults to an eighth of a segment,
+        as in `compute_spectrum_welch`.
+    f_range : list of [float, float], optional
+        Frequency range to restrict the power spectra to, inclusive.
+
+    Returns
+    -------
+    freqs : 1d array
+        Frequency values for the power spectra.
+    powers : 2d array
+        Power spectra, with shape [n_sims, n_freqs].
+
+    Notes
+    -----
+    This matches `neurodsp.spectral.compute_spectrum_welch` with the default mean averaging
+    and a hann window, computed across all time series with a single call.
+    """
+
+    nperseg = int(fs) if nperseg is None else int(nperseg)
+    noverlap = int(noverlap) if noverlap is not None else nperseg // 8
+
+    freqs, powers = welch(sigs, fs, window='hann', nperseg=nperseg, noverlap=noverlap, axis=-1)
+
+    if f_range is not None:
+        f_mask = (freqs >= f_range[0]) & (freqs <= f_range[1])
+        freqs, powers = freqs[f_mask], powers[..., f_mask]
+
+    return freqs, powers
+
+
+def _zscore(sigs):
+    """Z-score each time series in a 2d array, in place."""
+
+    sigs -= sigs.mean(axis=-1, keepdims=True)
+    sigs /= sigs.std(axis=-1, keepdims=True)
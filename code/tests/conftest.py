@@ -0,0 +1,7 @@
+"""Configuration for the tests of the project code."""
+
+import sys
+from os.path import dirname, abspath
+
+# Make the project modules, in the parent folder, importable
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
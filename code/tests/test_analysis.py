@@ -0,0 +1,30 @@
+"""Tests for the analysis functions."""
+
+import numpy as np
+
+from analysis import cohens_d, get_moments, merge_moments
+
+###################################################################################################
+###################################################################################################
+
+def test_cohens_d():
+
+    rng = np.random.default_rng(0)
+    d1, d2 = rng.normal(0, 1, 100), rng.normal(0.5, 2, 80)
+
+    expected = (np.mean(d1) - np.mean(d2)) / (np.sqrt((np.std(d1) ** 2 + np.std(d2) ** 2) / 2))
+    assert np.isclose(cohens_d(d1, d2), expected)
+
+    # Check running moments, merged across chunks, match computing from the arrays
+    m1 = merge_moments(get_moments(d1[:40]), get_moments(d1[40:]))
+    assert np.isclose(cohens_d(m1, get_moments(d2)), expected)
+    assert np.isclose(cohens_d(m1, d2), expected)
+
+
+def test_cohens_d_nan():
+
+    d1, d2 = np.array([1, 2, np.nan, 4]), np.array([2, 3, 5, 6])
+
+    # Arrays with NaN values propagate NaN, whereas moments are of the non-NaN values
+    assert np.isnan(cohens_d(d1, d2))
+    assert np.isclose(cohens_d(get_moments(d1), d2), cohens_d(d1[~np.isnan(d1)], d2))
@@ -0,0 +1,56 @@
+"""Tests for the baseline methods."""
+
+import warnings
+
+import numpy as np
+from scipy.optimize import curve_fit
+
+from fooof.core.funcs import linear_function, expo_function
+
+from baselines import fit_ap_linear_batch, fit_ap_knee_batch
+
+###################################################################################################
+###################################################################################################
+
+FREQS = np.arange(1, 100, 0.5)
+
+
+def _sim_knee_powers(n_specs, seed=0):
+    """Simulate power spectra with a knee, with small noise, in linear space."""
+
+    rng = np.random.default_rng(seed)
+    params = np.stack([rng.uniform(0, 2, n_specs), rng.uniform(10, 500, n_specs),
+                       rng.uniform(1, 3, n_specs)], 1)
+    log_powers = np.array([expo_function(FREQS, *cur_params) for cur_params in params])
+
+    return np.power(10, log_powers + rng.normal(0, 0.05, log_powers.shape))
+
+
+def test_fit_ap_linear_batch():
+
+    powers = _sim_knee_powers(50)
+
+    params = fit_ap_linear_batch(FREQS, powers)
+
+    for cur_params, cur_powers in zip(params, powers):
+        popt, _ = curve_fit(linear_function, np.log10(FREQS), np.log10(cur_powers), p0=[0, 0])
+        assert np.allclose(cur_params, popt, atol=1e-6)
+
+
+def test_fit_ap_knee_batch():
+
+    powers = _sim_knee_powers(50)
+
+    params, _ = fit_ap_knee_batch(FREQS, powers)
+
+    for cur_params, cur_powers in zip(params, powers):
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            popt, _ = curve_fit(expo_function, FREQS, np.log10(cur_powers), p0=[0, 0, 0])
+
+        # Check the fits reach the same minimum error, and so the same parameters
+        sse = np.sum((expo_function(FREQS, *cur_params) - np.log10(cur_powers)) ** 2)
+        sse_ref = np.sum((expo_function(FREQS, *popt) - np.log10(cur_powers)) ** 2)
+        assert sse <= sse_ref * (1 + 1e-8)
+        assert np.allclose(cur_params, popt, rtol=1e-3, atol=1e-3)
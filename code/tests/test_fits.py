@@ -0,0 +1,84 @@
+"""Tests for the model fitting functions."""
+
+import numpy as np
+import pytest
+
+from fooof import FOOOFGroup
+from fooof.sim import gen_group_power_spectra
+
+from settings import FOOOF_SETTINGS
+from fits import fit_models, fit_chunk, _fit_each
+
+###################################################################################################
+###################################################################################################
+
+def _sim_psds(n_conds, n_psds, seed=0):
+    """Simulate power spectra, with shape [n_conds, n_psds, n_freqs]."""
+
+    rng = np.random.default_rng(seed)
+
+    psds = []
+    for _ in range(n_conds):
+        ap_params = np.stack([rng.uniform(0, 1, n_psds), rng.uniform(1, 2, n_psds)], 1)
+        pe_params = np.stack([rng.uniform(5, 30, n_psds), rng.uniform(0.2, 1, n_psds),
+                              rng.uniform(1, 3, n_psds)], 1)
+        freqs, cond_psds = gen_group_power_spectra(
+            n_psds, [3, 40], ap_params.tolist(), [[pe] for pe in pe_params.tolist()], 0.01)
+        psds.append(cond_psds)
+
+    return freqs, np.array(psds)
+
+
+def _assert_equal_objs(obj1, obj2):
+    """Check all attributes of two objects are equal, with arrays compared element-wise."""
+
+    assert vars(obj1).keys() == vars(obj2).keys()
+    for attr, val1 in vars(obj1).items():
+        val2 = getattr(obj2, attr)
+        if isinstance(val1, (np.ndarray, float)):
+            assert np.array_equal(val1, val2, equal_nan=True), attr
+        elif attr != 'group_results':
+            assert val1 == val2, attr
+
+
+@pytest.mark.parametrize('freq_range', [None, [4, 35]])
+def test_fit_models(freq_range):
+
+    np.random.seed(0)
+    freqs, psds = _sim_psds(2, 5)
+
+    fgs = fit_models(freqs, psds, FOOOF_SETTINGS, freq_range, n_jobs=2, chunk_size=3)
+
+    for fg, cond_psds in zip(fgs, psds):
+
+        fg_ref = FOOOFGroup(*FOOOF_SETTINGS, verbose=False)
+        fg_ref.fit(freqs, cond_psds, freq_range)
+
+        # Check the fit results, including the state left after fitting, are the same
+        assert len(fg.group_results) == len(fg_ref.group_results)
+        for res, res_ref in zip(fg.group_results, fg_ref.group_results):
+            for val, val_ref in zip(res, res_ref):
+                assert np.array_equal(val, val_ref, equal_nan=True)
+        _assert_equal_objs(fg, fg_ref)
+
+        # Peak parameters are compared in the group results, as with differing numbers of peaks
+        #   per spectrum, `get_params` for peaks fails with numpy >= 1.24 in fooof 1.0
+        for param in ['aperiodic_params', 'error', 'r_squared']:
+            assert np.array_equal(fg.get_params(param), fg_ref.get_params(param), equal_nan=True)
+
+
+@pytest.mark.parametrize('warm_start', ['linear', 'previous'])
+def test_fit_chunk_warm_start(warm_start):
+
+    np.random.seed(0)
+    freqs, psds = _sim_psds(1, 20)
+
+    results_cold = _fit_each(psds[0], freqs)
+    results_warm = fit_chunk(psds[0], freqs, warm_start=warm_start)
+
+    # Check warm started fits are returned in input order, and converge to the same fits
+    assert len(results_warm) == len(results_cold)
+    for res_warm, res_cold in zip(results_warm, results_cold):
+        assert np.allclose(res_warm.aperiodic_params, res_cold.aperiodic_params, atol=1e-4)
+        assert np.allclose(res_warm.peak_params, res_cold.peak_params, atol=1e-3)
+        assert np.isclose(res_warm.r_squared, res_cold.r_squared, atol=1e-6)
@@ -0,0 +1,45 @@
+"""Tests for the streaming pipeline."""
+
+import numpy as np
+
+import pipeline
+from sims import sample_ap_defs, sample_peak_defs
+from fits import fit_chunk
+from pipeline import sim_chunks, fit_chunks
+
+###################################################################################################
+###################################################################################################
+
+def _pe_func(n_defs, rng=None):
+    """Sample definitions with a single peak per spectrum."""
+
+    return sample_peak_defs(n_defs, n_peaks_to_gen=1, rng=rng)
+
+
+def _fit_chunk_nonempty(spectra, **kwargs):
+    """Fit a chunk of power spectra, checking that it is not empty."""
+
+    assert len(spectra) > 0, 'Empty chunk of power spectra sent to be fit.'
+
+    return fit_chunk(spectra, **kwargs)
+
+
+def test_fit_chunks_small_chunks(monkeypatch):
+
+    freqs = np.arange(3, 40, 0.5)
+
+    # Use chunks with fewer spectra than processes, including one with a single spectrum
+    chunks = list(sim_chunks(5, freqs, sample_ap_defs, _pe_func, 0.01, chunk_size=2, rng=0))
+    assert [len(chunk['psds']) for chunk in chunks] == [2, 2, 1]
+
+    monkeypatch.setattr(pipeline, 'fit_chunk', _fit_chunk_nonempty)
+
+    n_jobs = 3
+    fits = [chunk['fits'] for chunk in fit_chunks([dict(chunk) for chunk in chunks], freqs,
+                                                  n_jobs=n_jobs)]
+    expected = [chunk['fits'] for chunk in fit_chunks([dict(chunk) for chunk in chunks], freqs)]
+
+    for fit, exp in zip(fits, expected):
+        assert fit.keys() == exp.keys()
+        for key in exp:
+            assert np.array_equal(fit[key], exp[key], equal_nan=True)
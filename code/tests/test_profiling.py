@@ -0,0 +1,45 @@
+"""Tests for the profiling instrumentation."""
+
+import numpy as np
+
+import profiling
+from sims import gen_power_vals_batch, sim_combined_batch
+
+###################################################################################################
+###################################################################################################
+
+def _get_n_items(stage):
+    """Run with profiling enabled, returning the number of items recorded for a stage."""
+
+    report = profiling.get_report()
+    profiling.disable()
+    profiling.reset()
+
+    return report['all']['stages'][stage]['n_items']
+
+
+def test_n_items_power_vals_batch():
+
+    freqs = np.arange(3, 40, 0.5)
+    ap_params = np.tile([1., 1.], [2, 5, 1])
+    peak_params = np.tile([10., 0.5, 2.], [2, 5, 1, 1])
+
+    profiling.reset()
+    profiling.enable()
+    psds = gen_power_vals_batch(freqs, ap_params, peak_params, rng=0)
+
+    assert psds.shape == (2, 5, len(freqs))
+    assert _get_n_items('gen_power_vals_batch') == 10
+
+
+def test_n_items_combined_batch():
+
+    exps = np.full(3, -1.)
+    cfs = np.full(3, 10.)
+
+    profiling.reset()
+    profiling.enable()
+    sigs = sim_combined_batch(1, 250, exps, cfs, rng=0)
+
+    assert sigs.shape == (3, 250)
+    assert _get_n_items('sim_combined_batch') == 3
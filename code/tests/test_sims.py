@@ -0,0 +1,73 @@
+"""Tests for the simulation functions."""
+
+import numpy as np
+from scipy import stats
+
+from sims import gen_skew_peak, gen_skew_peaks, gen_skew_peaks_batch, gen_power_vals_batch
+
+###################################################################################################
+###################################################################################################
+
+FREQS = np.arange(3, 40, 0.25)
+
+
+def _ref_skew_peak(freqs, cen, height, scale, skew):
+    """Reference skewed peak, computed with the skew normal distribution from scipy."""
+
+    ys = stats.skewnorm.pdf(freqs, skew, cen, scale)
+
+    return (ys / np.abs(ys).max()) * height
+
+
+def _sample_skew_defs(n_defs, seed=0):
+    """Sample random skewed peak definitions, including zero & negative skews."""
+
+    rng = np.random.default_rng(seed)
+    defs = np.stack([rng.uniform(3, 40, n_defs), rng.uniform(0.05, 2, n_defs),
+                     rng.uniform(0.5, 4, n_defs), rng.uniform(-5, 5, n_defs)], 1)
+    defs[:3, 3] = [0., -3., 3.]
+
+    return defs
+
+
+def test_gen_skew_peak():
+
+    for cur_def in _sample_skew_defs(200):
+        assert np.allclose(gen_skew_peak(FREQS, *cur_def), _ref_skew_peak(FREQS, *cur_def),
+                           rtol=1e-10, atol=1e-14)
+
+
+def test_gen_skew_peaks():
+
+    defs = _sample_skew_defs(12)
+
+    for n_peaks in [0, 1, 3]:
+        cur_defs = defs[:n_peaks]
+        expected = sum((_ref_skew_peak(FREQS, *cur_def) for cur_def in cur_defs),
+                       np.zeros(len(FREQS)))
+        assert np.allclose(gen_skew_peaks(FREQS, cur_defs), expected, rtol=1e-10, atol=1e-14)
+
+
+def test_gen_skew_peaks_batch():
+
+    n_specs, max_n_peaks = 50, 3
+    peak_params = _sample_skew_defs(n_specs * max_n_peaks).reshape(n_specs, max_n_peaks, 4)
+    peak_mask = np.random.default_rng(1).random([n_specs, max_n_peaks]) < 0.7
+
+    out = gen_skew_peaks_batch(FREQS, peak_params, peak_mask, np.zeros([n_specs, len(FREQS)]),
+                               np.empty([n_specs, len(FREQS)]))
+
+    for params, mask, ys in zip(peak_params, peak_mask, out):
+        expected = sum((_ref_skew_peak(FREQS, *cur_def) for cur_def in params[mask]),
+                       np.zeros(len(FREQS)))
+        assert np.allclose(ys, expected, rtol=1e-10, atol=1e-14)
+
+
+def test_gen_power_vals_batch_empty():
+
+    for n_params, n_peak_params in [(2, 3), (3, 4)]:
+        for lead_shape in [(0, ), (2, 0)]:
+            psds = gen_power_vals_batch(FREQS, np.empty(lead_shape + (n_params, )),
+                                        np.empty(lead_shape + (2, n_peak_params)), nlvs=0.01,
+                                        skewed=n_peak_params == 4, rng=0)
+            assert psds.shape == lead_shape + (len(FREQS), )
@@ -0,0 +1,91 @@
+"""Tests for the utility functions."""
+
+import os
+import time
+from glob import glob
+from functools import partial
+from multiprocessing import get_context
+
+import numpy as np
+import pytest
+
+from fooof.data import SimParams
+
+import utils
+from utils import (load_cached, hash_spec, save_sim_data, load_sim_data,
+                   sim_params_to_columns, columns_to_sim_params)
+
+###################################################################################################
+###################################################################################################
+
+def _compute(folder, n_procs):
+    """Compute data to cache, once all processes have started computing."""
+
+    open(os.path.join(folder, 'started_{}'.format(os.getpid())), 'w').close()
+    while len(glob(os.path.join(folder, 'started_*'))) < n_procs:
+        time.sleep(0.01)
+
+    return {'data' : np.arange(1e6)}
+
+
+def _load_cached(cache_path, sync_path, n_procs, ind):
+    """Load or compute cached data for a shared specification, in a separate process."""
+
+    data = load_cached({'test' : 'concurrent'}, partial(_compute, sync_path, n_procs),
+                       cache_path=cache_path)
+
+    return np.array_equal(data['data'], np.arange(1e6))
+
+
+def test_load_cached_concurrent(tmp_path):
+
+    cache_path, sync_path = str(tmp_path / 'cache'), str(tmp_path)
+
+    n_procs = 2
+    with get_context('fork').Pool(n_procs) as pool:
+        outs = pool.map(partial(_load_cached, cache_path, sync_path, n_procs), range(n_procs))
+
+    assert all(outs)
+    assert sorted(os.listdir(cache_path)) == \
+        [hash_spec({'test' : 'concurrent'}) + ext for ext in ['.json', '.npz']]
+
+    # Check the cached data is complete & loaded without computing it again
+    data = load_cached({'test' : 'concurrent'}, lambda: {}, cache_path=cache_path)
+    assert np.array_equal(data['data'], np.arange(1e6))
+
+
+SIM_PARAMS = [SimParams([1., 2.], [[10., 0.5, 2.]], 0.01),
+              SimParams([0.5, 1.5], [[8., 0.4, 1.], [20., 0.2, 3.]], 0.02),
+              SimParams([1., 1.], [], 0.)]
+
+
+@pytest.mark.parametrize('sim_params', [SIM_PARAMS, [SIM_PARAMS, SIM_PARAMS[::-1]], []])
+def test_sim_params_columns_round_trip(tmp_path, monkeypatch, sim_params):
+
+    monkeypatch.setattr(utils, 'DATA_PATH', str(tmp_path))
+
+    columns = sim_params_to_columns(sim_params)
+    assert list(columns['peak_offsets'][[0, -1]]) == [0, len(columns['peak_params'])]
+
+    freqs = np.arange(3, 40, 0.5)
+    psds = np.ones(np.shape(columns['nlvs']) + freqs.shape)
+    save_sim_data('sims', '', freqs, psds, sim_params, columnar=True)
+    _, loaded_psds, loaded = load_sim_data('sims', '', mmap_mode='r')
+
+    assert loaded_psds.shape == psds.shape
+    for label, data in columns.items():
+        assert isinstance(loaded[label], np.memmap)
+        assert np.array_equal(loaded[label], data)
+
+    assert columns_to_sim_params(loaded) == sim_params
+
+
+def test_sim_params_to_columns_flat_peaks():
+
+    # Single peaks can be given flat, including alongside spectra with multiple peaks
+    columns = sim_params_to_columns([SimParams([1., 2.], [10., 0.5, 2.], 0.),
+                                     SimParams([1., 2.], [[8., 0.4, 1.], [20., None, 3.]], 0.)])
+
+    assert np.array_equal(columns['peak_offsets'], [0, 1, 3])
+    assert np.array_equal(columns['peak_params'],
+                          [[10., 0.5, 2.], [8., 0.4, 1.], [20., np.nan, 3.]], equal_nan=True)
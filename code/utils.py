@@ -1,17 +1,34 @@
 """Utility & helper functions for testing FOOOF on simulated data."""
 
+import os
+import json
 import pickle
+import hashlib
+import tempfile
+from glob import glob
+from functools import partial
 from os.path import join as pjoin
 
 import numpy as np
 
-from paths import DATA_PATH
+import settings
+from paths import DATA_PATH, CACHE_PATH, CACHE_MAX_SIZE
+from profiling import profiled, count, is_enabled
 
+from fooof.data import SimParams
 from fooof.utils.io import load_fooofgroup
 
 ###################################################################################################
 ###################################################################################################
 
+# Labels of the arrays used to store simulation parameters, in columnar form
+SIM_COLUMNS = ['aperiodic_params', 'peak_params', 'peak_offsets', 'nlvs']
+
+# Names of the settings that define the simulation parameter distributions
+SIM_SETTINGS = ['N_PEAK_OPTS', 'N_PEAK_PROBS', 'CF_OPTS', 'CF_PROBS', 'PW_OPTS', 'PW_PROBS',
+                'BW_OPTS', 'BW_PROBS', 'OFF_OPTS', 'OFF_PROBS', 'KNE_OPTS', 'KNE_PROBS',
+                'EXP_OPTS', 'EXP_PROBS']
+
 def print_settings(opts, probs, param):
     """Print out parameter settings."""
 
@@ -27,43 +44,561 @@ def print_list(lst):
     print(['{:1.4f}'.format(item) for item in lst])
 
 
-def save_sim_data(file_name, folder, freqs, psds, sim_params):
-    """Save out generated simulations & parameter definitions"""
+@profiled()
+def save_sim_data(file_name, folder, freqs, psds, sim_params, columnar=False):
+    """Save out generated simulations & parameter definitions.
+
+    If `columnar`, data is saved as a folder of .npy files, with simulation parameters
+    stored as flat arrays (see `sim_params_to_columns`), which can be memory-mapped on load.
+    """
 
     path_name = pjoin(DATA_PATH, folder, file_name)
 
-    np.savez(path_name + '.npz', freqs, psds)
-    with open(path_name + '.p', 'wb') as f_obj:
-        pickle.dump(sim_params, f_obj)
+    if columnar:
+
+        if not isinstance(sim_params, dict):
+            sim_params = sim_params_to_columns(sim_params)
+
+        os.makedirs(path_name, exist_ok=True)
+        for label, data in [('freqs', freqs), ('psds', psds), *sim_params.items()]:
+            if data is not None:
+                dtype = np.int64 if label == 'peak_offsets' else float
+                np.save(pjoin(path_name, label + '.npy'), np.asarray(data, dtype=dtype))
+        count_bytes('bytes_written', *glob(pjoin(path_name, '*.npy')))
 
+    else:
 
-def load_sim_data(file_name, folder):
-    """Load previously generated simulations & parameter definitions."""
+        np.savez(path_name + '.npz', freqs, psds)
+        with open(path_name + '.p', 'wb') as f_obj:
+            pickle.dump(sim_params, f_obj)
+        count_bytes('bytes_written', path_name + '.npz', path_name + '.p')
+
+
+@profiled()
+def load_sim_data(file_name, folder, mmap_mode=None):
+    """Load previously generated simulations & parameter definitions.
+
+    For data saved as `columnar`, arrays are loaded with `mmap_mode` (for example, 'r'),
+    and simulation parameters are returned as a dictionary of flat arrays.
+    """
 
     path_name = pjoin(DATA_PATH, folder, file_name)
 
+    if os.path.isdir(path_name):
+
+        data = {label : np.load(pjoin(path_name, label + '.npy'), mmap_mode=mmap_mode) \
+            if os.path.exists(pjoin(path_name, label + '.npy')) else None \
+            for label in ['freqs', 'psds'] + SIM_COLUMNS}
+        freqs, psds = data.pop('freqs'), data.pop('psds')
+        count_bytes('bytes_read', *glob(pjoin(path_name, '*.npy')))
+
+        return freqs, psds, data
+
     temp = np.load(path_name + '.npz', allow_pickle=True)
     freqs, psds = temp['arr_0'], temp['arr_1']
     with open(path_name + '.p', 'rb') as f_obj:
         sim_params = pickle.load(f_obj)
+    count_bytes('bytes_read', path_name + '.npz', path_name + '.p')
 
     return freqs, psds, sim_params
 
 
-def save_model_data(file_name, folder, fgs):
-    """Save out model fit data."""
+@profiled()
+def sim_params_to_columns(sim_params):
+    """Convert simulation parameter definitions into flat, columnar arrays.
+
+    Parameters
+    ----------
+    sim_params : list of SimParams or list of list of SimParams
+        Simulation parameters, per spectrum, or per condition and spectrum.
+
+    Returns
+    -------
+    columns : dict of array
+        Simulation parameters, with keys:
+
+        - 'aperiodic_params' : [..., n_ap_params], with the same leading shape as `sim_params`
+        - 'peak_params' : [n_total_peaks, n_peak_params], for all peaks, in order
+        - 'peak_offsets' : [n_spectra + 1], with peaks for spectrum `ind` in
+          `peak_params[peak_offsets[ind]:peak_offsets[ind+1]]`
+        - 'nlvs' : [...], with the same leading shape as `sim_params`
+
+        Undefined values (None) are stored as NaN.
+    """
+
+    if len(sim_params) == 0 or isinstance(sim_params[0], SimParams):
+        lead_shape, all_params = (len(sim_params), ), list(sim_params)
+    else:
+        lead_shape = (len(sim_params), len(sim_params[0]))
+        all_params = [params for cond_params in sim_params for params in cond_params]
+
+    # Empty parameters default to 'fixed' aperiodic parameters & gaussian peaks
+    n_ap = len(all_params[0].aperiodic_params) if all_params else 2
+    aps = np.array([params.aperiodic_params for params in all_params], dtype=float)
+    nlvs = np.array([params.nlv for params in all_params], dtype=float)
+
+    # Convert peaks in one go if all spectra have the same number, otherwise per spectrum
+    all_peaks = [params.periodic_params for params in all_params]
+    try:
+        peaks = np.array(all_peaks, dtype=float)
+        n_pe = peaks.shape[-1] if peaks.size else 3
+        counts = np.full(len(all_peaks), peaks.size // max(len(all_peaks), 1) // n_pe)
+    except ValueError:
+        peaks, n_pe = _ragged_peaks_to_rows(all_peaks)
+        counts = [len(cur) for cur in peaks]
+        peaks = np.concatenate(peaks)
+
+    peak_offsets = np.zeros(len(all_peaks) + 1, dtype=np.int64)
+    np.cumsum(counts, out=peak_offsets[1:])
+
+    columns = {
+        'aperiodic_params' : aps.reshape(*lead_shape, n_ap),
+        'peak_params' : peaks.reshape(-1, n_pe),
+        'peak_offsets' : peak_offsets,
+        'nlvs' : nlvs.reshape(lead_shape),
+    }
+
+    return columns
+
+
+def _ragged_peaks_to_rows(all_peaks):
+    """Convert peak definitions, with differing numbers of peaks per spectrum, to rows.
+
+    Peaks for each spectrum can be given as a list of peaks, or as a single flat peak.
+    Returns the peaks per spectrum, each as an array of rows, and the number of peak parameters.
+    """
+
+    all_peaks = [np.array(cur, dtype=float) for cur in all_peaks]
+    n_pe = next((cur.shape[-1] for cur in all_peaks if cur.size), 3)
+
+    return [cur.reshape(-1, n_pe) for cur in all_peaks], n_pe
+
+
+@profiled()
+def batch_to_columns(ap_params, peak_params, peak_mask, nlvs):
+    """Convert batch parameter definitions, as from the `sample_*` functions, to columnar arrays.
+
+    Parameters
+    ----------
+    ap_params : array
+        Aperiodic parameters, with shape [..., n_ap_params].
+    peak_params : array
+        Peak parameters, with shape [..., max_n_peaks, n_peak_params].
+    peak_mask : array of bool
+        Mask of which peaks are defined, with shape [..., max_n_peaks].
+    nlvs : float or array
+        Noise level(s), as a single value or with the same leading shape as `ap_params`.
+
+    Returns
+    -------
+    columns : dict of array
+        Simulation parameters, as described in `sim_params_to_columns`.
+    """
+
+    n_specs = int(np.prod(peak_mask.shape[:-1]))
+    peak_offsets = np.zeros(n_specs + 1, dtype=np.int64)
+    np.cumsum(peak_mask.reshape(n_specs, -1).sum(1), out=peak_offsets[1:])
+
+    columns = {
+        'aperiodic_params' : np.asarray(ap_params, dtype=float),
+        'peak_params' : peak_params[peak_mask],
+        'peak_offsets' : peak_offsets,
+        'nlvs' : np.broadcast_to(np.asarray(nlvs, dtype=float), ap_params.shape[:-1]).copy(),
+    }
+
+    return columns
+
+
+@profiled()
+def columns_to_sim_params(columns):
+    """Convert columnar simulation parameters, from `sim_params_to_columns`, to SimParams.
+
+    Parameters
+    ----------
+    columns : dict of array
+        Simulation parameters, as flat arrays.
+
+    Returns
+    -------
+    sim_params : list of SimParams or list of list of SimParams
+        Simulation parameters, with the same leading shape as the aperiodic parameters.
+    """
+
+    aps, nlvs = columns['aperiodic_params'], columns['nlvs']
+    peaks, offsets = columns['peak_params'], columns['peak_offsets']
+
+    flat_aps = aps.reshape(-1, aps.shape[-1]).tolist()
+    flat_nlvs = nlvs.reshape(-1).tolist()
+    sim_params = [SimParams(ap, peaks[offsets[ind]:offsets[ind + 1]].tolist(), nlv) \
+        for ind, (ap, nlv) in enumerate(zip(flat_aps, flat_nlvs))]
+
+    if aps.ndim == 3:
+        n_psds = aps.shape[1]
+        sim_params = [sim_params[ind:ind + n_psds] for ind in range(0, len(sim_params), n_psds)]
+
+    return sim_params
+
+
+@profiled()
+def save_model_data(file_name, folder, fgs, columnar=False):
+    """Save out model fit data.
+
+    If `columnar`, fit results are saved as typed arrays per condition (see `fg_to_columns`),
+    instead of as FOOOFGroup JSON files.
+    """
 
     path_name = pjoin(DATA_PATH, folder)
 
     for ind, fg in enumerate(fgs):
-        fg.save(file_name + '_models_' + str(ind), path_name, save_results=True)
+        cur_file = file_name + '_models_' + str(ind)
+        if columnar:
+            results = fg if isinstance(fg, dict) else fg_to_columns(fg)
+            np.savez(pjoin(path_name, cur_file + '.npz'), **results)
+            count_bytes('bytes_written', pjoin(path_name, cur_file + '.npz'))
+        else:
+            fg.save(cur_file, path_name, save_results=True)
+            count_bytes('bytes_written', pjoin(path_name, cur_file + '.json'))
 
 
+@profiled()
 def load_model_data(file_name, folder, n_conds):
-    """Load previously fit model data."""
+    """Load previously fit model data.
+
+    For data saved as `columnar`, fit results are returned as a dictionary of arrays per condition.
+    """
 
     path_name = pjoin(DATA_PATH, folder)
-    fgs = [load_fooofgroup(file_name + '_models_' + str(ind), path_name) \
-        for ind in range(n_conds)]
+
+    fgs = []
+    for ind in range(n_conds):
+        cur_file = file_name + '_models_' + str(ind)
+        if os.path.exists(pjoin(path_name, cur_file + '.npz')):
+            with np.load(pjoin(path_name, cur_file + '.npz')) as data:
+                fgs.append(dict(data))
+            count_bytes('bytes_read', pjoin(path_name, cur_file + '.npz'))
+        else:
+            fgs.append(load_fooofgroup(cur_file, path_name))
+            count_bytes('bytes_read', pjoin(path_name, cur_file + '.json'))
 
     return fgs
+
+
+def save_summaries(file_name, folder, summaries):
+    """Save out distribution summaries, alongside the model fit data they were computed from.
+
+    Summaries are given as a dictionary of summaries per label, as from `get_violin_summary`.
+    """
+
+    path_name = pjoin(DATA_PATH, folder, file_name + '_summaries.npz')
+
+    np.savez(path_name, **{label + '__' + field : values for label, summary \
+        in summaries.items() for field, values in summary.items()})
+    count_bytes('bytes_written', path_name)
+
+
+def load_summaries(file_name, folder):
+    """Load previously saved distribution summaries.
+
+    Returns None if there are no summaries, or if they are older than the model fit data.
+    """
+
+    path_name = pjoin(DATA_PATH, folder, file_name + '_summaries.npz')
+    model_files = glob(pjoin(DATA_PATH, folder, file_name + '_models_*'))
+
+    if not os.path.exists(path_name) or any(os.path.getmtime(model_file) > \
+        os.path.getmtime(path_name) for model_file in model_files):
+        return None
+
+    summaries = {}
+    with np.load(path_name) as data:
+        for key in data.files:
+            label, field = key.rsplit('__', 1)
+            summaries.setdefault(label, {})[field] = data[key]
+    count_bytes('bytes_read', path_name)
+
+    return summaries
+
+
+@profiled()
+def fg_to_columns(fg):
+    """Convert the fit results from a FOOOFGroup into columnar arrays.
+
+    Parameters
+    ----------
+    fg : FOOOFGroup
+        Object with model fit results.
+
+    Returns
+    -------
+    columns : dict of array
+        Fit results, with keys:
+
+        - 'aperiodic_params' : [n_fits, n_ap_params]
+        - 'peak_params', 'gaussian_params' : [n_total_peaks, 3], for all peaks, in order
+        - 'peak_offsets' : [n_fits + 1], with peaks for model `ind` in
+          `peak_params[peak_offsets[ind]:peak_offsets[ind+1]]`
+        - 'error', 'r_squared' : [n_fits]
+        - 'n_peaks' : [n_fits]
+    """
+
+    return results_to_columns(fg.group_results)
+
+
+def results_to_columns(results):
+    """Convert a list of FOOOFResults into columnar arrays, as described in `fg_to_columns`."""
+
+    peaks = [np.asarray(res.peak_params, dtype=float).reshape(-1, 3) for res in results]
+    gauss = [np.asarray(res.gaussian_params, dtype=float).reshape(-1, 3) for res in results]
+    n_peaks = np.array([len(cur) for cur in peaks], dtype=np.int64)
+
+    peak_offsets = np.zeros(len(results) + 1, dtype=np.int64)
+    np.cumsum(n_peaks, out=peak_offsets[1:])
+
+    columns = {
+        'aperiodic_params' : np.array([res.aperiodic_params for res in results], dtype=float),
+        'peak_params' : np.concatenate(peaks) if peaks else np.empty([0, 3]),
+        'gaussian_params' : np.concatenate(gauss) if gauss else np.empty([0, 3]),
+        'peak_offsets' : peak_offsets,
+        'error' : np.array([res.error for res in results], dtype=float),
+        'r_squared' : np.array([res.r_squared for res in results], dtype=float),
+        'n_peaks' : n_peaks,
+    }
+
+    return columns
+
+
+def concat_columns(all_columns):
+    """Concatenate columnar data, such as across chunks, adjusting the peak offsets.
+
+    Parameters
+    ----------
+    all_columns : list of dict of array
+        Columnar simulation parameters or fit results, each with 'peak_offsets'.
+
+    Returns
+    -------
+    columns : dict of array
+        Concatenated data, with peak offsets indexing into the concatenated peak arrays.
+    """
+
+    columns = {}
+    for label in all_columns[0]:
+        if label == 'peak_offsets':
+            starts = np.cumsum([0] + [cur[label][-1] for cur in all_columns[:-1]])
+            columns[label] = np.concatenate([[0]] + [cur[label][1:] + start \
+                for cur, start in zip(all_columns, starts)]).astype(np.int64)
+        else:
+            columns[label] = np.concatenate([cur[label] for cur in all_columns])
+
+    return columns
+
+
+def count_bytes(counter, *file_names):
+    """Add the total size of a set of files to a profiling counter, if profiling is enabled."""
+
+    if is_enabled():
+        count(counter, sum(os.path.getsize(file_name) for file_name in file_names))
+
+
+def save_dataset(file_name, folder, dataset):
+    """Save out a dataset of named arrays, as a folder of .npy files, which can be memory-mapped."""
+
+    path_name = pjoin(DATA_PATH, folder, file_name)
+
+    os.makedirs(path_name, exist_ok=True)
+    for label, data in dataset.items():
+        np.save(pjoin(path_name, label + '.npy'), np.asarray(data))
+    count_bytes('bytes_written', *[pjoin(path_name, label + '.npy') for label in dataset])
+
+
+def load_dataset(file_name, folder, mmap_mode=None):
+    """Load a previously saved dataset of named arrays, with arrays loaded with `mmap_mode`."""
+
+    path_name = pjoin(DATA_PATH, folder, file_name)
+
+    dataset = {os.path.basename(file)[:-4] : np.load(file, mmap_mode=mmap_mode) \
+        for file in sorted(glob(pjoin(path_name, '*.npy')))}
+    count_bytes('bytes_read', *glob(pjoin(path_name, '*.npy')))
+
+    return dataset
+
+
+def load_manifest(path_name):
+    """Load the manifest of a checkpointed sweep, or an empty manifest if not yet started."""
+
+    file_name = pjoin(path_name, 'manifest.json')
+    if not os.path.exists(file_name):
+        return {'order' : [], 'conds' : {}, 'units' : {}}
+
+    with open(file_name, 'r') as f_obj:
+        return json.load(f_obj)
+
+
+def save_manifest(path_name, manifest):
+    """Save the manifest of a checkpointed sweep, replacing any previous version atomically."""
+
+    os.makedirs(path_name, exist_ok=True)
+    with open(pjoin(path_name, 'manifest.tmp.json'), 'w') as f_obj:
+        json.dump(manifest, f_obj, sort_keys=True, default=_encode_spec)
+    os.replace(pjoin(path_name, 'manifest.tmp.json'), pjoin(path_name, 'manifest.json'))
+
+
+#### CACHING ####
+
+def get_sim_settings():
+    """Get the current settings that define the simulation parameter distributions."""
+
+    return {name : getattr(settings, name) for name in SIM_SETTINGS}
+
+
+def hash_spec(spec):
+    """Compute a content hash of a specification.
+
+    Parameters
+    ----------
+    spec : dict
+        Specification, which can include arrays, namedtuples (such as FOOOFSettings),
+        and functions or partial functions, which are identified by name & arguments.
+
+    Returns
+    -------
+    str
+        Hash of the specification.
+    """
+
+    text = json.dumps(spec, sort_keys=True, default=_encode_spec)
+
+    return hashlib.sha256(text.encode()).hexdigest()[:24]
+
+
+def _encode_spec(obj):
+    """Encode objects that are not JSON serializable, for hashing."""
+
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, partial):
+        return {'func' : obj.func, 'args' : obj.args, 'keywords' : obj.keywords}
+    if callable(obj):
+        return obj.__module__ + '.' + obj.__qualname__
+
+    raise TypeError('Object of type {} can not be hashed.'.format(type(obj).__name__))
+
+
+@profiled()
+def load_cached(spec, compute_func, cache_path=CACHE_PATH, max_size=CACHE_MAX_SIZE):
+    """Load data from the cache for a specification, or compute & cache it if not available.
+
+    Parameters
+    ----------
+    spec : dict
+        Specification which fully defines the data, used as the cache key.
+    compute_func : callable
+        Function to compute the data, if not cached. Should return a dictionary of arrays.
+    cache_path : str, optional
+        Folder to store cached data in.
+    max_size : int, optional
+        Maximum total size of the cache, in bytes, beyond which least recently used data is evicted.
+
+    Returns
+    -------
+    data : dict of array
+        Loaded or computed data.
+
+    Notes
+    -----
+    Functions in a specification are identified by name, so changes to the code of a function
+    do not invalidate cached data. Use `clear_cache` after changing simulation code.
+    """
+
+    key = hash_spec(spec)
+    file_name = pjoin(cache_path, key + '.npz')
+
+    if os.path.exists(file_name):
+
+        # Update the modification time, which tracks when data was last used
+        os.utime(file_name)
+        count_bytes('bytes_read', file_name)
+        with np.load(file_name) as data:
+            return dict(data)
+
+    data = compute_func()
+
+    os.makedirs(cache_path, exist_ok=True)
+    _save_replace(file_name, lambda f_obj: np.savez(f_obj, **data))
+    count_bytes('bytes_written', file_name)
+    _save_replace(pjoin(cache_path, key + '.json'), lambda f_obj: f_obj.write(
+        json.dumps(spec, sort_keys=True, default=_encode_spec).encode()))
+
+    evict_cache(max_size, cache_path, keep=[key])
+
+    return data
+
+
+def _save_replace(file_name, save_func):
+    """Save a file via a uniquely named temporary file, which then replaces the file.
+
+    Interrupted saves do not corrupt the file, and concurrent saves of the same
+    file each write to their own temporary file, with one of them replacing the file.
+    """
+
+    base, ext = os.path.splitext(file_name)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(file_name) or '.',
+                                     prefix=os.path.basename(base) + '.',
+                                     suffix='.tmp' + ext, delete=False) as f_obj:
+        try:
+            save_func(f_obj)
+        except BaseException:
+            f_obj.close()
+            os.remove(f_obj.name)
+            raise
+
+    os.replace(f_obj.name, file_name)
+
+
+def evict_cache(max_size=CACHE_MAX_SIZE, cache_path=CACHE_PATH, keep=()):
+    """Remove least recently used data from the cache, until it is within a maximum size.
+
+    Parameters
+    ----------
+    max_size : int, optional
+        Maximum total size of the cache, in bytes.
+    cache_path : str, optional
+        Folder with cached data.
+    keep : list of str, optional
+        Keys of cached data to not remove.
+
+    Returns
+    -------
+    removed : list of str
+        Keys of the removed data.
+    """
+
+    files = sorted(glob(pjoin(cache_path, '*.npz')), key=os.path.getmtime)
+    files = [f_name for f_name in files if not f_name.endswith('.tmp.npz')]
+    total = sum(os.path.getsize(f_name) for f_name in files)
+
+    removed = []
+    for f_name in files:
+
+        if total <= max_size:
+            break
+
+        key = os.path.basename(f_name)[:-len('.npz')]
+        if key in keep:
+            continue
+
+        total -= os.path.getsize(f_name)
+        os.remove(f_name)
+        if os.path.exists(pjoin(cache_path, key + '.json')):
+            os.remove(pjoin(cache_path, key + '.json'))
+        removed.append(key)
+
+    return removed
+
+
+def clear_cache(cache_path=CACHE_PATH):
+    """Remove all data from the cache."""
+
+    return evict_cache(0, cache_path)